@@ -9,13 +9,21 @@ import zipfile
 import hashlib
 import shutil
 from datetime import datetime, timezone
-from typing import Dict, List, Tuple, Any
+from typing import Dict, List, Tuple, Any, Optional
+import numpy as np
 import pandas as pd
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, letter
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import cm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
+from report_totals import ReportTotals, aggregate_report_totals
+from reconciliation import LedgerReconciliation
+
+def format_time_ms(time_ms) -> np.ndarray:
+    """Render epoch-ms timestamps as 'YYYY-MM-DD HH:MM:SS UTC' strings for CSV and PDF output"""
+    seconds = np.asarray(time_ms, dtype='int64').astype('datetime64[ms]').astype('datetime64[s]')
+    return np.char.add(np.char.replace(np.datetime_as_string(seconds), 'T', ' '), ' UTC')
 
 class AustrianTaxCalculator:
     """Austrian tax calculator with 2025 tax brackets"""
@@ -80,17 +88,53 @@ class AustrianTaxReportGenerator:
         self.tax_calc = AustrianTaxCalculator()
         self.report_data = {}
         
+    @staticmethod
+    def _rate_source(df: pd.DataFrame) -> np.ndarray:
+        """ECB_DAILY where an ECB rate was applied, FALLBACK otherwise"""
+        if 'usd_eur_rate' not in df.columns:
+            return np.full(len(df), 'FALLBACK')
+        return np.where(df['usd_eur_rate'].notna(), 'ECB_DAILY', 'FALLBACK')
+    
+    @staticmethod
+    def _with_display_time(df: pd.DataFrame, column: str) -> pd.DataFrame:
+        """Copy of df with time_ms rendered as a readable first column"""
+        df = df.copy()
+        df.insert(0, column, format_time_ms(df['time_ms']), allow_duplicates=True)
+        return df
+    
+    def _funding_csv(self, funding_df: pd.DataFrame) -> pd.DataFrame:
+        """Funding CSV rows; bucketed funding also reports the number of payments per row"""
+        funding_csv = self._with_display_time(funding_df, 'date')
+        funding_csv = funding_csv.rename(columns={
+            'funding_payment': 'funding_usd',
+            'funding_payment_eur': 'funding_eur'
+        })
+        
+        # Format funding rate as percentage (rendered here, not stored per row upstream)
+        funding_csv['funding_rate_formatted'] = np.char.add(
+            np.char.mod('%.4f', (funding_csv['funding_rate'].to_numpy() * 100).round(4)), '%'
+        )
+        
+        funding_csv['funding_type'] = np.where(funding_csv['funding_usd'] < 0, 'FUNDING_PAID', 'FUNDING_RECEIVED')
+        funding_csv['ecb_rate_source'] = self._rate_source(funding_csv)
+        
+        columns = ['date', 'coin', 'funding_type', 'funding_rate_formatted',
+                   'funding_usd', 'funding_eur', 'usd_eur_rate', 'ecb_rate_source']
+        if 'payments' in funding_csv.columns:
+            columns.append('payments')
+        return funding_csv[columns]
+    
     def prepare_csv_data(self, trades_df: pd.DataFrame, funding_df: pd.DataFrame, 
-                        transfers_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+                        transfers_df: pd.DataFrame,
+                        funding_detail_df: Optional[pd.DataFrame] = None) -> Dict[str, pd.DataFrame]:
         """Prepare structured CSV data according to Austrian requirements"""
         
         csv_data = {}
         
         # 1. Trades CSV - Realized P&L and fees
         if not trades_df.empty:
-            trades_csv = trades_df.copy()
+            trades_csv = self._with_display_time(trades_df, 'closing_date')
             trades_csv = trades_csv.rename(columns={
-                'timestamp': 'closing_date',
                 'closed_pnl': 'realized_pnl_usd',
                 'closed_pnl_eur': 'realized_pnl_eur',
                 'fee': 'fee_usd',
@@ -98,9 +142,7 @@ class AustrianTaxReportGenerator:
             })
             
             # Add fallback indicator
-            trades_csv['ecb_rate_source'] = trades_csv.apply(
-                lambda row: 'ECB_DAILY' if pd.notna(row.get('usd_eur_rate')) else 'FALLBACK', axis=1
-            )
+            trades_csv['ecb_rate_source'] = self._rate_source(trades_csv)
             
             csv_data['trades'] = trades_csv[['closing_date', 'coin', 'side', 'size', 'price', 
                                            'realized_pnl_usd', 'realized_pnl_eur', 
@@ -108,57 +150,34 @@ class AustrianTaxReportGenerator:
         
         # 2. Fees CSV - All trading fees
         if not trades_df.empty:
-            fees_csv = trades_df[trades_df['fee'] != 0].copy()
+            fees_csv = self._with_display_time(trades_df[trades_df['fee'] != 0], 'date')
             fees_csv = fees_csv.rename(columns={
-                'timestamp': 'date',
                 'fee': 'fee_usd',
                 'fee_eur': 'fee_eur'
             })
             fees_csv['fee_type'] = 'TRADING_FEE'
-            fees_csv['ecb_rate_source'] = fees_csv.apply(
-                lambda row: 'ECB_DAILY' if pd.notna(row.get('usd_eur_rate')) else 'FALLBACK', axis=1
-            )
+            fees_csv['ecb_rate_source'] = self._rate_source(fees_csv)
             
             csv_data['fees'] = fees_csv[['date', 'coin', 'fee_type', 'fee_usd', 'fee_eur', 
                                        'usd_eur_rate', 'ecb_rate_source']]
         
-        # 3. Funding CSV
+        # 3. Funding CSV (day buckets if funding was aggregated at ingest)
         if not funding_df.empty:
-            funding_csv = funding_df.copy()
-            funding_csv = funding_csv.rename(columns={
-                'timestamp': 'date',
-                'funding_payment': 'funding_usd',
-                'funding_payment_eur': 'funding_eur'
-            })
-            
-            # Format funding rate as percentage
-            funding_csv['funding_rate_percent'] = (funding_csv['funding_rate'] * 100).round(4)
-            funding_csv['funding_rate_formatted'] = funding_csv['funding_rate_percent'].apply(lambda x: f"{x:.4f}%")
-            
-            funding_csv['funding_type'] = funding_csv['funding_usd'].apply(
-                lambda x: 'FUNDING_PAID' if x < 0 else 'FUNDING_RECEIVED'
-            )
-            funding_csv['ecb_rate_source'] = funding_csv.apply(
-                lambda row: 'ECB_DAILY' if pd.notna(row.get('usd_eur_rate')) else 'FALLBACK', axis=1
-            )
-            
-            csv_data['funding'] = funding_csv[['date', 'coin', 'funding_type', 'funding_rate_formatted',
-                                             'funding_usd', 'funding_eur', 'usd_eur_rate', 'ecb_rate_source']]
+            csv_data['funding'] = self._funding_csv(funding_df)
+        
+        # 3b. Individual funding payments behind the buckets (optional detail export)
+        if funding_detail_df is not None and not funding_detail_df.empty:
+            csv_data['funding_detail'] = self._funding_csv(funding_detail_df)
         
         # 4. Deposits/Withdrawals CSV
         if not transfers_df.empty:
-            transfers_csv = transfers_df.copy()
+            transfers_csv = self._with_display_time(transfers_df, 'date')
             transfers_csv = transfers_csv.rename(columns={
-                'timestamp': 'date',
                 'amount': 'amount_usd',
                 'amount_eur': 'amount_eur'
             })
-            transfers_csv['transfer_type'] = transfers_csv['amount_usd'].apply(
-                lambda x: 'DEPOSIT' if x > 0 else 'WITHDRAWAL'
-            )
-            transfers_csv['ecb_rate_source'] = transfers_csv.apply(
-                lambda row: 'ECB_DAILY' if pd.notna(row.get('usd_eur_rate')) else 'FALLBACK', axis=1
-            )
+            transfers_csv['transfer_type'] = np.where(transfers_csv['amount_usd'] > 0, 'DEPOSIT', 'WITHDRAWAL')
+            transfers_csv['ecb_rate_source'] = self._rate_source(transfers_csv)
             
             csv_data['deposits_withdrawals'] = transfers_csv[['date', 'type', 'transfer_type', 
                                                            'amount_usd', 'amount_eur', 
@@ -168,13 +187,14 @@ class AustrianTaxReportGenerator:
     
     def calculate_austrian_tax_summary(self, trades_df: pd.DataFrame, funding_df: pd.DataFrame) -> Dict:
         """Calculate Austrian tax summary including user's other income"""
-        
-        # Calculate totals in EUR
-        total_realized_pnl_eur = trades_df['closed_pnl_eur'].sum() if not trades_df.empty and 'closed_pnl_eur' in trades_df.columns else 0
-        total_fees_eur = abs(trades_df['fee_eur'].sum()) if not trades_df.empty and 'fee_eur' in trades_df.columns else 0
-        
-        funding_paid_eur = abs(funding_df[funding_df['funding_payment_eur'] < 0]['funding_payment_eur'].sum()) if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
-        funding_received_eur = funding_df[funding_df['funding_payment_eur'] > 0]['funding_payment_eur'].sum() if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
+        return self.tax_summary_from_totals(aggregate_report_totals(trades_df, funding_df))
+    
+    def tax_summary_from_totals(self, totals: ReportTotals) -> Dict:
+        """Austrian tax summary from the shared report totals"""
+        total_realized_pnl_eur = totals.closed_pnl_eur
+        total_fees_eur = abs(totals.fee_eur)
+        funding_paid_eur = totals.funding_paid_eur
+        funding_received_eur = totals.funding_received_eur
         
         # Calculate raw trading result (can be negative)
         raw_trading_result_eur = total_realized_pnl_eur + funding_received_eur - total_fees_eur - funding_paid_eur
@@ -205,9 +225,8 @@ class AustrianTaxReportGenerator:
             'tax_breakdown': tax_breakdown
         }
     
-    def create_summary_csv(self, tax_summary: Dict, trades_df: pd.DataFrame, 
-                          funding_df: pd.DataFrame, transfers_df: pd.DataFrame) -> pd.DataFrame:
-        """Create summary CSV with KPIs"""
+    def summary_csv_from_totals(self, tax_summary: Dict, totals: ReportTotals) -> pd.DataFrame:
+        """Summary CSV with KPIs from the shared report totals"""
         
         summary_data = {
             'metric': [
@@ -234,13 +253,13 @@ class AustrianTaxReportGenerator:
                 f"{tax_summary['raw_trading_result_eur']:.4f}",
                 f"{tax_summary['taxable_trading_profit_eur']:.4f}",
                 f"{tax_summary['total_taxable_income_eur']:.4f}",
-                len(trades_df) if not trades_df.empty else 0,
+                totals.trade_count,
                 f"{tax_summary['total_realized_pnl_eur']:.4f}",
                 f"{tax_summary['total_fees_eur']:.4f}",
                 f"{tax_summary['funding_paid_eur']:.4f}",
                 f"{tax_summary['funding_received_eur']:.4f}",
-                f"{transfers_df[transfers_df['amount_eur'] > 0]['amount_eur'].sum():.4f}" if not transfers_df.empty and 'amount_eur' in transfers_df.columns else "0.0000",
-                f"{abs(transfers_df[transfers_df['amount_eur'] < 0]['amount_eur'].sum()):.4f}" if not transfers_df.empty and 'amount_eur' in transfers_df.columns else "0.0000",
+                f"{totals.inflows_eur:.4f}",
+                f"{totals.outflows_eur:.4f}",
                 f"{tax_summary['tax_lohn_only']:.4f}",
                 f"{tax_summary['trading_tax']:.4f}",
                 f"{tax_summary['tax_with_trading']:.4f}",
@@ -250,23 +269,17 @@ class AustrianTaxReportGenerator:
         
         return pd.DataFrame(summary_data)
     
-    def perform_plausibility_check(self, trades_df: pd.DataFrame, funding_df: pd.DataFrame, 
-                                  account_state: Dict) -> Dict:
-        """Perform plausibility checks on the data"""
+    def plausibility_from_totals(self, totals: ReportTotals) -> Dict:
+        """Plausibility checks from the shared report totals"""
+        if not totals.trade_count or not totals.funding_count:
+            return {}
         
+        # Calculate expected equity change
         checks = {}
+        expected_change = totals.closed_pnl_usd + totals.funding_usd - abs(totals.fee_usd)
         
-        if not trades_df.empty and not funding_df.empty:
-            # Calculate expected equity change
-            realized_pnl = trades_df['closed_pnl'].sum() if 'closed_pnl' in trades_df.columns else 0
-            funding_total = funding_df['funding_payment'].sum() if 'funding_payment' in funding_df.columns else 0
-            fees_total = trades_df['fee'].sum() if 'fee' in trades_df.columns else 0
-            
-            expected_change = realized_pnl + funding_total - abs(fees_total)
-            
-            checks['calculated_pnl_change'] = expected_change
-            checks['plausibility_note'] = f"Expected equity Δ: ${expected_change:.2f}"
-            
+        checks['calculated_pnl_change'] = expected_change
+        checks['plausibility_note'] = f"Expected equity Δ: ${expected_change:.2f}"
         return checks
     
     def generate_tax_form_guidance_pdf(self, tax_summary, filename):
@@ -492,7 +505,7 @@ class AustrianTaxReportGenerator:
         story.append(Spacer(1, 20))
         
         # Account Overview
-        if account_state:
+        if account_state and 'account_value' in account_state:
             story.append(Paragraph("5. Account-Übersicht", heading_style))
             account_data = [
                 ['Account Value', f"$ {account_state.get('account_value', 0):,.2f}"],
@@ -510,6 +523,31 @@ class AustrianTaxReportGenerator:
             story.append(account_table)
             story.append(Spacer(1, 20))
         
+        # Open positions at year end, marked at the last close of the year
+        year_end_positions = (account_state or {}).get('year_end_positions', [])
+        if year_end_positions:
+            story.append(Paragraph(f"Offene Positionen am 31.12.{self.tax_year} (Info, nicht steuerpflichtig)", heading_style))
+            positions_data = [['Coin', 'Größe', 'Schlusskurs USD', 'Wert USD', 'Wert EUR']]
+            for position in year_end_positions:
+                if pd.isna(position['mark_price']):
+                    positions_data.append([position['coin'], f"{position['size']:,.4f}", "kein Kurs", "-", "-"])
+                    continue
+                positions_data.append([
+                    position['coin'],
+                    f"{position['size']:,.4f}",
+                    f"$ {position['mark_price']:,.4f}",
+                    f"$ {position['notional_usd']:,.2f}",
+                    f"€ {position['notional_eur']:,.2f}"
+                ])
+            positions_table = Table(positions_data)
+            positions_table.setStyle(TableStyle([
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('GRID', (0, 0), (-1, -1), 1, colors.black)
+            ]))
+            story.append(positions_table)
+            story.append(Spacer(1, 20))
+        
         # Data Samples (10-20 rows from each CSV)
         for csv_name, df in csv_data.items():
             if not df.empty:
@@ -541,6 +579,7 @@ class AustrianTaxReportGenerator:
             story.append(Paragraph("7. Plausibilitätsprüfung", heading_style))
             plausibility_text = f"""
             {plausibility.get('plausibility_note', 'Keine Anmerkungen')}
+            {plausibility.get('reconciliation_note', '')}
             
             Hinweis: Vollständige CSV-Dateien sind im beigefügten ZIP-Archiv enthalten.
             """
@@ -550,31 +589,66 @@ class AustrianTaxReportGenerator:
         doc.build(story)
         print(f"📄 PDF Report erstellt: {output_file}")
     
+    # csv_data key -> (package folder, file name, console label)
+    CSV_FILES = {
+        'summary': ('summary', 'summary.csv', 'Summary'),
+        'trades': ('trades', 'trades.csv', 'Trades'),
+        'fees': ('trades', 'fees.csv', 'Fees'),
+        'funding': ('funding', 'funding.csv', 'Funding'),
+        'funding_detail': ('funding', 'funding_detail.csv', 'Funding Detail'),
+        'deposits_withdrawals': ('transfers', 'deposits_withdrawals.csv', 'Transfers'),
+    }
+    
     def generate_report_package(self, trades_df: pd.DataFrame, funding_df: pd.DataFrame,
                                transfers_df: pd.DataFrame, account_state: Dict, 
-                               base_filename: str) -> str:
-        """Generate complete Austrian tax report package with organized folders"""
+                               base_filename: str, output_dir: str = ".",
+                               totals: Optional[ReportTotals] = None,
+                               funding_detail_df: Optional[pd.DataFrame] = None,
+                               reconciliation: Optional[LedgerReconciliation] = None) -> str:
+        """
+        Generate complete Austrian tax report package with organized folders
+        Working folders and the ZIP are created inside output_dir; pass totals if
+        the frames have already been aggregated and reconciliation to add the
+        ledger reconciliation to the plausibility checks
+        """
         
         print(f"🇦🇹 Generiere österreichischen Steuerreport {self.tax_year}...")
         
         # Prepare CSV data
-        csv_data = self.prepare_csv_data(trades_df, funding_df, transfers_df)
-        
-        # Calculate tax summary
-        tax_summary = self.calculate_austrian_tax_summary(trades_df, funding_df)
+        csv_data = self.prepare_csv_data(trades_df, funding_df, transfers_df, funding_detail_df)
         
-        # Create summary CSV
-        summary_csv = self.create_summary_csv(tax_summary, trades_df, funding_df, transfers_df)
-        csv_data['summary'] = summary_csv
+        # Tax summary, summary CSV and plausibility checks share one aggregation pass
+        if totals is None:
+            totals = aggregate_report_totals(trades_df, funding_df, transfers_df)
+        tax_summary = self.tax_summary_from_totals(totals)
+        csv_data['summary'] = self.summary_csv_from_totals(tax_summary, totals)
+        plausibility = self.plausibility_from_totals(totals)
+        if reconciliation is not None:
+            plausibility.update(reconciliation.checks())
         
-        # Perform plausibility checks
-        plausibility = self.perform_plausibility_check(trades_df, funding_df, account_state)
+        main_folder, folders, vienna_time = self.create_package_folders(output_dir)
         
+        # Save CSV files in their respective folders
+        csv_files = []
+        for name in self.CSV_FILES:
+            if name in csv_data:
+                csv_file = self.csv_path(folders, name)
+                csv_data[name].to_csv(csv_file, index=False, encoding='utf-8')
+                csv_files.append(csv_file)
+                print(f"💾 {self.CSV_FILES[name][2]} CSV: {csv_file}")
+        
+        # The funding detail export is not excerpted in the PDF
+        csv_data.pop('funding_detail', None)
+        return self.finalize_package(main_folder, folders, vienna_time, csv_data, csv_files,
+                                     tax_summary, plausibility, account_state)
+    
+    def create_package_folders(self, output_dir: str = ".") -> Tuple[str, Dict[str, str], str]:
+        """Create the package folder structure; returns (main folder, sub folders, timestamp)"""
         # Generate timestamp
         vienna_time = datetime.now().strftime("%Y%m%d_%H%M")
         
         # Create main folder structure
-        main_folder = f"HL_AT_{self.tax_year}_{self.wallet_address[:8]}_{vienna_time}"
+        main_folder = os.path.join(output_dir, f"HL_AT_{self.tax_year}_{self.wallet_address[:8]}_{vienna_time}")
         
         # Create folders
         folders = {
@@ -589,47 +663,24 @@ class AustrianTaxReportGenerator:
         for folder_path in folders.values():
             os.makedirs(folder_path, exist_ok=True)
         
+        return main_folder, folders, vienna_time
+    
+    def csv_path(self, folders: Dict[str, str], name: str) -> str:
+        """Path of a csv_data entry inside the package folders"""
+        folder, file_name, _ = self.CSV_FILES[name]
+        return os.path.join(folders[folder], file_name)
+    
+    def finalize_package(self, main_folder: str, folders: Dict[str, str], vienna_time: str,
+                         csv_data: Dict[str, pd.DataFrame], csv_files: List[str], tax_summary: Dict,
+                         plausibility: Dict, account_state: Dict) -> str:
+        """
+        Render the PDFs next to the already written CSV files, then ZIP the package
+        csv_data only feeds the PDF excerpts, so it may hold just the first rows of each CSV
+        """
         # File names
         pdf_filename = os.path.join(folders['pdf'], f"HL_tax_report_AT_{self.wallet_address[:8]}_{self.tax_year}_{vienna_time}_EuropeVienna.pdf")
         zip_filename = f"{main_folder}.zip"
         
-        # Save CSV files in their respective folders
-        csv_files = []
-        
-        # Summary folder
-        if 'summary' in csv_data:
-            summary_file = os.path.join(folders['summary'], "summary.csv")
-            csv_data['summary'].to_csv(summary_file, index=False, encoding='utf-8')
-            csv_files.append(summary_file)
-            print(f"💾 Summary CSV: {summary_file}")
-        
-        # Trades folder  
-        if 'trades' in csv_data:
-            trades_file = os.path.join(folders['trades'], "trades.csv")
-            csv_data['trades'].to_csv(trades_file, index=False, encoding='utf-8')
-            csv_files.append(trades_file)
-            print(f"💾 Trades CSV: {trades_file}")
-        
-        if 'fees' in csv_data:
-            fees_file = os.path.join(folders['trades'], "fees.csv")
-            csv_data['fees'].to_csv(fees_file, index=False, encoding='utf-8')
-            csv_files.append(fees_file)
-            print(f"💾 Fees CSV: {fees_file}")
-        
-        # Funding folder
-        if 'funding' in csv_data:
-            funding_file = os.path.join(folders['funding'], "funding.csv")
-            csv_data['funding'].to_csv(funding_file, index=False, encoding='utf-8')
-            csv_files.append(funding_file)
-            print(f"💾 Funding CSV: {funding_file}")
-        
-        # Transfers folder
-        if 'deposits_withdrawals' in csv_data:
-            transfers_file = os.path.join(folders['transfers'], "deposits_withdrawals.csv")
-            csv_data['deposits_withdrawals'].to_csv(transfers_file, index=False, encoding='utf-8')
-            csv_files.append(transfers_file)
-            print(f"💾 Transfers CSV: {transfers_file}")
-        
         # Generate PDF in PDF folder
         self.generate_pdf_report(csv_data, tax_summary, plausibility, account_state, pdf_filename)
         
@@ -649,8 +700,12 @@ class AustrianTaxReportGenerator:
             # Create checksums
             checksums = {}
             for csv_file in csv_files + [pdf_filename]:
+                # Hash in chunks so large streamed CSVs aren't read into memory at once
+                md5 = hashlib.md5()
                 with open(csv_file, 'rb') as f:
-                    checksums[os.path.relpath(csv_file, os.path.dirname(main_folder))] = hashlib.md5(f.read()).hexdigest()
+                    for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                        md5.update(chunk)
+                checksums[os.path.relpath(csv_file, os.path.dirname(main_folder))] = md5.hexdigest()
             
             # Add checksums file to main folder
             checksums_file = os.path.join(main_folder, 'checksums.txt')
@@ -665,7 +720,6 @@ class AustrianTaxReportGenerator:
         print(f"🇦🇹 Österreichischer Steuerreport komplett!")
         
         # Clean up folder structure (keep only ZIP)
-        import shutil
         try:
             shutil.rmtree(main_folder)
         except:
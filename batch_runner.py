@@ -0,0 +1,158 @@
+"""
+Batch Runner for Hyperliquid Tax Calculator
+Processes a roster of wallets in one run with a shared ECB rate table and HTTP connection pool
+"""
+
+import argparse
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Optional
+
+import pandas as pd
+
+from currency_converter import CurrencyConverter, ECBRatesFetcher
+from event_store import EventStore
+from http_archive import HttpArchive
+from hyperliquid_fetcher import HyperliquidFetcher, load_yearly_income, run_wallet_report
+from manual_input_handler import ManualInputHandler
+from price_history import CandleCache, PriceHistory
+from streaming_pipeline import run_wallet_report_streaming
+
+class BatchRunner:
+    """Runs the full tax report pipeline for many wallets on a worker pool"""
+
+    def __init__(self, output_dir: str = "batch_reports", workers: int = 4,
+                 fetch_workers: int = 4, event_store_path: str = "hyperliquid_events.db",
+                 archive: Optional[HttpArchive] = None, streaming: bool = False):
+        self.output_dir = output_dir
+        self.streaming = streaming
+        self.workers = max(1, workers)
+        self.fetch_workers = max(1, fetch_workers)
+        self.archive = archive
+
+        # Shared between all wallets: one ECB rate table, one connection pool, one event store
+        # and one candle cache.
+        # API weight is shared automatically through the process-wide rate limiter.
+        self.rates_fetcher = ECBRatesFetcher(archive=archive)
+        self.session = HyperliquidFetcher.create_session(self.workers * self.fetch_workers * 3)
+        # Archived runs crawl full history so requests don't depend on local sync state
+        self.event_store = None if archive else EventStore(event_store_path)
+        self.candle_cache = None if archive else CandleCache()
+
+    @staticmethod
+    def read_roster(roster_csv: str) -> List[Dict[str, Any]]:
+        """
+        Read the wallet roster CSV
+        Columns: wallet, tax_year, manual_input_folder (optional), enabled (optional)
+        Without a manual_input_folder each wallet gets its own manual_input/<wallet> folder,
+        so manual data never leaks between clients
+        """
+        df = pd.read_csv(roster_csv, encoding='utf-8', dtype={'wallet': str})
+
+        if 'wallet' not in df.columns or 'tax_year' not in df.columns:
+            raise ValueError(f"{roster_csv} benötigt die Spalten 'wallet' und 'tax_year'")
+
+        if 'enabled' in df.columns:
+            df = df[df['enabled'] == 1]
+
+        entries = []
+        for _, row in df.iterrows():
+            wallet = str(row['wallet']).strip()
+            folder = row.get('manual_input_folder')
+            entries.append({
+                'wallet': wallet,
+                'tax_year': int(row['tax_year']),
+                'manual_input_folder': (str(folder).strip() if pd.notna(folder) and str(folder).strip()
+                                        else os.path.join("manual_input", wallet.lower()))
+            })
+        return entries
+
+    def _wallet_output_dir(self, entry: Dict[str, Any]) -> str:
+        """Isolated output folder per wallet and tax year"""
+        path = os.path.join(self.output_dir, f"{entry['wallet'].lower()}_{entry['tax_year']}")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def run_wallet(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the pipeline for one roster entry; errors are captured, not raised"""
+        started = datetime.now()
+        result = {
+            'wallet': entry['wallet'],
+            'tax_year': entry['tax_year'],
+            'status': 'ok',
+            'zip_file': '',
+            'failed_windows': 0,
+            'error': ''
+        }
+
+        try:
+            fetcher = HyperliquidFetcher(entry['wallet'], max_workers=self.fetch_workers,
+                                         event_store=self.event_store, session=self.session,
+                                         archive=self.archive)
+            converter = CurrencyConverter(rates_fetcher=self.rates_fetcher)
+            manual_handler = ManualInputHandler(entry['manual_input_folder'], rates_fetcher=self.rates_fetcher)
+            yearly_income = load_yearly_income(manual_handler, entry['tax_year'])
+
+            report_fn = run_wallet_report_streaming if self.streaming else run_wallet_report
+            result['zip_file'] = report_fn(entry['wallet'], entry['tax_year'], yearly_income,
+                                           fetcher, converter, manual_handler,
+                                           output_dir=self._wallet_output_dir(entry),
+                                           price_history=PriceHistory(fetcher, self.candle_cache))
+            result['failed_windows'] = len(fetcher.get_failed_windows())
+            if result['failed_windows']:
+                result['status'] = 'incomplete'
+        except Exception as e:
+            result['status'] = 'error'
+            result['error'] = str(e)
+            traceback.print_exc()
+
+        result['duration_seconds'] = round((datetime.now() - started).total_seconds(), 1)
+        return result
+
+    def run(self, entries: List[Dict[str, Any]]) -> pd.DataFrame:
+        """Process all roster entries and write batch_summary.csv to the output folder"""
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        print("═" * 80)
+        print(f"🚀 BATCH-LAUF: {len(entries)} Wallet(s) mit {self.workers} Worker(n)")
+        print("═" * 80)
+
+        # Load the ECB cache once up front so workers don't all read the file
+        self.rates_fetcher.ensure_rates_available([])
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(self.run_wallet, entries))
+
+        summary_df = pd.DataFrame(results)
+        summary_file = os.path.join(self.output_dir, "batch_summary.csv")
+        summary_df.to_csv(summary_file, index=False, encoding='utf-8')
+
+        print("\n" + "═" * 80)
+        print("📋 BATCH-ERGEBNIS")
+        print("═" * 80)
+        for result in results:
+            status_icon = {'ok': '✅', 'incomplete': '⚠️ ', 'error': '❌'}[result['status']]
+            print(f"{status_icon} {result['wallet']} ({result['tax_year']}): "
+                  f"{result['zip_file'] or result['error']} [{result['duration_seconds']}s]")
+        print(f"💾 Zusammenfassung: {summary_file}")
+
+        return summary_df
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperliquid Steuerreports für mehrere Wallets erzeugen")
+    parser.add_argument("roster", help="CSV mit Spalten wallet, tax_year[, manual_input_folder, enabled]")
+    parser.add_argument("--output-dir", default="batch_reports", help="Zielordner für alle Reports")
+    parser.add_argument("--workers", type=int, default=4, help="Anzahl parallel verarbeiteter Wallets")
+    parser.add_argument("--fetch-workers", type=int, default=4, help="Parallele API-Anfragen pro Wallet")
+    parser.add_argument("--streaming", action="store_true",
+                        help="Historie in Batches verarbeiten (konstanter Speicherbedarf)")
+    args = parser.parse_args()
+
+    runner = BatchRunner(output_dir=args.output_dir, workers=args.workers, fetch_workers=args.fetch_workers,
+                         archive=HttpArchive.from_env(), streaming=args.streaming)
+    runner.run(runner.read_roster(args.roster))
+
+if __name__ == "__main__":
+    main()
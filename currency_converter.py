@@ -4,36 +4,50 @@ Fetches ECB exchange rates and converts USD amounts to EUR
 """
 
 import requests
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 import json
 import io
+import os
+import threading
 from typing import Dict, Optional
+from http_archive import ArchiveMiss, HttpArchive
+from money import convert_micros, exact_money_enabled, micros_column, to_micros, MICROS
+from report_totals import ReportTotals, aggregate_report_totals
 
 class ECBRatesFetcher:
     """Fetches EUR/USD exchange rates from European Central Bank Statistical Data API"""
     
-    def __init__(self):
+    def __init__(self, archive: Optional[HttpArchive] = None):
         self.base_url = "https://data-api.ecb.europa.eu/service/data/EXR/D.USD.EUR.SP00.A"
         self.session = requests.Session()
+        self.archive = archive
         self.rates_cache = {}
         self.rates_file = "ecb_rates_cache.json"
+        # One instance can be shared by several converters/handlers (e.g. batch runs)
+        self._lock = threading.RLock()
+        self._cache_loaded = False
         
     def load_cached_rates(self) -> Dict[str, float]:
         """Load previously cached rates from file"""
-        try:
-            with open(self.rates_file, 'r') as f:
-                self.rates_cache = json.load(f)
-                print(f"📊 Loaded {len(self.rates_cache)} cached exchange rates")
-        except FileNotFoundError:
-            print("📊 No cached rates found, will fetch from ECB")
-            self.rates_cache = {}
-        return self.rates_cache
+        with self._lock:
+            try:
+                with open(self.rates_file, 'r') as f:
+                    self.rates_cache.update(json.load(f))
+                    print(f"📊 Loaded {len(self.rates_cache)} cached exchange rates")
+            except FileNotFoundError:
+                print("📊 No cached rates found, will fetch from ECB")
+            self._cache_loaded = True
+            return self.rates_cache
     
     def save_cached_rates(self):
-        """Save rates to cache file"""
-        with open(self.rates_file, 'w') as f:
-            json.dump(self.rates_cache, f, indent=2)
+        """Save rates to cache file (written atomically so concurrent readers never see a partial file)"""
+        with self._lock:
+            tmp_file = f"{self.rates_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(dict(sorted(self.rates_cache.items())), f, indent=2)
+            os.replace(tmp_file, self.rates_file)
         print(f"💾 Saved {len(self.rates_cache)} exchange rates to cache")
     
     def fetch_ecb_rates(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Dict[str, float]:
@@ -49,11 +63,21 @@ class ECBRatesFetcher:
                 params["endPeriod"] = end_date
                 print(f"📅 Requesting rates from {start_date} to {end_date}")
             
-            response = self.session.get(self.base_url, params=params, timeout=30)
-            response.raise_for_status()
+            archive_key = self.archive.request_key('GET', self.base_url, params=params) if self.archive else None
+            if self.archive and self.archive.replaying:
+                response_text = self.archive.load(archive_key)
+                if response_text is None:
+                    # A replay must not silently fall back to other rates
+                    raise ArchiveMiss(f"ECB rates {start_date} to {end_date} not in HTTP archive")
+            else:
+                response = self.session.get(self.base_url, params=params, timeout=30)
+                response.raise_for_status()
+                response_text = response.text
+                if archive_key:
+                    self.archive.save(archive_key, 'GET', self.base_url, response_text, params=params)
             
             # Parse CSV response using pandas
-            df = pd.read_csv(io.StringIO(response.text))
+            df = pd.read_csv(io.StringIO(response_text))
             
             rates = {}
             
@@ -67,10 +91,14 @@ class ECBRatesFetcher:
                     rates[date_str] = eur_per_usd
             
             print(f"✅ Fetched {len(rates)} EUR/USD exchange rates from ECB Statistical Data API")
-            self.rates_cache.update(rates)
-            self.save_cached_rates()
+            with self._lock:
+                self.rates_cache.update(rates)
+                if not self.archive:
+                    self.save_cached_rates()
             return rates
             
+        except ArchiveMiss:
+            raise
         except Exception as e:
             print(f"❌ Failed to fetch ECB rates from Statistical Data API: {e}")
             print("🔄 Falling back to cache or default rates...")
@@ -97,8 +125,14 @@ class ECBRatesFetcher:
     
     def ensure_rates_available(self, dates_needed: list):
         """Ensure we have rates for all required dates"""
-        # Load cached rates first
-        self.load_cached_rates()
+        with self._lock:
+            self._ensure_rates_available(dates_needed)
+    
+    def _ensure_rates_available(self, dates_needed: list):
+        # Load cached rates first; with an HTTP archive every rate comes from the
+        # recording, so a recording holds all ranges a replay will ask for
+        if not self._cache_loaded and not self.archive:
+            self.load_cached_rates()
         
         if not dates_needed:
             return
@@ -123,29 +157,44 @@ class ECBRatesFetcher:
             start_date = (min_date_obj - timedelta(days=10)).strftime('%Y-%m-%d')
             end_date = (max_date_obj + timedelta(days=5)).strftime('%Y-%m-%d')
             
-            # Don't fetch future dates beyond today
-            today = datetime.now().strftime('%Y-%m-%d')
+            # Don't fetch future dates beyond today (the recording day when replaying)
+            now = datetime.fromtimestamp(self.archive.clock_ms / 1000) if self.archive else datetime.now()
+            today = now.strftime('%Y-%m-%d')
             if end_date > today:
                 end_date = today
             
             print(f"📊 Need rates for {len(missing_dates)} dates, fetching range {start_date} to {end_date}...")
             self.fetch_ecb_rates(start_date, end_date)
 
+    def ensure_range_available(self, start_date: str, end_date: str):
+        """Ensure we have rates for every calendar day in [start_date, end_date] (YYYY-MM-DD)"""
+        start = datetime.strptime(start_date, '%Y-%m-%d')
+        end = datetime.strptime(end_date, '%Y-%m-%d')
+        dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+        self.ensure_rates_available(dates)
+
+def utc_dates(time_ms) -> np.ndarray:
+    """UTC calendar dates ('YYYY-MM-DD') of epoch-ms timestamps"""
+    return np.datetime_as_string(np.asarray(time_ms, dtype='int64').astype('datetime64[ms]').astype('datetime64[D]'))
+
 class CurrencyConverter:
-    """Converts USD amounts to EUR using ECB rates"""
+    """
+    Converts USD amounts to EUR using ECB rates
+    With exact=True (default: HL_EXACT_MONEY) every amount column also gets int64
+    micro-unit twins for USD and EUR that the tax totals are summed from
+    """
     
-    def __init__(self):
-        self.rates_fetcher = ECBRatesFetcher()
+    def __init__(self, rates_fetcher: Optional[ECBRatesFetcher] = None, exact: Optional[bool] = None):
+        self.rates_fetcher = rates_fetcher or ECBRatesFetcher()
+        self.exact = exact_money_enabled() if exact is None else exact
     
     def prepare_rates(self, df_list: list):
         """Prepare exchange rates for all dataframes"""
         all_dates = set()
         
         for df in df_list:
-            if not df.empty and 'timestamp' in df.columns:
-                # Extract dates from timestamps (handle both "YYYY-MM-DD HH:MM:SS" and "YYYY-MM-DD HH:MM:SS UTC")
-                dates = pd.to_datetime(df['timestamp'], format='mixed', utc=True).dt.date.astype(str).unique()
-                all_dates.update(dates)
+            if not df.empty and 'time_ms' in df.columns:
+                all_dates.update(np.unique(utc_dates(df['time_ms'])))
         
         # Ensure we have rates for all dates
         if all_dates:
@@ -158,8 +207,10 @@ class CurrencyConverter:
         
         df_copy = df.copy()
         
-        # Add exchange rate column (handle both timestamp formats)
-        df_copy['date'] = pd.to_datetime(df_copy['timestamp'], format='mixed', utc=True).dt.date.astype(str)
+        # Rates are looked up once per distinct day and spread back to the rows
+        days, day_index = np.unique(df_copy['time_ms'].to_numpy(dtype='int64') // 86_400_000, return_inverse=True)
+        dates = utc_dates(days * 86_400_000)
+        df_copy['date'] = dates[day_index]
         
         def get_rate_with_fallback(date_str):
             """Get rate with fallback logic"""
@@ -178,34 +229,46 @@ class CurrencyConverter:
             print(f"⚠️  Using fallback EUR/USD rate 0.90 for {date_str}")
             return 0.90
         
-        df_copy['usd_eur_rate'] = df_copy['date'].apply(get_rate_with_fallback)
+        rates = np.array([get_rate_with_fallback(date_str) for date_str in dates], dtype=float)
+        df_copy['usd_eur_rate'] = rates[day_index]
         
         # Convert USD amounts to EUR
         for col in amount_columns:
             if col in df_copy.columns:
                 eur_col = col + '_eur'  # Always add _eur suffix
                 # Handle None values and ensure numeric conversion
-                df_copy[eur_col] = pd.to_numeric(df_copy[col], errors='coerce') * pd.to_numeric(df_copy['usd_eur_rate'], errors='coerce')
-                df_copy[eur_col] = df_copy[eur_col].round(4)
+                if self.exact:
+                    usd = pd.to_numeric(df_copy[col], errors='coerce').to_numpy(dtype=float)
+                    usd_micros = to_micros(usd)
+                    eur_micros = convert_micros(usd_micros, df_copy['usd_eur_rate'])
+                    df_copy[micros_column(col)] = usd_micros
+                    df_copy[micros_column(eur_col)] = eur_micros
+                    df_copy[eur_col] = np.where(np.isnan(usd), np.nan, eur_micros / MICROS).round(4)
+                else:
+                    df_copy[eur_col] = pd.to_numeric(df_copy[col], errors='coerce') * pd.to_numeric(df_copy['usd_eur_rate'], errors='coerce')
+                    df_copy[eur_col] = df_copy[eur_col].round(4)
         
         return df_copy
 
 def create_enhanced_summary_report(wallet_address: str, trades_df: pd.DataFrame, funding_df: pd.DataFrame, 
-                                 transfers_df: pd.DataFrame, account_state: Dict) -> str:
+                                 transfers_df: pd.DataFrame, account_state: Dict,
+                                 totals: Optional[ReportTotals] = None) -> str:
     """Create a comprehensive summary report with USD and EUR amounts"""
     
-    # Calculate totals in both currencies
-    total_fees_usd = abs(trades_df['fee'].sum()) if not trades_df.empty else 0
-    total_fees_eur = abs(trades_df['fee_eur'].sum()) if not trades_df.empty and 'fee_eur' in trades_df.columns else 0
+    # Totals in both currencies from the shared aggregation pass
+    if totals is None:
+        totals = aggregate_report_totals(trades_df, funding_df, transfers_df)
+    total_fees_usd = abs(totals.fee_usd)
+    total_fees_eur = abs(totals.fee_eur)
     
     # Separate funding paid and received
-    funding_paid_usd = abs(funding_df[funding_df['funding_payment'] < 0]['funding_payment'].sum()) if not funding_df.empty else 0
-    funding_received_usd = abs(funding_df[funding_df['funding_payment'] > 0]['funding_payment'].sum()) if not funding_df.empty else 0
-    funding_paid_eur = abs(funding_df[funding_df['funding_payment_eur'] < 0]['funding_payment_eur'].sum()) if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
-    funding_received_eur = abs(funding_df[funding_df['funding_payment_eur'] > 0]['funding_payment_eur'].sum()) if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
+    funding_paid_usd = totals.funding_paid_usd
+    funding_received_usd = totals.funding_received_usd
+    funding_paid_eur = totals.funding_paid_eur
+    funding_received_eur = totals.funding_received_eur
     
-    total_pnl_usd = trades_df['closed_pnl'].sum() if not trades_df.empty else 0
-    total_pnl_eur = trades_df['closed_pnl_eur'].sum() if not trades_df.empty and 'closed_pnl_eur' in trades_df.columns else 0
+    total_pnl_usd = totals.closed_pnl_usd
+    total_pnl_eur = totals.closed_pnl_eur
     
     report = f"""
 ╔══════════════════════════════════════════════════════════════════════════════════╗
@@ -238,35 +301,28 @@ def create_enhanced_summary_report(wallet_address: str, trades_df: pd.DataFrame,
         report += "\n   No open positions"
     
     # Trading summary with dual currency
-    if not trades_df.empty:
-        total_volume_usd = (trades_df['size'] * trades_df['price']).sum()
-        unique_coins = trades_df['coin'].nunique()
-        buy_trades = len(trades_df[trades_df['side'] == 'Buy'])
-        sell_trades = len(trades_df[trades_df['side'] == 'Sell'])
-        
+    if totals.trade_count:
         report += f"""
 
-📈 TRADING ACTIVITY ({len(trades_df)} trades)
+📈 TRADING ACTIVITY ({totals.trade_count} trades)
 ─────────────────────────────────────────────────────────────────────────────────
-💎 Unique Assets Traded: {unique_coins}
-🟢 Buy Trades: {buy_trades} | 🔴 Sell Trades: {sell_trades}
-💰 Total Volume: ${total_volume_usd:,.2f}
+💎 Unique Assets Traded: {totals.trade_coins}
+🟢 Buy Trades: {totals.buy_trades} | 🔴 Sell Trades: {totals.sell_trades}
+💰 Total Volume: ${totals.volume_usd:,.2f}
 💸 Total Trading Fees: ${total_fees_usd:,.4f} | €{total_fees_eur:,.4f}
 📊 Realized PnL: ${total_pnl_usd:,.4f} | €{total_pnl_eur:,.4f}"""
     else:
         report += "\n\n📈 TRADING ACTIVITY\n─────────────────────────────────────────────────────────────────────────────────\n   No trades found"
     
     # Funding summary with dual currency
-    if not funding_df.empty:
-        funding_coins = funding_df['coin'].nunique()
-        
+    if totals.funding_count:
         report += f"""
 
-💰 FUNDING HISTORY ({len(funding_df)} payments)
+💰 FUNDING HISTORY ({totals.funding_count} payments)
 ─────────────────────────────────────────────────────────────────────────────────
 💸 Total Funding Paid: ${funding_paid_usd:,.4f} | €{funding_paid_eur:,.4f}
 💰 Total Funding Received: ${funding_received_usd:,.4f} | €{funding_received_eur:,.4f}
-📊 Assets with Funding: {funding_coins}"""
+📊 Assets with Funding: {totals.funding_coins}"""
     else:
         report += "\n\n💰 FUNDING HISTORY\n─────────────────────────────────────────────────────────────────────────────────\n   No funding records found"
     
@@ -288,19 +344,18 @@ def create_enhanced_summary_report(wallet_address: str, trades_df: pd.DataFrame,
 📈 NETTO - Trading-Kosten (Kosten - Erträge): ${net_trading_costs_usd:,.4f} | €{net_trading_costs_eur:,.4f}"""
     
     # Transfer summary
-    if not transfers_df.empty:
-        deposits = transfers_df[transfers_df['type'].str.contains('deposit|withdraw', case=False, na=False)]
-        total_deposits_usd = deposits[deposits['amount'] > 0]['amount'].sum()
-        total_withdrawals_usd = abs(deposits[deposits['amount'] < 0]['amount'].sum())
+    if totals.transfer_count:
+        total_deposits_usd = totals.deposits_usd
+        total_withdrawals_usd = totals.withdrawals_usd
         
         # EUR conversions for deposits/withdrawals if available
-        if 'amount_eur' in transfers_df.columns:
-            total_deposits_eur = deposits[deposits['amount'] > 0]['amount_eur'].sum()
-            total_withdrawals_eur = abs(deposits[deposits['amount'] < 0]['amount_eur'].sum())
+        if totals.transfers_in_eur:
+            total_deposits_eur = totals.deposits_eur
+            total_withdrawals_eur = totals.withdrawals_eur
             
             report += f"""
 
-🔄 DEPOSITS & WITHDRAWALS ({len(transfers_df)} records)
+🔄 DEPOSITS & WITHDRAWALS ({totals.transfer_count} records)
 ─────────────────────────────────────────────────────────────────────────────────
 📥 Total Deposits: ${total_deposits_usd:,.2f} | €{total_deposits_eur:,.2f}
 📤 Total Withdrawals: ${total_withdrawals_usd:,.2f} | €{total_withdrawals_eur:,.2f}
@@ -308,7 +363,7 @@ def create_enhanced_summary_report(wallet_address: str, trades_df: pd.DataFrame,
         else:
             report += f"""
 
-🔄 DEPOSITS & WITHDRAWALS ({len(transfers_df)} records)
+🔄 DEPOSITS & WITHDRAWALS ({totals.transfer_count} records)
 ─────────────────────────────────────────────────────────────────────────────────
 📥 Total Deposits: ${total_deposits_usd:,.2f}
 📤 Total Withdrawals: ${total_withdrawals_usd:,.2f}
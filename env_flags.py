@@ -0,0 +1,12 @@
+"""
+Environment Flags for Hyperliquid Tax Calculator
+Shared parsing of the HL_* on/off switches, so every flag accepts the same values
+"""
+
+import os
+
+TRUTHY_VALUES = ("1", "true", "yes", "on")
+
+def env_enabled(name: str) -> bool:
+    """True if the environment variable is set to a truthy value"""
+    return os.environ.get(name, "").strip().lower() in TRUTHY_VALUES
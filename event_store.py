@@ -0,0 +1,216 @@
+"""
+Local Event Store for Hyperliquid Tax Calculator
+Persists fetched fills, funding and ledger updates per wallet in SQLite
+so repeat runs only need to download records outside the already synced range
+"""
+
+import json
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Callable, Tuple, Iterator
+
+# Re-fetch this much history before the high-water mark on every sync to pick up
+# records the API indexed late
+SYNC_OVERLAP_MS = 24 * 60 * 60 * 1000  # 1 day
+
+class EventStore:
+    """SQLite-backed store of raw Hyperliquid events with the synced time range per endpoint"""
+
+    def __init__(self, db_path: str = "hyperliquid_events.db"):
+        self.db_path = db_path
+        self._create_tables()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; one per call keeps the store safe to share between threads"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _create_tables(self):
+        """Create tables and indexes if they don't exist yet"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS events (
+                    wallet TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    event_key TEXT NOT NULL,
+                    time INTEGER NOT NULL,
+                    payload TEXT NOT NULL,
+                    PRIMARY KEY (wallet, endpoint, event_key)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_events_time ON events (wallet, endpoint, time)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS key_schemes (
+                    wallet TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    scheme TEXT NOT NULL,
+                    PRIMARY KEY (wallet, endpoint)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    wallet TEXT NOT NULL,
+                    endpoint TEXT NOT NULL,
+                    high_water_mark INTEGER NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    synced_from INTEGER,
+                    PRIMARY KEY (wallet, endpoint)
+                )
+            """)
+            # Stores created before tax-year scoping only tracked the high-water mark
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sync_state)")]
+            if 'synced_from' not in columns:
+                conn.execute("ALTER TABLE sync_state ADD COLUMN synced_from INTEGER")
+
+    def get_synced_range(self, wallet: str, endpoint: str) -> Optional[Tuple[int, int]]:
+        """Return the contiguous (from, until) range (ms) stored completely, or None if unknown"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT synced_from, high_water_mark FROM sync_state WHERE wallet = ? AND endpoint = ?",
+                (wallet, endpoint)
+            ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return row[0], row[1]
+
+    def get_sync_ranges(self, wallet: str, endpoint: str, start_time: int, end_time: int) -> List[Tuple[int, int]]:
+        """
+        Return the ranges that still have to be fetched to cover [start_time, end_time]
+        Ranges next to the stored range overlap it by SYNC_OVERLAP_MS, so records the
+        API indexed late are picked up and the stored range stays contiguous
+        """
+        synced = self.get_synced_range(wallet, endpoint)
+        if synced is None:
+            return [(start_time, end_time)]
+
+        synced_from, synced_until = synced
+        if synced_from - end_time > SYNC_OVERLAP_MS or start_time - synced_until > SYNC_OVERLAP_MS:
+            return [(start_time, end_time)]
+
+        ranges = []
+        if start_time < synced_from:
+            ranges.append((start_time, synced_from + SYNC_OVERLAP_MS))
+        if end_time > synced_until:
+            ranges.append((synced_until - SYNC_OVERLAP_MS, end_time))
+        return ranges
+
+    def ensure_key_scheme(self, wallet: str, endpoint: str, scheme: str,
+                          key_fn: Callable[[Dict[str, Any]], str]) -> None:
+        """
+        Make sure stored events are keyed with the given scheme
+        If events were stored under a different (or unrecorded) key scheme they are
+        re-keyed, collapsing rows that turn out to be the same event. The old key may
+        have merged distinct events, so the high-water mark is reset as well and the
+        next sync fetches the full history again.
+        """
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT scheme FROM key_schemes WHERE wallet = ? AND endpoint = ?", (wallet, endpoint)
+            ).fetchone()
+            if row and row[0] == scheme:
+                return
+
+            payloads = [json.loads(r[0]) for r in conn.execute(
+                "SELECT payload FROM events WHERE wallet = ? AND endpoint = ? ORDER BY time, event_key",
+                (wallet, endpoint)
+            )]
+            if payloads:
+                print(f"💾 Re-keying {len(payloads)} stored {endpoint} records ({scheme})")
+                conn.execute("DELETE FROM events WHERE wallet = ? AND endpoint = ?", (wallet, endpoint))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO events (wallet, endpoint, event_key, time, payload) VALUES (?, ?, ?, ?, ?)",
+                    [(wallet, endpoint, key_fn(p), int(p.get('time', 0)), json.dumps(p)) for p in payloads]
+                )
+                conn.execute("DELETE FROM sync_state WHERE wallet = ? AND endpoint = ?", (wallet, endpoint))
+            conn.execute(
+                "INSERT OR REPLACE INTO key_schemes (wallet, endpoint, scheme) VALUES (?, ?, ?)",
+                (wallet, endpoint, scheme)
+            )
+
+    def save_events(self, wallet: str, endpoint: str, events: List[Dict[str, Any]],
+                    key_fn: Callable[[Dict[str, Any]], str],
+                    synced_range: Optional[Tuple[int, int]] = None) -> int:
+        """
+        Upsert events and extend the stored range by synced_range (None leaves it unchanged)
+        A synced_range that doesn't touch the stored range replaces it
+        Returns the number of events that were not stored before
+        """
+        rows = [(wallet, endpoint, key_fn(event), int(event.get('time', 0)), json.dumps(event))
+                for event in events]
+
+        with closing(self._connect()) as conn, conn:
+            before = conn.execute(
+                "SELECT COUNT(*) FROM events WHERE wallet = ? AND endpoint = ?", (wallet, endpoint)
+            ).fetchone()[0]
+            conn.executemany(
+                "INSERT OR REPLACE INTO events (wallet, endpoint, event_key, time, payload) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            after = conn.execute(
+                "SELECT COUNT(*) FROM events WHERE wallet = ? AND endpoint = ?", (wallet, endpoint)
+            ).fetchone()[0]
+            if synced_range is not None:
+                synced_from, synced_until = synced_range
+                row = conn.execute(
+                    "SELECT synced_from, high_water_mark FROM sync_state WHERE wallet = ? AND endpoint = ?",
+                    (wallet, endpoint)
+                ).fetchone()
+                if row and row[0] is not None and synced_from <= row[1] and synced_until >= row[0]:
+                    synced_from, synced_until = min(synced_from, row[0]), max(synced_until, row[1])
+                conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (wallet, endpoint, high_water_mark, updated_at, synced_from) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (wallet, endpoint, synced_until, datetime.now(timezone.utc).isoformat(), synced_from)
+                )
+
+        return after - before
+
+    def load_events(self, wallet: str, endpoint: str, start_time: Optional[int] = None,
+                    end_time: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Load stored events in chronological order, optionally limited to a time range"""
+        query = "SELECT payload FROM events WHERE wallet = ? AND endpoint = ?"
+        params: List[Any] = [wallet, endpoint]
+        if start_time is not None:
+            query += " AND time >= ?"
+            params.append(start_time)
+        if end_time is not None:
+            query += " AND time <= ?"
+            params.append(end_time)
+        query += " ORDER BY time, event_key"
+
+        with closing(self._connect()) as conn:
+            return [json.loads(row[0]) for row in conn.execute(query, params)]
+
+    def iter_events(self, wallet: str, endpoint: str, start_time: int, end_time: int,
+                    batch_size: int = 50000) -> Iterator[List[Dict[str, Any]]]:
+        """Load stored events in chronological batches, so large histories never sit in memory at once"""
+        cursor = (start_time - 1, '')
+        while True:
+            with closing(self._connect()) as conn:
+                rows = conn.execute(
+                    "SELECT time, event_key, payload FROM events WHERE wallet = ? AND endpoint = ? "
+                    "AND (time, event_key) > (?, ?) AND time >= ? AND time <= ? ORDER BY time, event_key LIMIT ?",
+                    (wallet, endpoint, cursor[0], cursor[1], start_time, end_time, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [json.loads(row[2]) for row in rows]
+            cursor = (rows[-1][0], rows[-1][1])
+
+    def add_new_events(self, wallet: str, endpoint: str, events: List[Dict[str, Any]],
+                       key_fn: Callable[[Dict[str, Any]], str]) -> List[Dict[str, Any]]:
+        """
+        Insert events that are not stored yet and return exactly those
+        Used for live updates, so replayed snapshots are never counted twice; the
+        synced range is left unchanged because live events may leave gaps
+        """
+        new_events = []
+        with closing(self._connect()) as conn, conn:
+            for event in events:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO events (wallet, endpoint, event_key, time, payload) VALUES (?, ?, ?, ?, ?)",
+                    (wallet, endpoint, key_fn(event), int(event.get('time', 0)), json.dumps(event))
+                )
+                if cursor.rowcount:
+                    new_events.append(event)
+        return new_events
@@ -0,0 +1,111 @@
+"""
+HTTP Record/Replay Archive for Hyperliquid Tax Calculator
+Stores Hyperliquid info and ECB responses as gzip files keyed by a hash of the request,
+so reports can be re-run offline and reproducibly
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Any, Optional
+
+# Environment variables that switch main() and the batch runner into record/replay mode
+ARCHIVE_MODE_ENV = "HL_HTTP_ARCHIVE_MODE"
+ARCHIVE_DIR_ENV = "HL_HTTP_ARCHIVE_DIR"
+
+class ArchiveMiss(LookupError):
+    """A replayed request that is not in the recording"""
+
+class HttpArchive:
+    """
+    Content-addressed archive of HTTP responses
+    mode "record": responses are fetched from the network and stored
+    mode "replay": responses are served from the archive only, a miss is never sent to the network
+    """
+
+    MODES = ("record", "replay")
+
+    def __init__(self, archive_dir: str = "http_archive", mode: str = "replay"):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown archive mode: {mode}")
+
+        self.archive_dir = archive_dir
+        self.mode = mode
+        self.manifest_file = os.path.join(archive_dir, "manifest.json")
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(archive_dir, exist_ok=True)
+
+        # Requests contain "now" (window end times, ECB end date), so replay runs
+        # reuse the clock of the recording to produce identical request keys
+        if mode == "record":
+            self.clock_ms = int(time.time() * 1000)
+            with open(self.manifest_file, 'w') as f:
+                json.dump({'recorded_at_ms': self.clock_ms}, f, indent=2)
+        else:
+            try:
+                with open(self.manifest_file, 'r') as f:
+                    self.clock_ms = int(json.load(f)['recorded_at_ms'])
+            except FileNotFoundError:
+                raise FileNotFoundError(f"No recording found in {archive_dir} (missing manifest.json)")
+
+    @classmethod
+    def from_env(cls) -> Optional['HttpArchive']:
+        """Create an archive from HL_HTTP_ARCHIVE_MODE / HL_HTTP_ARCHIVE_DIR, or None if unset"""
+        mode = os.environ.get(ARCHIVE_MODE_ENV, "").strip().lower()
+        if not mode or mode == "off":
+            return None
+        archive = cls(os.environ.get(ARCHIVE_DIR_ENV, "http_archive"), mode)
+        print(f"📼 HTTP archive: {mode} mode ({archive.archive_dir})")
+        return archive
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @staticmethod
+    def request_key(method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                    payload: Optional[Dict[str, Any]] = None) -> str:
+        """Stable SHA-256 key of a request (method, URL, query params and JSON body)"""
+        canonical = json.dumps({
+            'method': method.upper(),
+            'url': url,
+            'params': params or {},
+            'payload': payload or {}
+        }, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.archive_dir, key[:2], f"{key}.json.gz")
+
+    def load(self, key: str) -> Optional[str]:
+        """Return the archived response body for key, or None if not recorded"""
+        try:
+            with gzip.open(self._path(key), 'rt', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry['body']
+
+    def save(self, key: str, method: str, url: str, body: str,
+             params: Optional[Dict[str, Any]] = None, payload: Optional[Dict[str, Any]] = None):
+        """Store a response body together with the request that produced it"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'request': {'method': method.upper(), 'url': url, 'params': params or {}, 'payload': payload or {}},
+            'body': body
+        }
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        # mtime=0 keeps the gzip bytes identical for identical responses
+        with open(tmp_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            f.write(json.dumps(entry, sort_keys=True).encode('utf-8'))
+        os.replace(tmp_path, path)
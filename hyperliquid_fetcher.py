@@ -7,35 +7,378 @@ Converts USD amounts to EUR using ECB exchange rates for German tax reporting
 import requests
 import json
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime, timezone
-from typing import List, Dict, Any, Optional
+from zoneinfo import ZoneInfo
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
 import time
-from currency_converter import CurrencyConverter, create_enhanced_summary_report
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
+from requests.adapters import HTTPAdapter
+from currency_converter import CurrencyConverter, ECBRatesFetcher, create_enhanced_summary_report
 from austrian_tax_report import AustrianTaxReportGenerator
 from manual_input_handler import ManualInputHandler
+from event_store import EventStore
+from rate_limiter import WeightedRateLimiter, get_shared_rate_limiter
+from http_archive import HttpArchive
+from position_engine import attribute_funding, build_position_timeline, print_position_carry, print_position_timeline
+from lot_engine import match_cost_basis, print_cost_basis
+from reconciliation import print_reconciliation, reconcile_ledger
+from price_history import CandleCache, PriceHistory, end_positions
+from report_totals import ReportTotals, aggregate_report_totals
+from money import MICROS, to_micros
+from env_flags import env_enabled
+
+# orjson decodes large fill/funding pages several times faster; fall back to the stdlib
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# History crawl settings shared by fills and funding pagination
+HISTORY_LOOKBACK_MS = 2 * 365 * 24 * 60 * 60 * 1000  # 2 years
+
+# Fills before the tax year that run_wallet_report fetches for the cost basis of carried positions
+COST_BASIS_LOOKBACK_MS = HISTORY_LOOKBACK_MS
+CHUNK_SIZE_MS = 30 * 24 * 60 * 60 * 1000  # 30 days
+
+# Austrian tax years run on Vienna local time
+TAX_TIMEZONE = ZoneInfo("Europe/Vienna")
+
+# Maximum rows the info API returns per time-range response
+FILLS_PAGE_LIMIT = 2000
+FUNDING_PAGE_LIMIT = 500
+LEDGER_PAGE_LIMIT = 500
+
+# Ledger updates are sparse, so they are crawled in wider windows from mainnet launch
+LEDGER_HISTORY_START_MS = 1672531200000  # 2023-01-01 UTC
+LEDGER_CHUNK_SIZE_MS = 180 * 24 * 60 * 60 * 1000  # 180 days
+
+# Records per batch handed downstream by the streaming iterators
+STREAM_BATCH_SIZE = 50000
+
+# Funding ingest: HL_FUNDING_BUCKETS rolls hourly payments up to (UTC day, coin, paid/received)
+# buckets, HL_FUNDING_DETAIL additionally exports the individual payments
+FUNDING_BUCKETS_ENV = "HL_FUNDING_BUCKETS"
+FUNDING_DETAIL_ENV = "HL_FUNDING_DETAIL"
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Independent tasks of the fetch stage: fills, funding, ledger, account state,
+# open orders and the ECB rate prefetch
+FETCH_STAGE_TASKS = 6
+
+# Event store key schemes; changing one re-keys the stored history on the next sync
+FILL_KEY_SCHEME = "tid"
+FUNDING_KEY_SCHEME = "time+coin+usdc"
+LEDGER_KEY_SCHEME = "hash+type"
+
+# Adaptive pagination bounds: full pages are split down to MIN_WINDOW_MS,
+# sparse windows are widened up to MAX_WINDOW_MS
+MIN_WINDOW_MS = 60 * 1000  # 1 minute
+MAX_WINDOW_MS = 365 * 24 * 60 * 60 * 1000  # 1 year
+
+# Retry settings for throttled (429), server-side (5xx) and network failures
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+RETRY_AFTER_MAX_SECONDS = 120.0
+
+def decode_columns(records: List[Dict[str, Any]], fields: Dict[str, Any]) -> Dict[str, list]:
+    """Pull each field out of the records as one list per column, using the default if missing"""
+    columns = {}
+    for name, default in fields.items():
+        try:
+            # C-level fast path for fields every record carries
+            columns[name] = list(map(itemgetter(name), records))
+        except KeyError:
+            columns[name] = [record.get(name, default) for record in records]
+    return columns
+
+def dedup_index(key_columns: Dict[str, list], keep: str = 'first') -> np.ndarray:
+    """
+    Positions of the records to keep, one per distinct composite key, in original order
+    Hashes the key columns in a single vectorized pass, so it stays O(n) for millions of records
+    """
+    keys = pd.DataFrame(key_columns)
+    return np.flatnonzero(~keys.duplicated(keep=keep).to_numpy())
+
+class CircuitBreaker:
+    """
+    Stops sending requests to a failing endpoint
+    Opens after failure_threshold consecutive failures and lets a single trial
+    request through once reset_timeout seconds have passed
+    """
+    
+    def __init__(self, failure_threshold: int = 8, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._trial_thread: Optional[int] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+    
+    def allow_request(self) -> bool:
+        """Return True if a request may be sent right now"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True  # Half-open: let one request probe the endpoint
+                self._trial_thread = threading.get_ident()
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self._trial_in_flight or self.consecutive_failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+    
+    def release_trial(self):
+        """End this thread's trial request if it neither succeeded nor failed, so the next one may probe"""
+        with self._lock:
+            if self._trial_thread == threading.get_ident():
+                self._trial_in_flight = False
+                self._trial_thread = None
 
 class HyperliquidFetcher:
     """Class to fetch and process Hyperliquid trading data"""
     
-    def __init__(self, wallet_address: str):
+    def __init__(self, wallet_address: str, max_workers: int = 4, pagination: str = "grid",
+                 event_store: Optional[EventStore] = None,
+                 rate_limiter: Optional[WeightedRateLimiter] = None,
+                 session: Optional[requests.Session] = None,
+                 archive: Optional[HttpArchive] = None, aggregate_fills: bool = False):
+        """
+        pagination: "grid" fetches fixed 30-day windows in parallel (splitting any
+        window that hits the API cap), "adaptive" walks the history sequentially and
+        widens or narrows the window depending on how full each response is
+        event_store: optional local store; when set, only the part of the requested
+        range that isn't stored yet (plus a small overlap) is requested
+        rate_limiter: weight budget to draw from; defaults to the process-wide
+        limiter so all fetchers together stay within the API limit
+        session: optional shared session (e.g. one connection pool for a batch run)
+        archive: optional HTTP archive to record responses to or replay them from
+        aggregate_fills: request fills aggregated by time (partial fills of one
+        crossing merged server-side); much faster, but not stored in the event store
+        """
+        if pagination not in ("grid", "adaptive"):
+            raise ValueError(f"Unknown pagination mode: {pagination}")
+        
         self.wallet_address = wallet_address.lower()
         self.api_url = "https://api.hyperliquid.xyz/info"
-        self.session = requests.Session()
-        self.session.headers.update({
+        self.max_workers = max(1, max_workers)
+        self.pagination = pagination
+        self.aggregate_fills = aggregate_fills
+        self.event_store = event_store
+        self.rate_limiter = rate_limiter or get_shared_rate_limiter()
+        # (start, end) in ms the history crawls are limited to, see set_time_range()
+        self.time_range: Optional[Tuple[int, int]] = None
+        # Extra history only the fills crawl reaches back for (cost basis of carried positions)
+        self.fills_lookback_ms = 0
+        
+        # Per-endpoint circuit breakers and requests that failed after all retries
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.failed_windows: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # Fills, funding and ledger crawls run side by side in the fetch stage
+        self.session = session or self.create_session(self.max_workers * 3)
+        self.archive = archive
+    
+    @staticmethod
+    def create_session(pool_size: int) -> requests.Session:
+        """Create an API session whose connection pool fits pool_size concurrent requests"""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        session.headers.update({
             'Content-Type': 'application/json',
             'User-Agent': 'HyperliquidTaxCalculator/1.0'
         })
+        return session
+    
+    def _get_circuit_breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            if endpoint not in self.circuit_breakers:
+                self.circuit_breakers[endpoint] = CircuitBreaker()
+            return self.circuit_breakers[endpoint]
+    
+    @staticmethod
+    def _retry_after_seconds(response: requests.Response) -> Optional[float]:
+        """Parse a Retry-After header given either in seconds or as an HTTP date"""
+        header = response.headers.get('Retry-After')
+        if not header:
+            return None
+        try:
+            seconds = float(header)
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(header) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                return None
+        return min(max(seconds, 0.0), RETRY_AFTER_MAX_SECONDS)
+    
+    @staticmethod
+    def _backoff_seconds(attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    
+    def _record_failed_window(self, payload: Dict[str, Any], reason: str):
+        """Remember a request that could not be completed so the gap is reported, not hidden"""
+        with self._lock:
+            self.failed_windows.append({
+                'endpoint': payload.get('type', 'unknown'),
+                'start_time': payload.get('startTime'),
+                'end_time': payload.get('endTime'),
+                'reason': reason
+            })
+    
+    def _now_ms(self) -> int:
+        """Current time in ms; the recording clock when an HTTP archive is in use"""
+        if self.archive:
+            return self.archive.clock_ms
+        return int(time.time() * 1000)
+    
+    def set_time_range(self, start_time: int, end_time: int, fills_lookback_ms: int = 0):
+        """
+        Limit the fills, funding and ledger crawls to [start_time, end_time] (ms), e.g. one tax year
+        fills_lookback_ms: the fills crawl alone starts this much earlier
+        """
+        self.time_range = (start_time, min(end_time, self._now_ms()))
+        self.fills_lookback_ms = fills_lookback_ms
+    
+    def get_history_range(self, default_start: Optional[int] = None) -> Tuple[int, int]:
+        """(start, end) in ms of the history crawls: the configured time range or the default lookback"""
+        if self.time_range:
+            return self.time_range
+        current_time = self._now_ms()
+        if default_start is None:
+            default_start = current_time - HISTORY_LOOKBACK_MS
+        return default_start, current_time
+    
+    def get_fills_range(self) -> Tuple[int, int]:
+        """(start, end) in ms of the fills crawl: the history range extended by fills_lookback_ms"""
+        start_time, end_time = self.get_history_range()
+        return start_time - self.fills_lookback_ms, end_time
     
     def _make_request(self, payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        """Make a POST request to the Hyperliquid API with error handling"""
+        """
+        Make a POST request to the Hyperliquid API with retries
+        429, 5xx and network errors are retried with exponential backoff (honouring
+        Retry-After); requests that still fail are recorded in failed_windows
+        """
+        endpoint = payload.get('type', 'unknown')
+        
+        archive_key = None
+        if self.archive:
+            archive_key = self.archive.request_key('POST', self.api_url, payload=payload)
+            if self.archive.replaying:
+                body = self.archive.load(archive_key)
+                if body is None:
+                    print(f"❌ No archived response for {endpoint} request")
+                    self._record_failed_window(payload, "not in HTTP archive")
+                    return None
+                return json_loads(body)
+        
+        breaker = self._get_circuit_breaker(endpoint)
         try:
-            response = self.session.post(self.api_url, json=payload, timeout=30)
-            response.raise_for_status()
-            return response.json()
-        except requests.RequestException as e:
-            print(f"❌ API request failed: {e}")
-            return None
+            return self._post_with_retries(payload, endpoint, breaker, archive_key)
+        finally:
+            # Every exit path must release a half-open trial, or the endpoint stays blocked
+            breaker.release_trial()
+    
+    def _post_with_retries(self, payload: Dict[str, Any], endpoint: str, breaker: CircuitBreaker,
+                           archive_key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Retry loop of _make_request"""
+        error = None
+        
+        for attempt in range(MAX_RETRIES + 1):
+            if not breaker.allow_request():
+                error = f"circuit open for {endpoint}"
+                break
+            
+            self.rate_limiter.acquire(endpoint)
+            delay = None
+            try:
+                response = self.session.post(self.api_url, json=payload, timeout=30)
+            except requests.RequestException as e:
+                # Network errors, timeouts and truncated bodies (ChunkedEncodingError, ...) are retryable
+                error = e
+            else:
+                if response.status_code == 429 or response.status_code >= 500:
+                    if response.status_code == 429:
+                        self.rate_limiter.record_throttled()
+                    error = f"HTTP {response.status_code}"
+                    delay = self._retry_after_seconds(response)
+                else:
+                    try:
+                        response.raise_for_status()
+                        result = json_loads(response.content)
+                    except (requests.RequestException, ValueError) as e:
+                        # Client errors and malformed responses won't improve on retry
+                        print(f"❌ API request failed: {e}")
+                        self._record_failed_window(payload, str(e))
+                        return None
+                    breaker.record_success()
+                    if isinstance(result, list):
+                        self.rate_limiter.record_response(endpoint, len(result))
+                    if archive_key:
+                        self.archive.save(archive_key, 'POST', self.api_url, response.text, payload=payload)
+                    return result
+            
+            breaker.record_failure()
+            if attempt == MAX_RETRIES:
+                break
+            if delay is None:
+                delay = self._backoff_seconds(attempt)
+            print(f"⚠️  {endpoint} request failed ({error}), retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+            time.sleep(delay)
+        
+        print(f"❌ API request failed: {error}")
+        self._record_failed_window(payload, str(error))
+        return None
+    
+    def get_failed_windows(self, endpoint: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Return failed requests, optionally only those of one endpoint type"""
+        with self._lock:
+            return [w for w in self.failed_windows if endpoint is None or w['endpoint'] == endpoint]
+    
+    def print_failed_windows(self) -> bool:
+        """Print a report of all failed requests; returns True if data is incomplete"""
+        failed = self.get_failed_windows()
+        if not failed:
+            return False
+        
+        print("\n" + "═" * 80)
+        print(f"⚠️  UNVOLLSTÄNDIGE DATEN: {len(failed)} Anfrage(n) endgültig fehlgeschlagen")
+        print("═" * 80)
+        for window in sorted(failed, key=lambda w: (w['endpoint'], w['start_time'] or 0)):
+            if window['start_time'] is not None:
+                period = (f"{HyperliquidDataProcessor.timestamp_to_datetime(window['start_time'])} → "
+                          f"{HyperliquidDataProcessor.timestamp_to_datetime(window['end_time'])}")
+            else:
+                period = "kein Zeitfenster"
+            print(f"   ❌ {window['endpoint']}: {period} ({window['reason']})")
+        print("   Bitte Programm erneut ausführen, bevor der Report verwendet wird.")
+        return True
     
     def get_user_fills(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> List[Dict[str, Any]]:
         """
@@ -45,13 +388,18 @@ class HyperliquidFetcher:
         print("📊 Fetching trade history (with pagination)...")
         
         if start_time or end_time:
-            return self._fetch_fills_by_time(start_time or 0, end_time or int(time.time() * 1000))
+            return self._fetch_fills_window(start_time or 0, end_time or self._now_ms())
+        elif self.event_store or self.time_range:
+            # Time-range crawl, synced incrementally against the local event store if there is one
+            all_fills = self._fetch_all_fills()
+            print(f"✅ Retrieved {len(all_fills)} total trade fills")
+            return all_fills
         else:
             # First try the regular userFills endpoint
             payload = {
                 "type": "userFills",
                 "user": self.wallet_address,
-                "aggregateByTime": False
+                "aggregateByTime": self.aggregate_fills
             }
             
             result = self._make_request(payload)
@@ -68,38 +416,334 @@ class HyperliquidFetcher:
                 return result
             return []
     
-    def _fetch_all_fills(self) -> List[Dict[str, Any]]:
-        """Fetch ALL user fills using time-based pagination"""
-        all_fills = []
-        
-        # Start from 2 years ago to ensure we get everything
-        current_time = int(time.time() * 1000)
-        start_time = current_time - (2 * 365 * 24 * 60 * 60 * 1000)  # 2 years ago
-        chunk_size = 30 * 24 * 60 * 60 * 1000  # 30 days in milliseconds
-        
-        while start_time < current_time:
-            chunk_end = min(start_time + chunk_size, current_time)
+    @staticmethod
+    def _build_time_windows(start_time: int, end_time: int, chunk_size: int = CHUNK_SIZE_MS) -> List[Tuple[int, int]]:
+        """Split [start_time, end_time] into consecutive non-overlapping windows"""
+        windows = []
+        while start_time < end_time:
+            chunk_end = min(start_time + chunk_size, end_time)
+            windows.append((start_time, chunk_end))
+            start_time = chunk_end + 1
+        return windows
+    
+    def _fetch_windows_concurrently(self, fetch_fn: Callable[[int, int], List[Dict[str, Any]]],
+                                    windows: List[Tuple[int, int]], label: str) -> List[Dict[str, Any]]:
+        """
+        Fetch all time windows in parallel on the shared session
+        Results are reassembled in chronological window order
+        """
+        all_records = []
+        for records in self._iter_windows_concurrently(fetch_fn, windows, label):
+            all_records.extend(records)
+        return all_records
+    
+    def _iter_windows_concurrently(self, fetch_fn: Callable[[int, int], List[Dict[str, Any]]],
+                                   windows: List[Tuple[int, int]], label: str) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield the records of each time window in chronological order
+        Windows are fetched in parallel, but at most max_workers ahead of the consumer
+        """
+        if not windows:
+            return
+        
+        workers = min(self.max_workers, len(windows))
+        print(f"📥 Fetching {label} in {len(windows)} windows ({workers} parallel requests)...")
+        
+        total = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = deque()
+            window_iter = iter(windows)
+            for window in window_iter:
+                pending.append((window, executor.submit(fetch_fn, *window)))
+                if len(pending) >= workers:
+                    break
             
-            print(f"📥 Fetching trades from {datetime.fromtimestamp(start_time/1000).strftime('%Y-%m-%d')} to {datetime.fromtimestamp(chunk_end/1000).strftime('%Y-%m-%d')}")
+            while pending:
+                (start_time, chunk_end), future = pending.popleft()
+                records = future.result()
+                next_window = next(window_iter, None)
+                if next_window:
+                    pending.append((next_window, executor.submit(fetch_fn, *next_window)))
+                
+                if records:
+                    total += len(records)
+                    print(f"   📊 {datetime.fromtimestamp(start_time/1000).strftime('%Y-%m-%d')} to "
+                          f"{datetime.fromtimestamp(chunk_end/1000).strftime('%Y-%m-%d')}: "
+                          f"{len(records)} {label} (total: {total})")
+                    yield records
+    
+    def _fetch_window_complete(self, fetch_fn: Callable[[int, int], List[Dict[str, Any]]],
+                               start_time: int, end_time: int, page_limit: int,
+                               request_type: str) -> List[Dict[str, Any]]:
+        """
+        Fetch a time window and make sure no rows are lost to the API page cap
+        Full pages are continued with a cursor from the latest returned record time
+        (the pagination scheme documented by Hyperliquid, one request per page);
+        a full page that already reaches the window end is bisected instead.
+        The API has no cursor below one millisecond, so a millisecond holding a full
+        page is recorded as a failed window rather than skipped silently
+        """
+        records = fetch_fn(start_time, end_time)
+        if len(records) < page_limit:
+            return records
+        
+        last_time = max(record.get('time', start_time) for record in records)
+        if last_time >= end_time and end_time - start_time > MIN_WINDOW_MS:
+            middle = start_time + (end_time - start_time) // 2
+            return (self._fetch_window_complete(fetch_fn, start_time, middle, page_limit, request_type) +
+                    self._fetch_window_complete(fetch_fn, middle + 1, end_time, page_limit, request_type))
+        
+        # The cursor is inclusive because several records can share a millisecond,
+        # the resulting overlap is removed by the dedup step
+        all_records = list(records)
+        while len(records) >= page_limit:
+            last_time = max(record.get('time', start_time) for record in records)
+            cursor = last_time
+            if last_time <= start_time:
+                # The whole page shares one millisecond, the records after it can't be requested
+                self._record_failed_window({'type': request_type, 'startTime': start_time, 'endTime': start_time},
+                                           f"{page_limit} or more records in one millisecond")
+                cursor = last_time + 1
+            if cursor > end_time:
+                break
+            start_time = cursor
+            records = fetch_fn(start_time, end_time)
+            all_records.extend(records)
+        return all_records
+    
+    def _fetch_range_adaptive(self, fetch_fn: Callable[[int, int], List[Dict[str, Any]]],
+                              start_time: int, end_time: int, page_limit: int, label: str,
+                              request_type: str) -> List[Dict[str, Any]]:
+        """
+        Walk [start_time, end_time] sequentially with a self-sizing window
+        Windows that return a full page are halved and retried, windows that come
+        back sparse double the size of the next one
+        """
+        all_records = []
+        for records in self._iter_range_adaptive(fetch_fn, start_time, end_time, page_limit, label,
+                                                 request_type):
+            all_records.extend(records)
+        return all_records
+    
+    def _iter_range_adaptive(self, fetch_fn: Callable[[int, int], List[Dict[str, Any]]],
+                             start_time: int, end_time: int, page_limit: int,
+                             label: str, request_type: str) -> Iterator[List[Dict[str, Any]]]:
+        """Generator form of _fetch_range_adaptive yielding the records of each window"""
+        print(f"📥 Fetching {label} with adaptive windows...")
+        
+        total = 0
+        window_size = CHUNK_SIZE_MS
+        cursor = start_time
+        requests_made = 0
+        
+        while cursor < end_time:
+            window_end = min(cursor + window_size, end_time)
+            records = fetch_fn(cursor, window_end)
+            requests_made += 1
             
-            chunk_fills = self._fetch_fills_by_time(start_time, chunk_end)
-            if chunk_fills:
-                all_fills.extend(chunk_fills)
-                print(f"   📊 Found {len(chunk_fills)} trades in this period")
+            if len(records) >= page_limit:
+                if window_end - cursor > MIN_WINDOW_MS:
+                    window_size = max(MIN_WINDOW_MS, (window_end - cursor) // 2)
+                    continue
+                records = self._fetch_window_complete(fetch_fn, cursor, window_end, page_limit, request_type)
             
-            start_time = chunk_end + 1
-            time.sleep(0.1)  # Rate limiting
-        
-        # Remove duplicates based on transaction hash and keep most recent
-        seen_hashes = set()
-        unique_fills = []
-        for fill in reversed(all_fills):  # Reverse to keep most recent duplicates
-            tx_hash = fill.get('hash', '')
-            if tx_hash and tx_hash not in seen_hashes:
-                seen_hashes.add(tx_hash)
-                unique_fills.append(fill)
+            if records:
+                total += len(records)
+                print(f"   📊 {datetime.fromtimestamp(cursor/1000).strftime('%Y-%m-%d')} to "
+                      f"{datetime.fromtimestamp(window_end/1000).strftime('%Y-%m-%d')}: "
+                      f"{len(records)} {label} (total: {total})")
+                yield records
+            
+            if len(records) < page_limit // 4:
+                window_size = min(window_size * 2, MAX_WINDOW_MS)
+            cursor = window_end + 1
         
-        return list(reversed(unique_fills))  # Return in chronological order
+        print(f"   ℹ️  Adaptive pagination used {requests_made} requests")
+    
+    def _fetch_fills_window(self, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        """Fetch all fills of a time range, splitting around the API page cap"""
+        return self._fetch_window_complete(self._fetch_fills_by_time, start_time, end_time, FILLS_PAGE_LIMIT,
+                                           'userFillsByTime')
+    
+    def _fetch_funding_window(self, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        """Fetch all funding records of a time range, splitting around the API page cap"""
+        return self._fetch_window_complete(self._fetch_funding_by_time, start_time, end_time, FUNDING_PAGE_LIMIT,
+                                           'userFunding')
+    
+    def _fetch_ledger_window(self, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        """Fetch all ledger updates of a time range, splitting around the API page cap"""
+        return self._fetch_window_complete(self._fetch_ledger_by_time, start_time, end_time, LEDGER_PAGE_LIMIT,
+                                           'userNonFundingLedgerUpdates')
+    
+    @staticmethod
+    def _fill_key(fill: Dict[str, Any]) -> str:
+        """Unique key of a fill; partial fills of one order share a hash but each has its own trade id"""
+        return str(fill.get('tid', ''))
+    
+    @staticmethod
+    def _funding_key(fund: Dict[str, Any]) -> str:
+        """Unique key of a funding record from timestamp, coin and payment amount"""
+        delta = fund.get('delta', {})
+        return f"{fund.get('time', 0)}_{delta.get('coin', '')}_{delta.get('usdc', 0)}"
+    
+    @staticmethod
+    def _fill_key_columns(fills: List[Dict[str, Any]]) -> Dict[str, list]:
+        """Columnar form of _fill_key for dedup_index"""
+        return decode_columns(fills, {'tid': ''})
+    
+    @staticmethod
+    def _ledger_key_columns(updates: List[Dict[str, Any]]) -> Dict[str, list]:
+        """Columnar form of _ledger_key for dedup_index"""
+        columns = decode_columns(updates, {'hash': ''})
+        columns.update(decode_columns([update.get('delta', {}) for update in updates], {'type': ''}))
+        return columns
+    
+    @staticmethod
+    def _funding_key_columns(funding: List[Dict[str, Any]]) -> Dict[str, list]:
+        """Columnar form of _funding_key for dedup_index"""
+        columns = decode_columns(funding, {'time': 0})
+        columns.update(decode_columns([fund.get('delta', {}) for fund in funding], {'coin': '', 'usdc': 0}))
+        return columns
+    
+    @staticmethod
+    def _ledger_key(update: Dict[str, Any]) -> str:
+        """Unique key of a non-funding ledger update from transaction hash and delta type"""
+        return f"{update.get('hash', '')}_{update.get('delta', {}).get('type', '')}"
+    
+    def _sync_ranges(self, endpoint: str, start_time: int, end_time: int,
+                     key_fn: Callable[[Dict[str, Any]], str], key_scheme: str) -> List[Tuple[int, int]]:
+        """Ranges to fetch: the whole [start_time, end_time], or only what the event store doesn't cover yet"""
+        if not self.event_store:
+            return [(start_time, end_time)]
+        
+        # A changed key scheme resets the sync state, so history stored under the old keys is re-fetched
+        self.event_store.ensure_key_scheme(self.wallet_address, endpoint, key_scheme, key_fn)
+        ranges = self.event_store.get_sync_ranges(self.wallet_address, endpoint, start_time, end_time)
+        if ranges != [(start_time, end_time)]:
+            for range_start, range_end in ranges:
+                print(f"💾 Incremental {endpoint} sync {datetime.fromtimestamp(range_start/1000).strftime('%Y-%m-%d %H:%M')} "
+                      f"to {datetime.fromtimestamp(range_end/1000).strftime('%Y-%m-%d %H:%M')}")
+            if not ranges:
+                print(f"💾 {endpoint} already synced for the requested range")
+        return ranges
+    
+    def _fetch_ranges(self, ranges: List[Tuple[int, int]],
+                      window_fn: Callable[[int, int], List[Dict[str, Any]]],
+                      by_time_fn: Callable[[int, int], List[Dict[str, Any]]],
+                      page_limit: int, label: str, request_type: str,
+                      chunk_size: int = CHUNK_SIZE_MS) -> List[Dict[str, Any]]:
+        """Crawl each range with the configured pagination mode"""
+        all_records = []
+        for records in self._iter_ranges(ranges, window_fn, by_time_fn, page_limit, label, request_type,
+                                         chunk_size):
+            all_records.extend(records)
+        return all_records
+    
+    def _iter_ranges(self, ranges: List[Tuple[int, int]],
+                     window_fn: Callable[[int, int], List[Dict[str, Any]]],
+                     by_time_fn: Callable[[int, int], List[Dict[str, Any]]],
+                     page_limit: int, label: str, request_type: str,
+                     chunk_size: int = CHUNK_SIZE_MS) -> Iterator[List[Dict[str, Any]]]:
+        """Generator form of _fetch_ranges yielding the records of each window"""
+        for start_time, end_time in ranges:
+            if self.pagination == "adaptive":
+                yield from self._iter_range_adaptive(by_time_fn, start_time, end_time, page_limit, label,
+                                                     request_type)
+            else:
+                windows = self._build_time_windows(start_time, end_time, chunk_size)
+                yield from self._iter_windows_concurrently(window_fn, windows, label)
+    
+    def _merge_with_store(self, endpoint: str, records: List[Dict[str, Any]],
+                          key_fn: Callable[[Dict[str, Any]], str], ranges: List[Tuple[int, int]],
+                          start_time: int, end_time: int, request_type: str) -> List[Dict[str, Any]]:
+        """Persist freshly fetched records and return the stored history of [start_time, end_time]"""
+        if not self.event_store:
+            return records
+        
+        new_count = self.event_store.save_events(self.wallet_address, endpoint, records, key_fn,
+                                                 self._completed_range(ranges, request_type))
+        print(f"💾 Stored {new_count} new {endpoint} records in local event store")
+        return self.event_store.load_events(self.wallet_address, endpoint, start_time, end_time)
+    
+    def _completed_range(self, ranges: List[Tuple[int, int]], request_type: str) -> Optional[Tuple[int, int]]:
+        """Range to mark as synced; None if any window failed, so the next run re-fetches it"""
+        if not ranges or self.get_failed_windows(request_type):
+            return None
+        return min(r[0] for r in ranges), max(r[1] for r in ranges)
+    
+    def _stream_records(self, endpoint: str, windows: Iterator[List[Dict[str, Any]]],
+                        key_fn: Callable[[Dict[str, Any]], str],
+                        key_columns_fn: Callable[[List[Dict[str, Any]]], Dict[str, list]],
+                        ranges: List[Tuple[int, int]], start_time: int, end_time: int,
+                        request_type: str, batch_size: int, keep: str = 'first') -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield deduplicated records in chronological batches of at most batch_size
+        With an event store every window is written to disk as it arrives and the
+        result is read back in batches; without one, windows are passed straight through
+        """
+        for records in windows:
+            records = [records[i] for i in dedup_index(key_columns_fn(records), keep)]
+            if self.event_store:
+                self.event_store.save_events(self.wallet_address, endpoint, records, key_fn)
+            else:
+                for i in range(0, len(records), batch_size):
+                    yield records[i:i + batch_size]
+        
+        if self.event_store:
+            synced_range = self._completed_range(ranges, request_type)
+            if synced_range:
+                self.event_store.save_events(self.wallet_address, endpoint, [], key_fn, synced_range)
+            yield from self.event_store.iter_events(self.wallet_address, endpoint, start_time, end_time, batch_size)
+    
+    def iter_user_fills(self, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the fills of the history range in chronological batches"""
+        if self.aggregate_fills:
+            raise ValueError("Aggregated fills are for previews only and can't be streamed")
+        start_time, end_time = self.get_fills_range()
+        ranges = self._sync_ranges('fills', start_time, end_time, self._fill_key, FILL_KEY_SCHEME)
+        windows = self._iter_ranges(ranges, self._fetch_fills_window, self._fetch_fills_by_time,
+                                    FILLS_PAGE_LIMIT, "trades", 'userFillsByTime')
+        return self._stream_records('fills', windows, self._fill_key, self._fill_key_columns, ranges,
+                                    start_time, end_time, 'userFillsByTime', batch_size, keep='last')
+    
+    def iter_user_funding(self, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the funding records of the history range in chronological batches"""
+        start_time, end_time = self.get_history_range()
+        ranges = self._sync_ranges('funding', start_time, end_time, self._funding_key, FUNDING_KEY_SCHEME)
+        windows = self._iter_ranges(ranges, self._fetch_funding_window, self._fetch_funding_by_time,
+                                    FUNDING_PAGE_LIMIT, "funding records", 'userFunding')
+        return self._stream_records('funding', windows, self._funding_key, self._funding_key_columns, ranges,
+                                    start_time, end_time, 'userFunding', batch_size)
+    
+    def iter_user_transfers(self, batch_size: int = STREAM_BATCH_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """Stream the non-funding ledger updates of the history range in chronological batches"""
+        start_time, end_time = self.get_history_range(LEDGER_HISTORY_START_MS)
+        ranges = self._sync_ranges('ledger', start_time, end_time, self._ledger_key, LEDGER_KEY_SCHEME)
+        windows = self._iter_ranges(ranges, self._fetch_ledger_window, self._fetch_ledger_by_time,
+                                    LEDGER_PAGE_LIMIT, "ledger updates", 'userNonFundingLedgerUpdates',
+                                    LEDGER_CHUNK_SIZE_MS)
+        return self._stream_records('ledger', windows, self._ledger_key, self._ledger_key_columns, ranges,
+                                    start_time, end_time, 'userNonFundingLedgerUpdates', batch_size)
+    
+    def _fetch_all_fills(self) -> List[Dict[str, Any]]:
+        """Fetch ALL user fills of the history range using concurrent time-based pagination"""
+        # Default range starts 2 years ago to ensure we get everything
+        start_time, end_time = self.get_fills_range()
+        if self.aggregate_fills:
+            # Aggregated fills would mix with the partial fills in the store, so they bypass it
+            ranges = [(start_time, end_time)]
+        else:
+            ranges = self._sync_ranges('fills', start_time, end_time, self._fill_key, FILL_KEY_SCHEME)
+        all_fills = self._fetch_ranges(ranges, self._fetch_fills_window, self._fetch_fills_by_time,
+                                       FILLS_PAGE_LIMIT, "trades", 'userFillsByTime')
+        
+        # Remove duplicates from overlapping windows by trade id, keeping the most recent copy
+        keep = dedup_index(self._fill_key_columns(all_fills), keep='last')
+        unique_fills = [all_fills[i] for i in keep]
+        if self.aggregate_fills:
+            return unique_fills
+        return self._merge_with_store('fills', unique_fills, self._fill_key, ranges,
+                                      start_time, end_time, 'userFillsByTime')
     
     def _fetch_fills_by_time(self, start_time: int, end_time: int) -> List[Dict[str, Any]]:
         """Fetch fills for a specific time range"""
@@ -108,57 +752,36 @@ class HyperliquidFetcher:
             "user": self.wallet_address,
             "startTime": start_time,
             "endTime": end_time,
-            "aggregateByTime": False
+            "aggregateByTime": self.aggregate_fills
         }
         
         result = self._make_request(payload)
-        return result if result and isinstance(result, list) else []
+        return result if isinstance(result, list) else []
     
     def get_user_funding(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> List[Dict[str, Any]]:
         """Fetch user funding history with pagination support"""
         print("💰 Fetching funding history (with pagination)...")
         
         if start_time or end_time:
-            return self._fetch_funding_by_time(start_time or 0, end_time or int(time.time() * 1000))
+            return self._fetch_funding_window(start_time or 0, end_time or self._now_ms())
         else:
             # Try to fetch all funding records using pagination
             all_funding = self._fetch_all_funding()
             return all_funding
     
     def _fetch_all_funding(self) -> List[Dict[str, Any]]:
-        """Fetch ALL user funding using time-based pagination"""
-        all_funding = []
-        
-        # Start from 2 years ago to ensure we get everything
-        current_time = int(time.time() * 1000)
-        start_time = current_time - (2 * 365 * 24 * 60 * 60 * 1000)  # 2 years ago
-        chunk_size = 30 * 24 * 60 * 60 * 1000  # 30 days in milliseconds
-        
-        total_fetched = 0
-        while start_time < current_time:
-            chunk_end = min(start_time + chunk_size, current_time)
-            
-            print(f"📥 Fetching funding from {datetime.fromtimestamp(start_time/1000).strftime('%Y-%m-%d')} to {datetime.fromtimestamp(chunk_end/1000).strftime('%Y-%m-%d')}")
-            
-            chunk_funding = self._fetch_funding_by_time(start_time, chunk_end)
-            if chunk_funding:
-                all_funding.extend(chunk_funding)
-                total_fetched += len(chunk_funding)
-                print(f"   💰 Found {len(chunk_funding)} funding records in this period (total: {total_fetched})")
-            
-            start_time = chunk_end + 1
-            time.sleep(0.1)  # Rate limiting
-        
-        # Remove duplicates based on timestamp and funding payment
-        seen_records = set()
-        unique_funding = []
-        for fund in all_funding:
-            # Create a unique key from timestamp and payment amount
-            key = f"{fund.get('time', 0)}_{fund.get('delta', {}).get('usdc', 0)}"
-            if key not in seen_records:
-                seen_records.add(key)
-                unique_funding.append(fund)
-        
+        """Fetch ALL user funding of the history range using concurrent time-based pagination"""
+        # Default range starts 2 years ago to ensure we get everything
+        start_time, end_time = self.get_history_range()
+        ranges = self._sync_ranges('funding', start_time, end_time, self._funding_key, FUNDING_KEY_SCHEME)
+        all_funding = self._fetch_ranges(ranges, self._fetch_funding_window, self._fetch_funding_by_time,
+                                         FUNDING_PAGE_LIMIT, "funding records", 'userFunding')
+        
+        # Remove duplicates based on timestamp, coin and funding payment
+        keep = dedup_index(self._funding_key_columns(all_funding))
+        unique_funding = [all_funding[i] for i in keep]
+        unique_funding = self._merge_with_store('funding', unique_funding, self._funding_key, ranges,
+                                                start_time, end_time, 'userFunding')
         print(f"✅ Retrieved {len(unique_funding)} total funding records (complete history)")
         return unique_funding
     
@@ -172,24 +795,45 @@ class HyperliquidFetcher:
         }
         
         result = self._make_request(payload)
-        return result if result and isinstance(result, list) else []
+        return result if isinstance(result, list) else []
     
     def get_user_transfers(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> List[Dict[str, Any]]:
-        """Fetch user non-funding ledger updates (deposits, withdrawals, transfers)"""
-        print("🔄 Fetching transfer/deposit history...")
+        """Fetch user non-funding ledger updates (deposits, withdrawals, transfers) with pagination"""
+        print("🔄 Fetching transfer/deposit history (with pagination)...")
+        
+        if start_time or end_time:
+            return self._fetch_ledger_window(start_time or 0, end_time or self._now_ms())
         
+        all_transfers = self._fetch_all_ledger()
+        print(f"✅ Retrieved {len(all_transfers)} transfer records")
+        return all_transfers
+    
+    def _fetch_all_ledger(self) -> List[Dict[str, Any]]:
+        """Fetch ALL non-funding ledger updates of the history range using concurrent time-based pagination"""
+        start_time, end_time = self.get_history_range(LEDGER_HISTORY_START_MS)
+        ranges = self._sync_ranges('ledger', start_time, end_time, self._ledger_key, LEDGER_KEY_SCHEME)
+        all_updates = self._fetch_ranges(ranges, self._fetch_ledger_window, self._fetch_ledger_by_time,
+                                         LEDGER_PAGE_LIMIT, "ledger updates", 'userNonFundingLedgerUpdates',
+                                         LEDGER_CHUNK_SIZE_MS)
+        
+        # Remove duplicates from overlapping cursor pages based on hash and delta type
+        keep = dedup_index(self._ledger_key_columns(all_updates))
+        unique_updates = [all_updates[i] for i in keep]
+        
+        return self._merge_with_store('ledger', unique_updates, self._ledger_key, ranges,
+                                      start_time, end_time, 'userNonFundingLedgerUpdates')
+    
+    def _fetch_ledger_by_time(self, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        """Fetch non-funding ledger updates for a specific time range"""
         payload = {
             "type": "userNonFundingLedgerUpdates",
             "user": self.wallet_address,
-            "startTime": start_time or 0,
-            "endTime": end_time or int(time.time() * 1000)
+            "startTime": start_time,
+            "endTime": end_time
         }
         
         result = self._make_request(payload)
-        if result and isinstance(result, list):
-            print(f"✅ Retrieved {len(result)} transfer records")
-            return result
-        return []
+        return result if isinstance(result, list) else []
     
     def get_account_state(self) -> Optional[Dict[str, Any]]:
         """Fetch current account state including open positions"""
@@ -224,42 +868,62 @@ class HyperliquidFetcher:
 class HyperliquidDataProcessor:
     """Class to process and summarize Hyperliquid data"""
     
+    def __init__(self, funding_buckets: Optional[bool] = None, funding_detail: Optional[bool] = None):
+        self.funding_buckets = env_enabled(FUNDING_BUCKETS_ENV) if funding_buckets is None else funding_buckets
+        self.funding_detail = env_enabled(FUNDING_DETAIL_ENV) if funding_detail is None else funding_detail
+    
     @staticmethod
     def timestamp_to_datetime(timestamp_ms: int) -> str:
         """Convert timestamp in milliseconds to readable datetime"""
         return datetime.fromtimestamp(timestamp_ms / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
     
+    @staticmethod
+    def _to_float(values: list) -> np.ndarray:
+        """Parse a column of numeric strings in one pass"""
+        return np.array(values, dtype=float)
+    
+    @staticmethod
+    def _newest_first(df: pd.DataFrame, timestamps_ms: np.ndarray) -> pd.DataFrame:
+        """Sort rows by timestamp, newest first"""
+        return df.iloc[np.argsort(timestamps_ms, kind='stable')[::-1]]
+    
+    @staticmethod
+    def _categorical(values) -> pd.Categorical:
+        """Dictionary-encode a column with few distinct strings (coins, sides, types, hashes)"""
+        return pd.Categorical(values)
+    
     @staticmethod
     def process_trades(trades: List[Dict[str, Any]]) -> pd.DataFrame:
         """Process trade fills into a clean DataFrame"""
         if not trades:
             return pd.DataFrame()
         
-        processed_trades = []
-        
-        for trade in trades:
-            processed_trade = {
-                'timestamp': HyperliquidDataProcessor.timestamp_to_datetime(trade['time']),
-                'coin': trade['coin'],
-                'side': 'Buy' if trade['side'] == 'B' else 'Sell',
-                'size': float(trade['sz']),
-                'price': float(trade['px']),
-                'direction': trade.get('dir', 'N/A'),
-                'closed_pnl': float(trade.get('closedPnl', 0)),
-                'fee': float(trade.get('fee', 0)),
-                'fee_token': trade.get('feeToken', 'USDC'),
-                'start_position': float(trade.get('startPosition', 0)),
-                'hash': trade['hash'],
-                'order_id': trade['oid'],
-                'crossed': trade.get('crossed', False),
-                'trade_id': trade.get('tid', ''),
-                'builder_fee': float(trade.get('builderFee', 0))
-            }
-            processed_trades.append(processed_trade)
-        
-        df = pd.DataFrame(processed_trades)
-        df = df.sort_values('timestamp', ascending=False)
-        return df
+        p = HyperliquidDataProcessor
+        cols = decode_columns(trades, {
+            'time': 0, 'coin': None, 'side': None, 'sz': 0, 'px': 0, 'dir': 'N/A',
+            'closedPnl': 0, 'fee': 0, 'feeToken': 'USDC', 'startPosition': 0,
+            'hash': None, 'oid': None, 'crossed': False, 'tid': '', 'builderFee': 0
+        })
+        times = np.array(cols['time'], dtype='int64')
+        
+        df = pd.DataFrame({
+            'time_ms': times,
+            'coin': p._categorical(cols['coin']),
+            'side': p._categorical(np.where(np.array(cols['side'], dtype=object) == 'B', 'Buy', 'Sell')),
+            'size': p._to_float(cols['sz']),
+            'price': p._to_float(cols['px']),
+            'direction': p._categorical(cols['dir']),
+            'closed_pnl': p._to_float(cols['closedPnl']),
+            'fee': p._to_float(cols['fee']),
+            'fee_token': p._categorical(cols['feeToken']),
+            'start_position': p._to_float(cols['startPosition']),
+            'hash': p._categorical(cols['hash']),
+            'order_id': cols['oid'],
+            'crossed': cols['crossed'],
+            'trade_id': cols['tid'],
+            'builder_fee': p._to_float(cols['builderFee'])
+        })
+        return p._newest_first(df, times)
     
     @staticmethod
     def process_funding(funding: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -267,26 +931,76 @@ class HyperliquidDataProcessor:
         if not funding:
             return pd.DataFrame()
         
-        processed_funding = []
-        
-        for fund in funding:
-            delta = fund['delta']
-            funding_rate_raw = float(delta.get('fundingRate', 0))
-            processed_fund = {
-                'timestamp': HyperliquidDataProcessor.timestamp_to_datetime(fund['time']),
-                'coin': delta['coin'],
-                'funding_rate': funding_rate_raw,
-                'funding_rate_percent': f"{funding_rate_raw * 100:.4f}%",
-                'position_size': float(delta.get('szi', 0)),
-                'funding_payment': float(delta.get('usdc', 0)),
-                'type': delta.get('type', 'funding'),
-                'hash': fund['hash']
-            }
-            processed_funding.append(processed_fund)
+        p = HyperliquidDataProcessor
+        times = np.array(list(map(itemgetter('time'), funding)), dtype='int64')
+        cols = decode_columns(list(map(itemgetter('delta'), funding)), {
+            'coin': None, 'fundingRate': 0, 'szi': 0, 'usdc': 0, 'type': 'funding'
+        })
         
-        df = pd.DataFrame(processed_funding)
-        df = df.sort_values('timestamp', ascending=False)
-        return df
+        df = pd.DataFrame({
+            'time_ms': times,
+            'coin': p._categorical(cols['coin']),
+            'funding_rate': p._to_float(cols['fundingRate']),
+            'position_size': p._to_float(cols['szi']),
+            'funding_payment': p._to_float(cols['usdc']),
+            'type': p._categorical(cols['type']),
+            'hash': p._categorical(list(map(itemgetter('hash'), funding)))
+        })
+        return p._newest_first(df, times)
+    
+    @staticmethod
+    def aggregate_funding(funding_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Roll funding payments up to one row per (UTC day, coin, paid/received)
+        A day's payments share one ECB rate, so the EUR totals are unchanged apart from
+        rounding once per bucket instead of once per payment. Sums are exact in micro-units;
+        time_ms is the first payment of the bucket, payments its number of payments.
+        """
+        if funding_df.empty:
+            return funding_df
+        
+        p = HyperliquidDataProcessor
+        times = funding_df['time_ms'].to_numpy(dtype='int64')
+        micros = to_micros(funding_df['funding_payment'])
+        buckets = pd.DataFrame({
+            'day': times // DAY_MS,
+            'coin': funding_df['coin'].to_numpy(dtype=object),
+            'received': micros > 0,
+            'time_ms': times,
+            'micros': micros,
+            'funding_rate': funding_df['funding_rate'].to_numpy(dtype=float)
+        }).groupby(['day', 'coin', 'received'], sort=False).agg(
+            time_ms=('time_ms', 'min'),
+            micros=('micros', 'sum'),
+            payments=('micros', 'size'),
+            funding_rate=('funding_rate', 'mean')
+        ).reset_index()
+        
+        bucket_times = buckets['time_ms'].to_numpy(dtype='int64')
+        df = pd.DataFrame({
+            'time_ms': bucket_times,
+            'coin': p._categorical(buckets['coin']),
+            'funding_rate': buckets['funding_rate'].to_numpy(dtype=float),
+            'funding_payment': buckets['micros'].to_numpy(dtype='int64') / MICROS,
+            'type': p._categorical(np.full(len(buckets), 'funding', dtype=object)),
+            'payments': buckets['payments'].to_numpy(dtype='int64')
+        })
+        return p._newest_first(df, bucket_times)
+    
+    def ingest_funding(self, funding: List[Dict[str, Any]]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Funding frame for the report and the individual payments for the ledger checks
+        Without bucketing both are the same frame; exports_funding_detail() decides the CSV export
+        """
+        funding_df = self.process_funding(funding)
+        if not self.funding_buckets:
+            return funding_df, funding_df
+        # Buckets of one time are ordered by first payment, as the streaming pipeline aggregates them
+        return self.aggregate_funding(funding_df.iloc[::-1]), funding_df
+    
+    def exports_funding_detail(self) -> bool:
+        """True if the individual payments are exported next to the day buckets"""
+        return self.funding_buckets and self.funding_detail
     
     @staticmethod
     def process_transfers(transfers: List[Dict[str, Any]]) -> pd.DataFrame:
@@ -294,31 +1008,28 @@ class HyperliquidDataProcessor:
         if not transfers:
             return pd.DataFrame()
         
-        processed_transfers = []
-        
-        for transfer in transfers:
-            delta = transfer['delta']
-            processed_transfer = {
-                'timestamp': HyperliquidDataProcessor.timestamp_to_datetime(transfer['time']),
-                'type': delta.get('type', 'unknown'),
-                'amount': float(delta.get('usdc', 0)) if 'usdc' in delta else 0,
-                'coin': delta.get('coin', 'USDC'),
-                'hash': transfer['hash']
-            }
-            
-            # Handle different transfer types
-            if 'subAccountTransfer' in delta:
-                processed_transfer['details'] = f"SubAccount Transfer: {delta['subAccountTransfer']}"
-            elif 'spotTransfer' in delta:
-                processed_transfer['details'] = f"Spot Transfer: {delta['spotTransfer']}"
-            else:
-                processed_transfer['details'] = str(delta)
-            
-            processed_transfers.append(processed_transfer)
-        
-        df = pd.DataFrame(processed_transfers)
-        df = df.sort_values('timestamp', ascending=False)
-        return df
+        p = HyperliquidDataProcessor
+        times = np.array(list(map(itemgetter('time'), transfers)), dtype='int64')
+        deltas = list(map(itemgetter('delta'), transfers))
+        cols = decode_columns(deltas, {'type': 'unknown', 'usdc': 0, 'coin': 'USDC'})
+        
+        # Handle different transfer types
+        details = [
+            f"SubAccount Transfer: {delta['subAccountTransfer']}" if 'subAccountTransfer' in delta
+            else f"Spot Transfer: {delta['spotTransfer']}" if 'spotTransfer' in delta
+            else str(delta)
+            for delta in deltas
+        ]
+        
+        df = pd.DataFrame({
+            'time_ms': times,
+            'type': p._categorical(cols['type']),
+            'amount': p._to_float(cols['usdc']),
+            'coin': p._categorical(cols['coin']),
+            'hash': p._categorical(list(map(itemgetter('hash'), transfers))),
+            'details': details
+        })
+        return p._newest_first(df, times)
     
     @staticmethod
     def process_account_state(account_state: Dict[str, Any]) -> Dict[str, Any]:
@@ -328,6 +1039,7 @@ class HyperliquidDataProcessor:
         
         processed_state = {
             'timestamp': HyperliquidDataProcessor.timestamp_to_datetime(account_state.get('time', 0)),
+            'time_ms': int(account_state.get('time', 0)),
             'account_value': float(account_state['marginSummary']['accountValue']),
             'total_margin_used': float(account_state['marginSummary']['totalMarginUsed']),
             'total_ntl_pos': float(account_state['marginSummary']['totalNtlPos']),
@@ -356,9 +1068,13 @@ class HyperliquidDataProcessor:
         return processed_state
 
 def create_summary_report(wallet_address: str, trades_df: pd.DataFrame, funding_df: pd.DataFrame, 
-                         transfers_df: pd.DataFrame, account_state: Dict[str, Any]) -> str:
+                         transfers_df: pd.DataFrame, account_state: Dict[str, Any],
+                         totals: Optional[ReportTotals] = None) -> str:
     """Create a comprehensive summary report"""
     
+    if totals is None:
+        totals = aggregate_report_totals(trades_df, funding_df, transfers_df)
+    
     report = f"""
 ╔══════════════════════════════════════════════════════════════════════════════════╗
 ║                            HYPERLIQUID TRADING SUMMARY                           ║
@@ -390,83 +1106,63 @@ def create_summary_report(wallet_address: str, trades_df: pd.DataFrame, funding_
         report += "\n   No open positions"
     
     # Trading summary
-    if not trades_df.empty:
-        total_volume = (trades_df['size'] * trades_df['price']).sum()
-        total_fees = trades_df['fee'].sum()
-        total_pnl = trades_df['closed_pnl'].sum()
-        unique_coins = trades_df['coin'].nunique()
-        buy_trades = len(trades_df[trades_df['side'] == 'Buy'])
-        sell_trades = len(trades_df[trades_df['side'] == 'Sell'])
-        
+    if totals.trade_count:
         report += f"""
 
-📈 TRADING ACTIVITY ({len(trades_df)} trades)
+📈 TRADING ACTIVITY ({totals.trade_count} trades)
 ─────────────────────────────────────────────────────────────────────────────────
-💎 Unique Assets Traded: {unique_coins}
-🟢 Buy Trades: {buy_trades} | 🔴 Sell Trades: {sell_trades}
-💰 Total Volume: ${total_volume:,.2f}
-💸 Total Trading Fees: ${abs(total_fees):,.4f}
-📊 Realized PnL: ${total_pnl:,.2f}
+💎 Unique Assets Traded: {totals.trade_coins}
+🟢 Buy Trades: {totals.buy_trades} | 🔴 Sell Trades: {totals.sell_trades}
+💰 Total Volume: ${totals.volume_usd:,.2f}
+💸 Total Trading Fees: ${abs(totals.fee_usd):,.4f}
+📊 Realized PnL: ${totals.closed_pnl_usd:,.2f}
 
 🏆 TOP TRADED ASSETS:"""
         
-        top_coins = trades_df.groupby('coin').agg({
-            'size': 'count',
-            'price': lambda x: (trades_df.loc[x.index, 'size'] * x).sum()
-        }).rename(columns={'size': 'trades', 'price': 'volume'}).sort_values('volume', ascending=False).head(5)
-        
+        top_coins = totals.by_coin[totals.by_coin['trades'] > 0].sort_values('volume_usd', ascending=False).head(5)
         for coin, data in top_coins.iterrows():
             report += f"""
-   {coin}: {data['trades']} trades, ${data['volume']:,.2f} volume"""
+   {coin}: {int(data['trades'])} trades, ${data['volume_usd']:,.2f} volume"""
     else:
         report += "\n\n📈 TRADING ACTIVITY\n─────────────────────────────────────────────────────────────────────────────────\n   No trades found"
     
     # Funding summary
-    if not funding_df.empty:
-        total_funding = funding_df['funding_payment'].sum()
-        funding_coins = funding_df['coin'].nunique()
-        
+    if totals.funding_count:
         report += f"""
 
-💰 FUNDING HISTORY ({len(funding_df)} payments)
+💰 FUNDING HISTORY ({totals.funding_count} payments)
 ─────────────────────────────────────────────────────────────────────────────────
-💸 Total Funding Paid/Received: ${total_funding:,.4f}
-📊 Assets with Funding: {funding_coins}"""
+💸 Total Funding Paid/Received: ${totals.funding_usd:,.4f}
+📊 Assets with Funding: {totals.funding_coins}"""
         
-        funding_by_coin = funding_df.groupby('coin')['funding_payment'].sum().sort_values().head(5)
+        funding_by_coin = totals.by_coin.loc[totals.by_coin['funding_count'] > 0, 'funding_usd'].sort_values().head(5)
         for coin, amount in funding_by_coin.items():
             status = "Paid" if amount < 0 else "Received"
             report += f"""
    {coin}: ${abs(amount):,.4f} {status}"""
     else:
-        total_funding = 0
         report += "\n\n💰 FUNDING HISTORY\n─────────────────────────────────────────────────────────────────────────────────\n   No funding records found"
     
     # Combined costs summary
-    total_fees = trades_df['fee'].sum() if not trades_df.empty else 0
-    total_costs = abs(total_fees) + abs(total_funding)
+    total_costs = abs(totals.fee_usd) + abs(totals.funding_usd)
     
     report += f"""
 
 💳 TOTAL COSTS BREAKDOWN
 ─────────────────────────────────────────────────────────────────────────────────
-💸 Trading Fees: ${abs(total_fees):,.4f}
-🔄 Funding Costs: ${abs(total_funding):,.4f}
+💸 Trading Fees: ${abs(totals.fee_usd):,.4f}
+🔄 Funding Costs: ${abs(totals.funding_usd):,.4f}
 💰 Combined Total: ${total_costs:,.4f}"""
     
     # Transfer summary
-    if not transfers_df.empty:
-        deposits = transfers_df[transfers_df['type'].str.contains('deposit|withdraw', case=False, na=False)]
-        total_deposits = deposits[deposits['amount'] > 0]['amount'].sum()
-        total_withdrawals = abs(deposits[deposits['amount'] < 0]['amount'].sum())
-        
+    if totals.transfer_count:
         report += f"""
 
-🔄 DEPOSITS & WITHDRAWALS ({len(transfers_df)} records)
+🔄 DEPOSITS & WITHDRAWALS ({totals.transfer_count} records)
 ─────────────────────────────────────────────────────────────────────────────────
-📥 Total Deposits: ${total_deposits:,.2f}
-📤 Total Withdrawals: ${total_withdrawals:,.2f}
-💰 Net Flow: ${total_deposits - total_withdrawals:,.2f}"""
+📥 Total Deposits: ${totals.deposits_usd:,.2f}
+📤 Total Withdrawals: ${totals.withdrawals_usd:,.2f}
+💰 Net Flow: ${totals.deposits_usd - totals.withdrawals_usd:,.2f}"""
     else:
         report += "\n\n🔄 DEPOSITS & WITHDRAWALS\n─────────────────────────────────────────────────────────────────────────────────\n   No transfer records found"
     
@@ -511,6 +1207,332 @@ def get_user_input():
 # Templates are auto-generated in manual_input/ folder on first run
 # ============================================================================
 
+def load_yearly_income(manual_handler: ManualInputHandler, tax_year: int) -> float:
+    """Load yearly income from the monthly income CSV, defaulting to 0.00 EUR"""
+    try:
+        yearly_income = manual_handler.read_monthly_income(tax_year)
+        if yearly_income is not None:
+            print(f"✅ Jahreseinkommen aus monatlichen Angaben geladen: €{yearly_income:,.2f}")
+            return yearly_income
+        print("⚠️ Keine monatlichen Einkommen gefunden. Verwende Standardeinkommen 0.00 EUR")
+    except FileNotFoundError:
+        print("⚠️ monthly_income.csv nicht gefunden. Verwende Standardeinkommen 0.00 EUR")
+    return 0.0
+
+def tax_year_bounds(tax_year: int) -> Tuple[int, int]:
+    """First and last millisecond (UTC epoch ms) of a tax year on Vienna local time"""
+    start = datetime(tax_year, 1, 1, tzinfo=TAX_TIMEZONE)
+    end = datetime(tax_year + 1, 1, 1, tzinfo=TAX_TIMEZONE)
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000) - 1
+
+def filter_time_range(records: List[Dict[str, Any]], start_time: int, end_time: int) -> List[Dict[str, Any]]:
+    """Keep the raw API records with start_time <= time <= end_time"""
+    times = np.array(list(map(itemgetter('time'), records)), dtype='int64')
+    return [records[i] for i in np.flatnonzero((times >= start_time) & (times <= end_time))]
+
+def filter_frame_time_range(df: pd.DataFrame, start_time: int, end_time: int) -> pd.DataFrame:
+    """Keep the DataFrame rows with start_time <= time_ms <= end_time"""
+    if df.empty:
+        return df
+    return df[df['time_ms'].between(start_time, end_time)]
+
+def year_slice(df: pd.DataFrame, start_time: int, end_time: int) -> pd.DataFrame:
+    """Rows of a processed frame inside [start_time, end_time], as if only those had been processed"""
+    if df.empty:
+        return df
+    sliced = filter_frame_time_range(df, start_time, end_time).reset_index(drop=True)
+    if sliced.empty:
+        return pd.DataFrame()
+    categorical = sliced.select_dtypes('category').columns
+    return sliced.assign(**{column: sliced[column].cat.remove_unused_categories() for column in categorical})
+
+def cost_basis_fills(history_trades_df: pd.DataFrame, manual_trades_df: pd.DataFrame,
+                     converter: CurrencyConverter) -> pd.DataFrame:
+    """Exchange and manual fills of the whole lookback history with their USD/EUR rate"""
+    frames = [df for df in (history_trades_df, manual_trades_df) if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    fills = pd.concat(frames, ignore_index=True)
+    converter.prepare_rates([fills])
+    return converter.add_eur_conversions(fills, [])
+
+def fetch_wallet_data(fetcher: HyperliquidFetcher, converter: CurrencyConverter) -> Dict[str, Any]:
+    """
+    Run all independent API fetches concurrently
+    The ECB rate download for the crawl range starts right away instead of after
+    the last fetch, so the stage takes about as long as the slowest single fetch
+    """
+    # The ledger crawl reaches back further than fills and funding unless a time range is set;
+    # lookback fills before the range get their rates once they are converted
+    start_time = min(fetcher.get_history_range()[0], fetcher.get_history_range(LEDGER_HISTORY_START_MS)[0])
+    end_time = fetcher.get_history_range()[1]
+    start_date = datetime.fromtimestamp(start_time / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    end_date = datetime.fromtimestamp(end_time / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    
+    with ThreadPoolExecutor(max_workers=FETCH_STAGE_TASKS) as executor:
+        futures = {
+            'fills': executor.submit(fetcher.get_user_fills),
+            'funding': executor.submit(fetcher.get_user_funding),
+            'transfers': executor.submit(fetcher.get_user_transfers),
+            'account': executor.submit(fetcher.get_account_state),
+            'open_orders': executor.submit(fetcher.get_open_orders),
+            'ecb_rates': executor.submit(converter.rates_fetcher.ensure_range_available, start_date, end_date)
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+def print_cli_tax_summary(tax_summary: Dict[str, Any], tax_year: int):
+    """Print the Austrian tax breakdown of a tax summary (see AustrianTaxReportGenerator) to the console"""
+    yearly_income = tax_summary['yearly_income_eur']
+    taxable_trading_profit_eur = tax_summary['taxable_trading_profit_eur']
+    trading_tax = tax_summary['trading_tax']
+    
+    print("\n" + "═" * 80)
+    print(f"🇦🇹 ÖSTERREICHISCHE STEUERKALKULATION {tax_year}")
+    print("═" * 80)
+    
+    print(f"💰 Lohn-Einkommen: €{yearly_income:,.2f}")
+    print(f" Trading-Gewinn (steuerlich): €{taxable_trading_profit_eur:,.2f}")
+    print(f"🔢 Gesamteinkommen (steuerpflichtig): €{tax_summary['total_taxable_income_eur']:,.2f}")
+    
+    print(f"\n" + "═" * 80)
+    print(f"🇦🇹 ÖSTERREICHISCHE STEUERKALKULATION {tax_year}")
+    print("═" * 80)
+    print(f"💸 Steuer nur auf Lohn: €{tax_summary['tax_lohn_only']:,.2f}")
+    print(f"💸 Zusatzsteuer durch Trading: €{trading_tax:,.2f}")
+    print(f"💰 Steuer gesamt (Lohn + Trading): €{tax_summary['tax_with_trading']:,.2f}")
+    print("─" * 80)
+    print(f"📋 FÜR STEUERERKLÄRUNG:")
+    print(f"💰 Trading-Gewinn (E1kv eintragen): €{taxable_trading_profit_eur:,.2f}")
+    print(f"💸 Zusätzlich zu überweisen: €{trading_tax:,.2f}")
+    print("─" * 80)
+    
+    if tax_summary['raw_trading_result_eur'] < 0:
+        print(f"ℹ️  Hinweis: Trading-Verluste mindern das Lohn-Einkommen nicht (Deckelung auf 0 €).")
+    
+    print(f"\n💸 DETAILLIERTE STEUERTABELLE {tax_year}:")
+    print("─────────────────────────────────────────────────────────────────────────────────")
+    
+    for bracket in tax_summary['tax_breakdown']:
+        if bracket['bracket_income'] > 0:
+            print(f"€{bracket['bracket_income']:,.0f} -> {bracket['rate']*100:.0f}% = €{bracket['bracket_tax']:,.2f}")
+    
+    print("─────────────────────────────────────────────────────────────────────────────────")
+    
+    print("\n")
+
+def create_price_history(fetcher: HyperliquidFetcher) -> PriceHistory:
+    """Price history for a fetcher; candles are cached on disk alongside the event store"""
+    return PriceHistory(fetcher, CandleCache() if fetcher.event_store else None)
+
+def value_year_end_positions(positions: Dict[str, float], tax_year: int, price_history: PriceHistory,
+                             converter: CurrencyConverter) -> pd.DataFrame:
+    """Open positions at the end of a finished tax year, marked at the last close of the year"""
+    year_end = tax_year_bounds(tax_year)[1]
+    if year_end >= price_history.fetcher._now_ms():
+        return pd.DataFrame()
+    marks = price_history.year_end_marks(positions, year_end)
+    if marks.empty:
+        return marks
+    marks['time_ms'] = year_end
+    converter.prepare_rates([marks])
+    marks = converter.add_eur_conversions(marks, ['notional_usd'])
+    return marks.rename(columns={'notional_usd_eur': 'notional_eur'}).drop(columns=['time_ms', 'date'])
+
+def print_year_end_positions(marks: pd.DataFrame, tax_year: int):
+    """Print the open positions at year end (information only, unrealized PnL is not taxed)"""
+    if marks.empty:
+        return
+    print("\n" + "═" * 80)
+    print(f"📌 OFFENE POSITIONEN AM 31.12.{tax_year}")
+    print("═" * 80)
+    for _, row in marks.iterrows():
+        if pd.isna(row['mark_price']):
+            print(f"   {row['coin']}: {row['size']:,.4f} @ kein Kurs")
+            continue
+        print(f"   {row['coin']}: {row['size']:,.4f} @ ${row['mark_price']:,.4f} = "
+              f"${row['notional_usd']:,.2f} | €{row['notional_eur']:,.2f}")
+
+def run_wallet_report(wallet_address: str, tax_year: int, yearly_income: float,
+                      fetcher: HyperliquidFetcher, converter: CurrencyConverter,
+                      manual_handler: ManualInputHandler, output_dir: str = ".",
+                      lookback_ms: int = COST_BASIS_LOOKBACK_MS,
+                      price_history: Optional[PriceHistory] = None) -> str:
+    """
+    Fetch, convert and report a single wallet for one tax year
+    Only the tax year is requested from the API, fills reach lookback_ms further back;
+    the lookback fills only feed the cost basis and year-end size of positions carried into the year
+    Returns the path of the generated ZIP package
+    """
+    processor = HyperliquidDataProcessor()
+    price_history = price_history or create_price_history(fetcher)
+    
+    year_start, year_end = tax_year_bounds(tax_year)
+    fetcher.set_time_range(year_start, year_end, fills_lookback_ms=lookback_ms)
+    
+    # Fetch trades, funding, transfers, account state, open orders and ECB rates concurrently
+    fetched = fetch_wallet_data(fetcher, converter)
+    
+    # Every aggregation below works on the tax year only, so filter once here
+    # The processor sorts newest first; the report is chronological like the streaming pipeline
+    history_trades_df = processor.process_trades(
+        filter_time_range(fetched['fills'], year_start - lookback_ms, year_end)).iloc[::-1]
+    trades_df = year_slice(history_trades_df, year_start, year_end)
+    funding_df, funding_payments_df = (df.iloc[::-1] for df in processor.ingest_funding(
+        filter_time_range(fetched['funding'], year_start, year_end)))
+    transfers_df = processor.process_transfers(filter_time_range(fetched['transfers'], year_start, year_end)).iloc[::-1]
+    account_state = processor.process_account_state(fetched['account']) if fetched['account'] else {}
+    
+    # Fees paid in other tokens are valued in USD before the EUR conversion
+    trades_df = price_history.value_fees(trades_df)
+    # Positions carried through the year without a fill in it are only in the lookback history
+    year_end_marks = value_year_end_positions(end_positions(history_trades_df), tax_year, price_history, converter)
+    if not year_end_marks.empty:
+        account_state['year_end_positions'] = year_end_marks.to_dict('records')
+    open_orders = fetched['open_orders']
+    
+    # Make failed fetch windows visible instead of silently reporting incomplete data
+    fetcher.print_failed_windows()
+    
+    # Replaying the fills against their startPosition also exposes fills missing from the API data
+    timeline = build_position_timeline(trades_df)
+    print_position_timeline(timeline)
+    
+    # Balance timeline of the fetched data against the account value, before manual entries are merged
+    # Position side checks need the individual payments, day buckets carry no position size
+    reconciliation = reconcile_ledger(trades_df, funding_payments_df, transfers_df, account_state, timeline,
+                                      range_end_ms=year_end)
+    print_reconciliation(reconciliation)
+    
+    usage = fetcher.rate_limiter.get_usage()
+    print(f"📶 API weight used in the last minute: {usage['used_last_minute']}/{usage['capacity_per_minute']} "
+          f"(waited {usage['total_wait_seconds']:.1f}s for rate limit)")
+    
+    # Check if manual input folder exists, if not create templates
+    if not os.path.exists(manual_handler.manual_input_folder):
+        print("\n" + "═" * 80)
+        print("🆕 ERSTMALIGER START - MANUAL INPUT SYSTEM WIRD EINGERICHTET")
+        print("═" * 80)
+        manual_handler.generate_template_csvs()
+        manual_handler.print_instructions()
+    
+    # Read manual inputs from CSV files
+    print("\n" + "═" * 80)
+    print("📂 LADE MANUELLE EINTRÄGE AUS CSV-DATEIEN...")
+    print("═" * 80)
+    
+    manual_deposits_df = manual_handler.read_manual_deposits()
+    manual_trades_df = manual_handler.read_manual_trades()
+    manual_history_df = filter_frame_time_range(manual_trades_df, year_start - lookback_ms, year_end)
+    
+    # Keep only the manual entries of the tax year
+    manual_deposits_df = filter_frame_time_range(manual_deposits_df, year_start, year_end)
+    manual_trades_df = filter_frame_time_range(manual_trades_df, year_start, year_end)
+    
+    # Merge manual entries with fetched data
+    if not manual_trades_df.empty:
+        trades_df = pd.concat([trades_df, manual_trades_df], ignore_index=True)
+        trades_df = trades_df.sort_values('time_ms', kind='stable').reset_index(drop=True)
+        print(f"✅ {len(manual_trades_df)} manuelle Trade(s) hinzugefügt")
+    
+    if not manual_deposits_df.empty:
+        transfers_df = pd.concat([transfers_df, manual_deposits_df], ignore_index=True)
+        transfers_df = transfers_df.sort_values('time_ms', kind='stable').reset_index(drop=True)
+        print(f"✅ {len(manual_deposits_df)} manuelle Einzahlung(en) hinzugefügt")
+    
+    print("\n" + "═" * 80)
+    print("💱 CONVERTING USD TO EUR...")
+    print("═" * 80)
+    
+    # Prepare EUR conversions
+    dataframes = [trades_df, funding_df, transfers_df]
+    converter.prepare_rates(dataframes)
+    
+    # Add EUR conversions to each dataframe
+    if not trades_df.empty:
+        print("💰 Converting trade data to EUR...")
+        trades_df = converter.add_eur_conversions(
+            trades_df, 
+            ['fee', 'closed_pnl']
+        )
+    
+    if not funding_df.empty:
+        print("� Converting funding data to EUR...")
+        funding_df = converter.add_eur_conversions(
+            funding_df, 
+            ['funding_payment']
+        )
+    
+    # Bucketed funding keeps the individual payments for the per-position attribution
+    if processor.funding_buckets and not funding_payments_df.empty:
+        funding_payments_df = converter.add_eur_conversions(funding_payments_df, ['funding_payment'])
+    else:
+        funding_payments_df = funding_df
+    
+    if not timeline.fills.empty:
+        timeline.fills = converter.add_eur_conversions(timeline.fills, ['fee', 'closed_pnl'])
+    
+    if not transfers_df.empty:
+        print("📤 Converting transfer data to EUR...")
+        transfers_df = converter.add_eur_conversions(
+            transfers_df, 
+            ['amount']
+        )
+    
+    print("\n" + "═" * 80)
+    print("�📊 DATA FETCHING & CONVERSION COMPLETE!")
+    print("═" * 80)
+    
+    # One aggregation pass feeds the console summary, the tax summary and the report package
+    totals = aggregate_report_totals(trades_df, funding_df, transfers_df)
+    
+    # Create enhanced summary with EUR
+    summary = create_enhanced_summary_report(wallet_address, trades_df, funding_df, transfers_df, account_state,
+                                             totals=totals)
+    
+    # Add Austrian tax calculation to CLI output
+    print(summary)
+    
+    # Calculate and display tax breakdown in CLI
+    austrian_reporter = AustrianTaxReportGenerator(
+        wallet_address=wallet_address,
+        yearly_income=yearly_income,
+        tax_year=tax_year
+    )
+    print_cli_tax_summary(austrian_reporter.tax_summary_from_totals(totals), tax_year)
+    print_year_end_positions(year_end_marks, tax_year)
+    
+    # Lot matching (HL_COST_BASIS=fifo|average) cross-checks the closedPnl figures with EUR acquisition costs
+    # Lots are built from the lookback history, disposals are reported for the tax year only
+    print_cost_basis(match_cost_basis(cost_basis_fills(history_trades_df, manual_history_df, converter),
+                                      start_ms=year_start, end_ms=year_end),
+                     totals.closed_pnl_usd, totals.closed_pnl_eur)
+    
+    # Funding carry per position, attributed per payment also when only day buckets are exported
+    print_position_carry(attribute_funding(timeline, funding_payments_df))
+    
+    # Generate Austrian Tax Report
+    print("\n" + "═" * 80)
+    print(f"🇦🇹 GENERATING AUSTRIAN TAX REPORT {tax_year}...")
+    print("═" * 80)
+    
+    zip_filename = austrian_reporter.generate_report_package(
+        trades_df=trades_df,
+        funding_df=funding_df,
+        transfers_df=transfers_df,
+        account_state=account_state,
+        base_filename=f"hyperliquid_austria_{datetime.now().strftime('%Y%m%d_%H%M%S')}",
+        output_dir=output_dir,
+        totals=totals,
+        funding_detail_df=funding_payments_df if processor.exports_funding_detail() else None,
+        reconciliation=reconciliation
+    )
+    
+    print(f"\n✅ Austrian tax report generated successfully!")
+    print(f"� Complete report package: {zip_filename}")
+    print("🇦🇹 Report includes organized folders with CSVs and PDF tax calculation.")
+    
+    return zip_filename
+
 def main():
     """Main function to run the Hyperliquid data fetcher with EUR conversion"""
     
@@ -522,205 +1544,38 @@ def main():
     print("🇪🇺 EUR conversions using ECB exchange rates")
     print("═" * 80)
     
-    # Initialize fetcher and converter
-    fetcher = HyperliquidFetcher(wallet_address)
-    processor = HyperliquidDataProcessor()
-    converter = CurrencyConverter()
+    # Optional record/replay of all HTTP responses (HL_HTTP_ARCHIVE_MODE=record|replay).
+    # Archived runs crawl the full history so requests don't depend on local sync state.
+    archive = HttpArchive.from_env()
     
-    # Initialize manual input handler
-    manual_handler = ManualInputHandler()
+    # Initialize fetcher (with local event store for incremental sync) and converter
+    fetcher = HyperliquidFetcher(wallet_address, event_store=None if archive else EventStore(), archive=archive)
+    converter = CurrencyConverter(ECBRatesFetcher(archive=archive))
+    
+    # Initialize manual input handler (shares the converter's ECB rate table)
+    manual_handler = ManualInputHandler(rates_fetcher=converter.rates_fetcher)
     
     # Load monthly income from CSV (default approach)
-    try:
-        yearly_income = manual_handler.read_monthly_income(tax_year)
-        if yearly_income is not None:
-            print(f"✅ Jahreseinkommen aus monatlichen Angaben geladen: €{yearly_income:,.2f}")
-        else:
-            print("⚠️ Keine monatlichen Einkommen gefunden. Verwende Standardeinkommen 0.00 EUR")
-            yearly_income = 0.0
-    except FileNotFoundError:
-        print("⚠️ monthly_income.csv nicht gefunden. Verwende Standardeinkommen 0.00 EUR")
-        yearly_income = 0.0
+    yearly_income = load_yearly_income(manual_handler, tax_year)
     
-    # Fetch all data
     try:
-        # Get trades
-        trades_data = fetcher.get_user_fills()
-        trades_df = processor.process_trades(trades_data)
-        
-        # Get funding
-        funding_data = fetcher.get_user_funding()
-        funding_df = processor.process_funding(funding_data)
-        
-        # Get transfers
-        transfers_data = fetcher.get_user_transfers()
-        transfers_df = processor.process_transfers(transfers_data)
-        
-        # Get account state
-        account_data = fetcher.get_account_state()
-        account_state = processor.process_account_state(account_data) if account_data else {}
-        
-        # Get open orders
-        open_orders = fetcher.get_open_orders()
-        
-        # Initialize Manual Input Handler (already done above, remove duplicate)
-        # manual_handler = ManualInputHandler()
-        
-        # Check if manual input folder exists, if not create templates
-        if not os.path.exists(manual_handler.manual_input_folder):
-            print("\n" + "═" * 80)
-            print("🆕 ERSTMALIGER START - MANUAL INPUT SYSTEM WIRD EINGERICHTET")
-            print("═" * 80)
-            manual_handler.generate_template_csvs()
-            manual_handler.print_instructions()
-        
-        # Read manual inputs from CSV files
-        print("\n" + "═" * 80)
-        print("📂 LADE MANUELLE EINTRÄGE AUS CSV-DATEIEN...")
-        print("═" * 80)
-        
-        manual_deposits_df = manual_handler.read_manual_deposits()
-        manual_trades_df = manual_handler.read_manual_trades()
-        
-        # Merge manual entries with fetched data
-        if not manual_trades_df.empty:
-            # Ensure timestamp is string for both dataframes
-            if not trades_df.empty:
-                trades_df['timestamp'] = trades_df['timestamp'].astype(str)
-            trades_df = pd.concat([trades_df, manual_trades_df], ignore_index=True)
-            trades_df = trades_df.sort_values('timestamp').reset_index(drop=True)
-            print(f"✅ {len(manual_trades_df)} manuelle Trade(s) hinzugefügt")
-        
-        if not manual_deposits_df.empty:
-            # Ensure timestamp is string for both dataframes
-            if not transfers_df.empty:
-                transfers_df['timestamp'] = transfers_df['timestamp'].astype(str)
-            transfers_df = pd.concat([transfers_df, manual_deposits_df], ignore_index=True)
-            transfers_df = transfers_df.sort_values('timestamp').reset_index(drop=True)
-            print(f"✅ {len(manual_deposits_df)} manuelle Einzahlung(en) hinzugefügt")
-        
-        print("\n" + "═" * 80)
-        print("💱 CONVERTING USD TO EUR...")
-        print("═" * 80)
-        
-        # Prepare EUR conversions
-        dataframes = [trades_df, funding_df, transfers_df]
-        converter.prepare_rates(dataframes)
-        
-        # Add EUR conversions to each dataframe
-        if not trades_df.empty:
-            print("💰 Converting trade data to EUR...")
-            trades_df = converter.add_eur_conversions(
-                trades_df, 
-                ['fee', 'closed_pnl']
-            )
-        
-        if not funding_df.empty:
-            print("� Converting funding data to EUR...")
-            funding_df = converter.add_eur_conversions(
-                funding_df, 
-                ['funding_payment']
-            )
-        
-        if not transfers_df.empty:
-            print("📤 Converting transfer data to EUR...")
-            transfers_df = converter.add_eur_conversions(
-                transfers_df, 
-                ['amount']
-            )
-        
-        print("\n" + "═" * 80)
-        print("�📊 DATA FETCHING & CONVERSION COMPLETE!")
-        print("═" * 80)
-        
-        # Create enhanced summary with EUR
-        from currency_converter import create_enhanced_summary_report
-        summary = create_enhanced_summary_report(wallet_address, trades_df, funding_df, transfers_df, account_state)
-        
-        # Add Austrian tax calculation to CLI output
-        print(summary)
-        
-        # Calculate and display tax breakdown in CLI
-        print("\n" + "═" * 80)
-        print("🇦🇹 ÖSTERREICHISCHE STEUERKALKULATION 2025")
-        print("═" * 80)
-        
-        # Create temporary tax calculator for CLI display
-        from austrian_tax_report import AustrianTaxCalculator
-        tax_calc = AustrianTaxCalculator()
-        
-        # Calculate trading income
-        total_realized_pnl_eur = trades_df['closed_pnl_eur'].sum() if not trades_df.empty and 'closed_pnl_eur' in trades_df.columns else 0
-        total_fees_eur = abs(trades_df['fee_eur'].sum()) if not trades_df.empty and 'fee_eur' in trades_df.columns else 0
-        funding_paid_eur = abs(funding_df[funding_df['funding_payment_eur'] < 0]['funding_payment_eur'].sum()) if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
-        funding_received_eur = funding_df[funding_df['funding_payment_eur'] > 0]['funding_payment_eur'].sum() if not funding_df.empty and 'funding_payment_eur' in funding_df.columns else 0
-        
-        # Raw trading result (can be negative)
-        raw_trading_result_eur = total_realized_pnl_eur + funding_received_eur - total_fees_eur - funding_paid_eur
-        
-        # CRITICAL: Taxable profit is capped at 0 for losses (Austrian tax law)
-        taxable_trading_profit_eur = max(0, raw_trading_result_eur)
-        
-        # Total taxable income (base income + only positive trading profits)
-        total_taxable_income_eur = yearly_income + taxable_trading_profit_eur
-        
-        print(f"💰 Lohn-Einkommen: €{yearly_income:,.2f}")
-        print(f" Trading-Gewinn (steuerlich): €{taxable_trading_profit_eur:,.2f}")
-        print(f"🔢 Gesamteinkommen (steuerpflichtig): €{total_taxable_income_eur:,.2f}")
-        
-        # Calculate taxes correctly
-        tax_lohn_only, _ = tax_calc.calculate_progressive_tax(max(0, yearly_income))
-        tax_with_trading, tax_breakdown = tax_calc.calculate_progressive_tax(max(0, total_taxable_income_eur))
-        trading_tax = max(0, tax_with_trading - tax_lohn_only)  # Never negative
-        
-        print(f"\n" + "═" * 80)
-        print("🇦🇹 ÖSTERREICHISCHE STEUERKALKULATION 2025")
-        print("═" * 80)
-        print(f"💸 Steuer nur auf Lohn: €{tax_lohn_only:,.2f}")
-        print(f"💸 Zusatzsteuer durch Trading: €{trading_tax:,.2f}")
-        print(f"💰 Steuer gesamt (Lohn + Trading): €{tax_with_trading:,.2f}")
-        print("─" * 80)
-        print(f"📋 FÜR STEUERERKLÄRUNG:")
-        print(f"💰 Trading-Gewinn (E1kv eintragen): €{taxable_trading_profit_eur:,.2f}")
-        print(f"💸 Zusätzlich zu überweisen: €{trading_tax:,.2f}")
-        print("─" * 80)
-        
-        if raw_trading_result_eur < 0:
-            print(f"ℹ️  Hinweis: Trading-Verluste mindern das Lohn-Einkommen nicht (Deckelung auf 0 €).")
-        
-        print(f"\n💸 DETAILLIERTE STEUERTABELLE {tax_year}:")
-        print("─────────────────────────────────────────────────────────────────────────────────")
-        
-        for bracket in tax_breakdown:
-            if bracket['bracket_income'] > 0:
-                print(f"€{bracket['bracket_income']:,.0f} -> {bracket['rate']*100:.0f}% = €{bracket['bracket_tax']:,.2f}")
-        
-        print("─────────────────────────────────────────────────────────────────────────────────")
-        
-        print("\n")
-        
-        # Generate Austrian Tax Report
-        print("\n" + "═" * 80)
-        print("🇦🇹 GENERATING AUSTRIAN TAX REPORT 2025...")
-        print("═" * 80)
-        
-        austrian_reporter = AustrianTaxReportGenerator(
-            wallet_address=wallet_address,
-            yearly_income=yearly_income,
-            tax_year=tax_year
-        )
-        zip_filename = austrian_reporter.generate_report_package(
-            trades_df=trades_df,
-            funding_df=funding_df,
-            transfers_df=transfers_df,
-            account_state=account_state,
-            base_filename=f"hyperliquid_austria_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        )
-        
-        print(f"\n✅ Austrian tax report generated successfully!")
-        print(f"� Complete report package: {zip_filename}")
-        print("🇦🇹 Report includes organized folders with CSVs and PDF tax calculation.")
-        
+        # HL_PREVIEW=1 prints a quick estimate from aggregated fills, then runs the exact pass
+        # after it and prints the exact figures below; no PDF is written
+        from preview_report import preview_enabled, run_wallet_preview
+        if preview_enabled():
+            preview_fetcher = HyperliquidFetcher(wallet_address, event_store=fetcher.event_store,
+                                                 session=fetcher.session, archive=archive, aggregate_fills=True)
+            run_wallet_preview(wallet_address, tax_year, yearly_income, preview_fetcher, converter, manual_handler)
+            # The exact run also fills the event store, so the next full report is quick
+            print("🔄 Berechne exakte Werte...")
+            tax_summary = run_wallet_preview(wallet_address, tax_year, yearly_income, fetcher, converter, manual_handler)
+            print_cli_tax_summary(tax_summary, tax_year)
+            return
+        
+        # HL_STREAMING=1 processes the history in bounded batches instead of all at once
+        from streaming_pipeline import streaming_enabled, run_wallet_report_streaming
+        report_fn = run_wallet_report_streaming if streaming_enabled() else run_wallet_report
+        report_fn(wallet_address, tax_year, yearly_income, fetcher, converter, manual_handler)
     except Exception as e:
         print(f"❌ Error occurred: {e}")
         import traceback
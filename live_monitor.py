@@ -0,0 +1,238 @@
+"""
+Live Monitor for Hyperliquid Tax Calculator
+Backfills a wallet's tax year through HyperliquidFetcher and then follows new fills,
+funding payments and ledger updates over the websocket API, so the tax estimate
+stays current without re-polling the info endpoints
+"""
+
+import argparse
+import json
+import threading
+import time
+from typing import Dict, Any, List, Callable
+
+import pandas as pd
+
+from currency_converter import CurrencyConverter, ECBRatesFetcher
+from event_store import EventStore
+from hyperliquid_fetcher import (HyperliquidFetcher, HyperliquidDataProcessor, STREAM_BATCH_SIZE,
+                                 create_price_history, filter_time_range, load_yearly_income, tax_year_bounds)
+from austrian_tax_report import AustrianTaxReportGenerator
+from manual_input_handler import ManualInputHandler
+from streaming_pipeline import RunningTotals
+
+# websockets is only needed for live mode; the report pipelines run without it
+try:
+    from websockets.sync.client import connect as ws_connect
+    from websockets.exceptions import ConnectionClosed
+except ImportError:
+    ws_connect = None
+    ConnectionClosed = OSError
+
+DEFAULT_WS_URL = "wss://api.hyperliquid.xyz/ws"
+
+# The server drops connections that stay silent for 60 seconds
+PING_INTERVAL_SECONDS = 50.0
+
+# Subscription type -> (event store endpoint, key in the message data)
+SUBSCRIPTIONS = {
+    'userFills': ('fills', 'fills'),
+    'userFundings': ('funding', 'fundings'),
+    'userNonFundingLedgerUpdates': ('ledger', 'nonFundingLedgerUpdates'),
+}
+
+class LiveMonitor:
+    """
+    Keeps the running tax totals of one wallet and tax year up to date from the websocket feed
+    Every (re)connect backfills from the event store and the info API first; events
+    from the feed are appended to the event store and only new ones change the totals
+    """
+
+    def __init__(self, wallet_address: str, tax_year: int, yearly_income: float,
+                 fetcher: HyperliquidFetcher, converter: CurrencyConverter,
+                 ws_url: str = DEFAULT_WS_URL, batch_size: int = STREAM_BATCH_SIZE):
+        if ws_connect is None:
+            raise ImportError("Live-Modus benötigt das Paket 'websockets' (pip install websockets)")
+        if fetcher.event_store is None:
+            raise ValueError("Live-Modus benötigt einen Event Store im HyperliquidFetcher")
+
+        self.wallet_address = wallet_address.lower()
+        self.tax_year = tax_year
+        self.fetcher = fetcher
+        self.converter = converter
+        self.ws_url = ws_url
+        self.batch_size = batch_size
+        self.processor = HyperliquidDataProcessor()
+        self.price_history = create_price_history(fetcher)
+        self.reporter = AustrianTaxReportGenerator(wallet_address=wallet_address,
+                                                   yearly_income=yearly_income, tax_year=tax_year)
+        self.year_start, self.year_end = tax_year_bounds(tax_year)
+        self.totals = RunningTotals()
+        self.key_fns: Dict[str, Callable[[Dict[str, Any]], str]] = {
+            'fills': fetcher._fill_key,
+            'funding': fetcher._funding_key,
+            'ledger': fetcher._ledger_key,
+        }
+        self._stop = threading.Event()
+        self._ws = None
+
+    @staticmethod
+    def funding_record(fund: Dict[str, Any]) -> Dict[str, Any]:
+        """Websocket funding payment in the userFunding response shape of the info API"""
+        return {
+            'time': fund['time'],
+            'hash': fund.get('hash', ''),
+            'delta': {
+                'type': 'funding',
+                'coin': fund['coin'],
+                'usdc': fund['usdc'],
+                'szi': fund['szi'],
+                'fundingRate': fund['fundingRate'],
+            }
+        }
+
+    def _convert(self, df: pd.DataFrame, amount_columns: List[str]) -> pd.DataFrame:
+        """EUR conversion of one batch, oldest rows first"""
+        self.converter.prepare_rates([df])
+        return self.converter.add_eur_conversions(df, amount_columns)
+
+    def _apply(self, endpoint: str, records: List[Dict[str, Any]]):
+        """Add records of the tax year to the running totals"""
+        records = filter_time_range(records, self.year_start, self.year_end)
+        if not records:
+            return
+        if endpoint == 'fills':
+            trades_df = self.price_history.value_fees(self.processor.process_trades(records).iloc[::-1])
+            self.totals.add_trades(self._convert(trades_df, ['fee', 'closed_pnl']))
+        elif endpoint == 'funding':
+            funding_df = self.processor.process_funding(records).iloc[::-1]
+            self.totals.add_funding(self._convert(funding_df, ['funding_payment']))
+        else:
+            transfers_df = self.processor.process_transfers(records).iloc[::-1]
+            self.totals.add_transfers(self._convert(transfers_df, ['amount']))
+
+    def backfill(self):
+        """Sync the tax year into the event store and rebuild the totals from it"""
+        self.fetcher.set_time_range(self.year_start, self.year_end)
+        self.totals = RunningTotals()
+        for endpoint, batches in (('fills', self.fetcher.iter_user_fills(self.batch_size)),
+                                  ('funding', self.fetcher.iter_user_funding(self.batch_size)),
+                                  ('ledger', self.fetcher.iter_user_transfers(self.batch_size))):
+            for batch in batches:
+                self._apply(endpoint, batch)
+        self.fetcher.print_failed_windows()
+        self.totals.print_summary(f"LIVE-MONITOR {self.tax_year}: Stand nach Backfill")
+        self.print_estimate("Backfill")
+
+    def handle_message(self, message: Dict[str, Any]) -> int:
+        """Store the events of one feed message and apply the new ones; returns their count"""
+        channel = message.get('channel')
+        if channel not in SUBSCRIPTIONS:
+            if channel == 'error':
+                print(f"⚠️  Websocket-Fehler: {message.get('data')}")
+            return 0
+
+        endpoint, data_key = SUBSCRIPTIONS[channel]
+        data = message.get('data') or {}
+        if str(data.get('user', self.wallet_address)).lower() != self.wallet_address:
+            return 0
+        records = data.get(data_key) or []
+        if endpoint == 'funding':
+            records = [self.funding_record(fund) for fund in records]
+
+        # Snapshots repeat recent history; the store filters out everything already counted
+        new_records = self.fetcher.event_store.add_new_events(self.wallet_address, endpoint, records,
+                                                              self.key_fns[endpoint])
+        if new_records:
+            self._apply(endpoint, new_records)
+            self.print_estimate(f"+{len(new_records)} {endpoint}")
+        return len(new_records)
+
+    def tax_summary(self) -> Dict[str, Any]:
+        return self.totals.tax_summary(self.reporter)
+
+    def print_estimate(self, reason: str):
+        """One-line tax estimate of the current totals"""
+        tax_summary = self.tax_summary()
+        print(f"🔔 [{time.strftime('%H:%M:%S')}] {reason}: "
+              f"Trading-Ergebnis €{tax_summary['raw_trading_result_eur']:,.2f} | "
+              f"steuerpflichtig €{tax_summary['taxable_trading_profit_eur']:,.2f} | "
+              f"Zusatzsteuer €{tax_summary['trading_tax']:,.2f}")
+
+    def _subscribe(self, ws):
+        for subscription_type in SUBSCRIPTIONS:
+            ws.send(json.dumps({
+                'method': 'subscribe',
+                'subscription': {'type': subscription_type, 'user': self.wallet_address}
+            }))
+
+    def _listen(self, ws):
+        """Process feed messages until the connection closes or stop() is called"""
+        while not self._stop.is_set():
+            try:
+                raw = ws.recv(timeout=PING_INTERVAL_SECONDS)
+            except TimeoutError:
+                ws.send(json.dumps({'method': 'ping'}))
+                continue
+            self.handle_message(json.loads(raw))
+
+    def run(self):
+        """Backfill, subscribe and follow the feed until stop(); reconnects with backoff"""
+        print("═" * 80)
+        print(f"📡 LIVE-MONITOR: {self.wallet_address}, Steuerjahr {self.tax_year} ({self.ws_url})")
+        print("═" * 80)
+
+        attempt = 0
+        while not self._stop.is_set():
+            try:
+                self.backfill()
+                with ws_connect(self.ws_url) as ws:
+                    self._ws = ws
+                    # The initial snapshot of each subscription covers events since the backfill
+                    self._subscribe(ws)
+                    attempt = 0
+                    self._listen(ws)
+            except (ConnectionClosed, OSError) as e:
+                if self._stop.is_set():
+                    break
+                delay = HyperliquidFetcher._backoff_seconds(attempt)
+                attempt += 1
+                print(f"⚠️  Websocket getrennt ({e}), neuer Versuch in {delay:.1f}s")
+                self._stop.wait(delay)
+            finally:
+                self._ws = None
+
+    def stop(self):
+        """Stop run() from another thread"""
+        self._stop.set()
+        ws = self._ws
+        if ws is not None:
+            ws.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperliquid Steuerschätzung live über den Websocket-Feed")
+    parser.add_argument("wallet", help="Wallet-Adresse (0x...)")
+    parser.add_argument("--tax-year", type=int, default=time.localtime().tm_year, help="Steuerjahr")
+    parser.add_argument("--ws-url", default=DEFAULT_WS_URL, help="Websocket-Endpunkt")
+    parser.add_argument("--api-url", default=None, help="Info-API-Endpunkt für den Backfill")
+    parser.add_argument("--db", default="hyperliquid_events.db", help="Pfad des lokalen Event Stores")
+    parser.add_argument("--manual-input-folder", default="manual_input", help="Ordner mit manuellen CSV-Eingaben")
+    args = parser.parse_args()
+
+    fetcher = HyperliquidFetcher(args.wallet, event_store=EventStore(args.db))
+    if args.api_url:
+        fetcher.api_url = args.api_url
+    rates_fetcher = ECBRatesFetcher()
+    converter = CurrencyConverter(rates_fetcher)
+    manual_handler = ManualInputHandler(args.manual_input_folder, rates_fetcher=rates_fetcher)
+    yearly_income = load_yearly_income(manual_handler, args.tax_year)
+
+    monitor = LiveMonitor(args.wallet, args.tax_year, yearly_income, fetcher, converter, ws_url=args.ws_url)
+    try:
+        monitor.run()
+    except KeyboardInterrupt:
+        monitor.stop()
+        print("\n👋 Live-Monitor beendet")
+
+if __name__ == "__main__":
+    main()
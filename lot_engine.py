@@ -0,0 +1,292 @@
+"""
+Cost-Basis Lot Engine for Hyperliquid Tax Calculator
+Matches disposals against acquisition lots per coin (FIFO or moving average) with the
+EUR cost basis fixed at the ECB rate of the acquisition day. Coins are independent,
+so large accounts are matched in a process pool.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from position_engine import SIZE_SCALE, _to_units
+
+# Environment variable selecting the matching method (fifo or average)
+COST_BASIS_ENV = "HL_COST_BASIS"
+
+COST_BASIS_METHODS = ('fifo', 'average')
+DEFAULT_COST_BASIS_METHOD = 'fifo'
+
+# Below this many fills the pool's start-up costs more than it saves
+PARALLEL_MIN_FILLS = 200_000
+
+DISPOSAL_COLUMNS = ['time_ms', 'coin', 'side', 'quantity', 'unknown_qty', 'entry_usd', 'exit_usd',
+                    'gain_usd', 'entry_eur', 'exit_eur', 'gain_eur', 'method']
+HOLDING_COLUMNS = ['coin', 'side', 'quantity', 'unknown_qty', 'cost_usd', 'cost_eur', 'method']
+
+@dataclass
+class CostBasisResult:
+    """
+    disposals: one row per fill that reduces a position. entry_* is the matched cost
+               basis (the opening value of a short), exit_* the disposal value; both and
+               the gain cover the part with known basis, unknown_qty the rest
+    holdings: lots still open after the last fill, per coin
+    """
+    method: str
+    disposals: pd.DataFrame
+    holdings: pd.DataFrame
+
+    @property
+    def unknown_qty(self) -> float:
+        return float(self.disposals['unknown_qty'].sum()) if not self.disposals.empty else 0.0
+
+def cost_basis_method() -> str:
+    """Matching method from HL_COST_BASIS, FIFO unless set to a known method"""
+    method = os.environ.get(COST_BASIS_ENV, "").strip().lower()
+    return method if method in COST_BASIS_METHODS else DEFAULT_COST_BASIS_METHOD
+
+# Per-coin input: (coin, times, signed units, prices, usd_eur rates, units held before the first fill)
+CoinFills = Tuple[str, np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]
+
+def _match_fifo(sizes: list, prices: list, rates: list, start: int):
+    """
+    FIFO over an array-backed lot queue: lots live in preallocated lists, the open ones
+    between head and tail. Quantities are integer units so lots empty out exactly.
+    """
+    n = len(sizes)
+    lot_qty = [0] * (n + 1)
+    lot_usd = [0.0] * (n + 1)
+    lot_eur = [0.0] * (n + 1)
+    head = tail = 0
+    side = 0
+    if start:
+        # Held before the first fill: the acquisition is not in the data
+        lot_qty[0], lot_usd[0], lot_eur[0] = abs(start), float('nan'), float('nan')
+        tail, side = 1, (1 if start > 0 else -1)
+
+    rows, qty, unknown, entry_usd, entry_eur, sides = [], [], [], [], [], []
+    for i in range(n):
+        delta = sizes[i]
+        if not delta:
+            continue
+        direction = 1 if delta > 0 else -1
+        remaining = abs(delta)
+        if side and direction != side:
+            matched = missing = 0
+            cost_usd = cost_eur = 0.0
+            while remaining and head < tail:
+                take = min(lot_qty[head], remaining)
+                if lot_usd[head] != lot_usd[head]:
+                    missing += take
+                else:
+                    cost_usd += take * lot_usd[head]
+                    cost_eur += take * lot_eur[head]
+                lot_qty[head] -= take
+                remaining -= take
+                matched += take
+                if not lot_qty[head]:
+                    head += 1
+            rows.append(i)
+            qty.append(matched)
+            unknown.append(missing)
+            entry_usd.append(cost_usd)
+            entry_eur.append(cost_eur)
+            sides.append(side)
+            if head == tail:
+                head = tail = 0
+                side = 0
+        if remaining:
+            lot_qty[tail], lot_usd[tail], lot_eur[tail] = remaining, prices[i], prices[i] * rates[i]
+            tail += 1
+            side = direction
+
+    held = lot_qty[head:tail]
+    held_usd = lot_usd[head:tail]
+    held_eur = lot_eur[head:tail]
+    holding = (side, sum(held), sum(q for q, p in zip(held, held_usd) if p != p),
+               sum(q * p for q, p in zip(held, held_usd) if p == p),
+               sum(q * p for q, p, u in zip(held, held_eur, held_usd) if u == u))
+    return (rows, qty, unknown, entry_usd, entry_eur, sides), holding
+
+def _match_average(sizes: list, prices: list, rates: list, start: int):
+    """
+    Moving average: one pool per coin with a single average price per unit; units with
+    unknown basis are kept apart and leave the pool pro rata
+    """
+    rows, qty, unknown, entry_usd, entry_eur, sides = [], [], [], [], [], []
+    known = 0
+    missing = abs(start)
+    avg_usd = avg_eur = 0.0
+    side = (1 if start > 0 else -1) if start else 0
+    for i in range(len(sizes)):
+        delta = sizes[i]
+        if not delta:
+            continue
+        direction = 1 if delta > 0 else -1
+        remaining = abs(delta)
+        if side and direction != side:
+            held = known + missing
+            matched = min(remaining, held)
+            take_missing = round(matched * missing / held)
+            take_known = matched - take_missing
+            rows.append(i)
+            qty.append(matched)
+            unknown.append(take_missing)
+            entry_usd.append(take_known * avg_usd)
+            entry_eur.append(take_known * avg_eur)
+            sides.append(side)
+            known -= take_known
+            missing -= take_missing
+            remaining -= matched
+            if not known and not missing:
+                side = 0
+                avg_usd = avg_eur = 0.0
+        if remaining:
+            total = known + remaining
+            avg_usd = (known * avg_usd + remaining * prices[i]) / total
+            avg_eur = (known * avg_eur + remaining * prices[i] * rates[i]) / total
+            known = total
+            side = direction
+
+    holding = (side, known + missing, missing, known * avg_usd, known * avg_eur)
+    return (rows, qty, unknown, entry_usd, entry_eur, sides), holding
+
+_MATCHERS = {'fifo': _match_fifo, 'average': _match_average}
+
+def _match_coins(coins: List[CoinFills], method: str) -> List[tuple]:
+    """Match a chunk of coins; top-level so the process pool can pickle it"""
+    match = _MATCHERS[method]
+    results = []
+    for coin, times, sizes, prices, rates, start in coins:
+        disposals, holding = match(sizes.tolist(), prices.tolist(), rates.tolist(), start)
+        results.append((coin, disposals, holding))
+    return results
+
+def _chunk_coins(coins: List[CoinFills], chunks: int) -> List[List[CoinFills]]:
+    """Spread coins over chunks of similar fill counts, largest coins first"""
+    buckets = [[] for _ in range(chunks)]
+    loads = [0] * chunks
+    for coin in sorted(coins, key=lambda c: len(c[2]), reverse=True):
+        target = loads.index(min(loads))
+        buckets[target].append(coin)
+        loads[target] += len(coin[2])
+    return [bucket for bucket in buckets if bucket]
+
+def _run_matching(coins: List[CoinFills], method: str, total_fills: int,
+                  max_workers: Optional[int]) -> List[tuple]:
+    workers = max_workers or os.cpu_count() or 1
+    if total_fills < PARALLEL_MIN_FILLS or workers < 2 or len(coins) < 2:
+        return _match_coins(coins, method)
+    chunks = _chunk_coins(coins, min(workers * 4, len(coins)))
+    # Spawned workers: forking a process that runs fetch threads would copy their held locks
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        results = {result[0]: result for chunk in pool.map(_match_coins, chunks, [method] * len(chunks))
+                   for result in chunk}
+    # Back in coin order so the output does not depend on the chunking
+    return [results[coin[0]] for coin in coins]
+
+def match_cost_basis(trades_df: pd.DataFrame, method: Optional[str] = None,
+                     max_workers: Optional[int] = None, start_ms: Optional[int] = None,
+                     end_ms: Optional[int] = None) -> CostBasisResult:
+    """
+    Match all fills of a trades frame (exchange and manual trades) against their lots
+    Pass the full history so lots bought before the period keep their basis; only
+    disposals inside [start_ms, end_ms] are reported. EUR values need the usd_eur_rate
+    column of CurrencyConverter.add_eur_conversions; without it only USD is filled
+    """
+    method = method or cost_basis_method()
+    if method not in _MATCHERS:
+        raise ValueError(f"Unknown cost basis method '{method}', expected one of {COST_BASIS_METHODS}")
+    empty = CostBasisResult(method, pd.DataFrame(columns=DISPOSAL_COLUMNS), pd.DataFrame(columns=HOLDING_COLUMNS))
+    if trades_df.empty:
+        return empty
+
+    sign = np.where((trades_df['side'] == 'Buy').to_numpy(), 1, -1)
+    sizes = sign * _to_units(trades_df['size'])
+    starts = (_to_units(trades_df['start_position']) if 'start_position' in trades_df.columns
+              else np.zeros(len(trades_df), dtype=np.int64))
+    times = trades_df['time_ms'].to_numpy(dtype='int64')
+    prices = trades_df['price'].to_numpy(dtype=float)
+    rates = (trades_df['usd_eur_rate'].to_numpy(dtype=float) if 'usd_eur_rate' in trades_df.columns
+             else np.full(len(trades_df), np.nan))
+    coin_index = pd.Categorical(trades_df['coin'].astype(str))
+
+    # Per coin in time order, fills of one millisecond along their startPosition chain
+    order = np.lexsort((starts * sign, times, coin_index.codes))
+    bounds = np.flatnonzero(np.diff(coin_index.codes[order])) + 1
+    coins = [(coin_index.categories[coin_index.codes[rows[0]]], times[rows], sizes[rows], prices[rows],
+              rates[rows], int(starts[rows[0]])) for rows in np.split(order, bounds)]
+
+    fills_by_coin = {coin[0]: coin for coin in coins}
+    disposals, holdings = [], []
+    for coin, matched, holding in _run_matching(coins, method, len(trades_df), max_workers):
+        _, coin_times, _, coin_prices, coin_rates, _ = fills_by_coin[coin]
+        rows, qty, unknown, entry_usd, entry_eur, sides = matched
+        side, held, held_unknown, cost_usd, cost_eur = holding
+        if held:
+            holdings.append((coin, 'LONG' if side > 0 else 'SHORT', held / SIZE_SCALE,
+                             held_unknown / SIZE_SCALE, cost_usd / SIZE_SCALE, cost_eur / SIZE_SCALE))
+        if not rows:
+            continue
+        rows = np.array(rows, dtype=np.int64)
+        qty = np.array(qty, dtype=np.int64)
+        unknown = np.array(unknown, dtype=np.int64)
+        sides = np.array(sides, dtype=np.int64)
+        exit_usd = (qty - unknown) * coin_prices[rows] / SIZE_SCALE
+        exit_eur = exit_usd * coin_rates[rows]
+        entry_usd = np.array(entry_usd) / SIZE_SCALE
+        entry_eur = np.array(entry_eur) / SIZE_SCALE
+        disposals.append(pd.DataFrame({
+            'time_ms': coin_times[rows],
+            'coin': coin,
+            'side': np.where(sides > 0, 'LONG', 'SHORT'),
+            'quantity': qty / SIZE_SCALE,
+            'unknown_qty': unknown / SIZE_SCALE,
+            'entry_usd': entry_usd,
+            'exit_usd': exit_usd,
+            'gain_usd': sides * (exit_usd - entry_usd),
+            'entry_eur': entry_eur,
+            'exit_eur': exit_eur,
+            'gain_eur': sides * (exit_eur - entry_eur),
+        }))
+
+    disposals_df = (pd.concat(disposals, ignore_index=True).sort_values('time_ms', kind='stable')
+                    .reset_index(drop=True) if disposals else empty.disposals.drop(columns='method'))
+    if start_ms is not None:
+        disposals_df = disposals_df[disposals_df['time_ms'] >= start_ms]
+    if end_ms is not None:
+        disposals_df = disposals_df[disposals_df['time_ms'] <= end_ms]
+    disposals_df = disposals_df.reset_index(drop=True)
+    disposals_df['method'] = method
+    holdings_df = pd.DataFrame(holdings, columns=HOLDING_COLUMNS[:-1])
+    holdings_df['method'] = method
+    return CostBasisResult(method, disposals_df, holdings_df)
+
+def print_cost_basis(result: CostBasisResult, closed_pnl_usd: float = 0.0, closed_pnl_eur: float = 0.0,
+                     max_holdings: int = 10):
+    """Console summary of the matched gains next to the closedPnl the exchange reports"""
+    disposals = result.disposals
+    if disposals.empty and result.holdings.empty:
+        return
+    print("\n" + "═" * 80)
+    print(f"📚 ANSCHAFFUNGSKOSTEN ({result.method.upper()}): {len(disposals)} Veräußerung(en)")
+    print("═" * 80)
+    if not disposals.empty:
+        print(f"💶 Realisiert: ${disposals['gain_usd'].sum():,.2f} | €{disposals['gain_eur'].sum():,.2f} "
+              f"(closedPnl: ${closed_pnl_usd:,.2f} | €{closed_pnl_eur:,.2f})")
+    if result.unknown_qty:
+        unknown = disposals.groupby('coin', observed=True)['unknown_qty'].sum()
+        unknown = unknown[unknown > 0]
+        print(f"⚠️  Anschaffung vor dem Zeitraum unbekannt ({len(unknown)} Coin(s)): "
+              + ", ".join(f"{coin} {qty:,.4f}" for coin, qty in unknown.head(10).items()))
+    for _, lot in result.holdings.head(max_holdings).iterrows():
+        print(f"   Offen {lot['coin']} {lot['side']}: {lot['quantity']:,.4f} "
+              f"(Basis ${lot['cost_usd']:,.2f} | €{lot['cost_eur']:,.2f})")
+    if len(result.holdings) > max_holdings:
+        print(f"   ... und {len(result.holdings) - max_holdings} weitere offene Position(en)")
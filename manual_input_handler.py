@@ -5,25 +5,27 @@ User edits CSV files with their data, system processes them automatically
 
 import pandas as pd
 import os
-from datetime import datetime
-from typing import Dict, Tuple
+from datetime import datetime, timezone
+from typing import Dict, Tuple, Optional
 from currency_converter import ECBRatesFetcher
+from http_archive import ArchiveMiss
 
 
 class ManualInputHandler:
     """Handles manual input via CSV files"""
     
-    def __init__(self, manual_input_folder: str = "manual_input"):
+    def __init__(self, manual_input_folder: str = "manual_input", rates_fetcher: Optional[ECBRatesFetcher] = None):
         self.manual_input_folder = manual_input_folder
         self.deposits_csv = os.path.join(manual_input_folder, "manual_deposits.csv")
         self.trades_csv = os.path.join(manual_input_folder, "manual_trades.csv")
         self.income_csv = os.path.join(manual_input_folder, "monthly_income.csv")
-        self.converter = ECBRatesFetcher()
+        self.converter = rates_fetcher or ECBRatesFetcher()
         
     def create_manual_input_folder(self):
         """Create manual_input folder if it doesn't exist"""
         if not os.path.exists(self.manual_input_folder):
-            os.makedirs(self.manual_input_folder)
+            # exist_ok: batch workers for the same wallet may create it concurrently
+            os.makedirs(self.manual_input_folder, exist_ok=True)
             print(f"✅ Ordner erstellt: {self.manual_input_folder}/")
         
     def generate_template_csvs(self):
@@ -178,10 +180,17 @@ class ManualInputHandler:
             else:
                 return pd.DataFrame()
                 
+        except ArchiveMiss:
+            raise
         except Exception as e:
             print(f"❌ Fehler beim Lesen von {self.deposits_csv}: {e}")
             return pd.DataFrame()
     
+    @staticmethod
+    def _utc_ms(date: datetime) -> int:
+        """Epoch ms of a CSV date, taken as midnight UTC like the ECB rate date"""
+        return int(date.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    
     def _process_deposit_row(self, row: pd.Series) -> Dict:
         """Process a single deposit row with EUR/USD conversion"""
         try:
@@ -213,8 +222,7 @@ class ManualInputHandler:
                 return None
             
             return {
-                'timestamp': deposit_date.strftime("%Y-%m-%d %H:%M:%S"),
-                'time': deposit_date.strftime("%Y-%m-%d %H:%M:%S"),
+                'time_ms': self._utc_ms(deposit_date),
                 'type': trans_type,
                 'amount': amount_usd,
                 'usd': amount_usd,
@@ -267,6 +275,8 @@ class ManualInputHandler:
             else:
                 return pd.DataFrame()
                 
+        except ArchiveMiss:
+            raise
         except Exception as e:
             print(f"❌ Fehler beim Lesen von {self.trades_csv}: {e}")
             return pd.DataFrame()
@@ -315,8 +325,7 @@ class ManualInputHandler:
                 fee = -abs(fee)
             
             return {
-                'timestamp': trade_date.strftime("%Y-%m-%d %H:%M:%S"),
-                'time': trade_date.strftime("%Y-%m-%d %H:%M:%S"),
+                'time_ms': self._utc_ms(trade_date),
                 'coin': coin,
                 'side': side_formatted,
                 'size': size,
@@ -371,6 +380,7 @@ class ManualInputHandler:
 
 def test_manual_input_system():
     """Test the manual input system"""
+    from austrian_tax_report import format_time_ms
     handler = ManualInputHandler()
     
     print("🧪 TESTE MANUAL INPUT SYSTEM")
@@ -392,11 +402,13 @@ def test_manual_input_system():
     
     if not deposits_df.empty:
         print(f"\n💰 EINZAHLUNGEN:")
-        print(deposits_df[['time', 'type', 'usd', 'amount_eur', 'description']].to_string())
+        deposits_df.insert(0, 'date', format_time_ms(deposits_df['time_ms']))
+        print(deposits_df[['date', 'type', 'usd', 'amount_eur', 'description']].to_string())
     
     if not trades_df.empty:
         print(f"\n📊 TRADES:")
-        print(trades_df[['time', 'coin', 'side', 'size', 'price']].to_string())
+        trades_df.insert(0, 'date', format_time_ms(trades_df['time_ms']))
+        print(trades_df[['date', 'coin', 'side', 'size', 'price']].to_string())
 
 
 if __name__ == "__main__":
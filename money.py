@@ -0,0 +1,70 @@
+"""
+Exact Money Arithmetic for Hyperliquid Tax Calculator
+USD and EUR amounts as int64 micro-units: each row is rounded once when it is
+converted and totals are integer sums, so they are bit-identical across runs,
+batch sizes and machines
+"""
+
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from env_flags import env_enabled
+
+# Environment variable that makes CurrencyConverter add exact micro-unit columns
+EXACT_MONEY_ENV = "HL_EXACT_MONEY"
+
+# 1 USD (or EUR) = 1_000_000 micro-units, the precision of USDC on Hyperliquid
+MICROS = 1_000_000
+
+# '<amount column>_micros' holds the exact int64 twin of a float amount column
+MICROS_SUFFIX = "_micros"
+
+def exact_money_enabled() -> bool:
+    """True if HL_EXACT_MONEY is set to a truthy value"""
+    return env_enabled(EXACT_MONEY_ENV)
+
+def micros_column(column: str) -> str:
+    return column + MICROS_SUFFIX
+
+def to_micros(values) -> np.ndarray:
+    """
+    Amounts as int64 micro-units, rounded to the nearest micro-unit
+    Exact for API decimals with up to 6 places below 10^9; NaN counts as 0 like in pandas sums
+    """
+    amounts = np.nan_to_num(np.asarray(values, dtype=float))
+    return np.rint(amounts * MICROS).astype(np.int64)
+
+def convert_micros(micros: np.ndarray, rates: np.ndarray) -> np.ndarray:
+    """Micro-units converted at per-row rates, rounded once per row"""
+    return np.rint(micros * np.asarray(rates, dtype=float)).astype(np.int64)
+
+def from_micros(micros: int) -> float:
+    """Display value of an exact micro-unit total"""
+    return micros / MICROS
+
+def sum_micros(df: pd.DataFrame, column: str, sign: int = 0) -> Optional[int]:
+    """
+    Exact integer sum of the micro-unit twin of column, or None if df has none
+    sign=1 sums only positive amounts, sign=-1 only negative ones
+    """
+    exact_column = micros_column(column)
+    if df.empty or exact_column not in df.columns:
+        return None
+    micros = df[exact_column].to_numpy(dtype=np.int64)
+    if sign:
+        micros = micros[micros * sign > 0]
+    return int(micros.sum())
+
+def money_sum(df: pd.DataFrame, column: str, sign: int = 0) -> float:
+    """Sum of an amount column; exact if df carries micro-unit columns, float otherwise"""
+    if df.empty or column not in df.columns:
+        return 0.0
+    micros = sum_micros(df, column, sign)
+    if micros is not None:
+        return from_micros(micros)
+    amounts = df[column]
+    if sign:
+        amounts = amounts[amounts * sign > 0]
+    return float(amounts.sum())
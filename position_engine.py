@@ -0,0 +1,311 @@
+"""
+Position Timeline Engine for Hyperliquid Tax Calculator
+Replays fills per coin into a position timeline with group-wise cumulative sums,
+checks it against the startPosition the API reports for every fill and summarizes
+each position (holding period, average entry, realized PnL)
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+# Sizes are replayed as int64 multiples of 1e-8 so cumulative sums stay exact
+SIZE_SCALE = 10 ** 8
+
+# Manual trades (ManualInputHandler) happened elsewhere and carry no position data
+MANUAL_DIRECTION_PREFIX = 'MANUAL_'
+
+HOUR_MS = 60 * 60 * 1000
+
+@dataclass
+class PositionTimeline:
+    """
+    fills: exchange fills in replay order with position_before/position_after,
+           position_id (0 = no open position) and gap (startPosition did not match)
+    positions: one row per position, from opening (or first seen) to flat or flip
+    gaps: fills whose startPosition differs from the replayed position, i.e. missing fills
+    """
+    fills: pd.DataFrame
+    positions: pd.DataFrame
+    gaps: pd.DataFrame
+
+    @property
+    def complete(self) -> bool:
+        return self.gaps.empty
+
+def _to_units(values) -> np.ndarray:
+    return np.rint(np.nan_to_num(np.asarray(values, dtype=float)) * SIZE_SCALE).astype(np.int64)
+
+def _empty_timeline() -> PositionTimeline:
+    positions = pd.DataFrame(columns=['position_id', 'coin', 'side', 'open_time_ms', 'close_time_ms',
+                                      'holding_hours', 'max_size', 'avg_entry_px', 'fills',
+                                      'realized_pnl', 'status', 'complete', 'gaps'])
+    gaps = pd.DataFrame(columns=['coin', 'time_ms', 'expected_start', 'reported_start', 'missing_size'])
+    return PositionTimeline(pd.DataFrame(), positions, gaps)
+
+def build_position_timeline(trades_df: pd.DataFrame) -> PositionTimeline:
+    """
+    Rebuild the position history of all coins in a trades frame (processed fills)
+    Runs in a handful of vectorized passes, so millions of fills take seconds
+    """
+    if trades_df.empty or 'start_position' not in trades_df.columns:
+        return _empty_timeline()
+    fills = trades_df[~trades_df['direction'].str.startswith(MANUAL_DIRECTION_PREFIX, na=False)]
+    if fills.empty:
+        return _empty_timeline()
+
+    sign = np.where((fills['side'] == 'Buy').to_numpy(), 1, -1)
+    delta = sign * _to_units(fills['size'])
+    reported = _to_units(fills['start_position'])
+    times = fills['time_ms'].to_numpy(dtype='int64')
+    coin_codes = pd.Categorical(fills['coin']).codes
+
+    # Per coin in time order; fills of one millisecond follow their startPosition chain
+    order = np.lexsort((reported * sign, times, coin_codes))
+    fills = fills.iloc[order].reset_index(drop=True)
+    delta, reported, times, coin_codes = delta[order], reported[order], times[order], coin_codes[order]
+    n = len(fills)
+
+    # Continuity: each fill must start where the previous fill of its coin ended
+    coin_first = np.ones(n, dtype=bool)
+    coin_first[1:] = coin_codes[1:] != coin_codes[:-1]
+    expected = np.empty(n, dtype=np.int64)
+    expected[0] = reported[0]
+    expected[1:] = reported[:-1] + delta[:-1]
+    gap = ~coin_first & (reported != expected)
+
+    # Replay: cumulative sums re-anchored on startPosition at each coin start and gap
+    segment_start = coin_first | gap
+    starts = np.flatnonzero(segment_start)
+    segment = np.cumsum(segment_start) - 1
+    cumulative = np.cumsum(delta)
+    offset = cumulative[starts] - delta[starts]
+    before = reported[starts][segment] + cumulative - delta - offset[segment]
+    after = before + delta
+    previous_after = np.zeros(n, dtype=np.int64)
+    previous_after[1:] = after[:-1]
+    previous_after[coin_first] = 0
+
+    # A position opens from flat or on a flip; one that is already open at a segment start
+    # (and does not continue the previous position) is inherited with unknown entries
+    flip = (before != 0) & (after != 0) & (np.sign(before) != np.sign(after))
+    continues = (previous_after != 0) & (np.sign(before) == np.sign(previous_after))
+    inherited = segment_start & (before != 0) & ~continues
+    opens = (after != 0) & ((before == 0) | flip)
+    position_id = np.cumsum(inherited.astype(np.int64) + opens)
+    position_id[(before == 0) & (after == 0)] = 0
+    inherited_id = position_id - (inherited & opens)
+    previous_id = np.zeros(n, dtype=np.int64)
+    previous_id[1:] = position_id[:-1]
+    previous_id[coin_first] = 0
+    # The closing part of a flip belongs to the position before it
+    owner = position_id - flip
+    closes = (before != 0) & ((after == 0) | flip)
+    # Positions whose closing fills are missing end at the gap
+    lost = gap & (previous_after != 0) & ~continues
+
+    # Quantity added to the position by each fill, at its fill price
+    added = np.where(opens, np.abs(after), np.maximum(np.abs(after) - np.abs(before), 0)) / SIZE_SCALE
+    prices = fills['price'].to_numpy(dtype=float)
+
+    size = int(position_id.max()) + 1
+    open_rows = np.concatenate([np.flatnonzero(inherited), np.flatnonzero(opens)])
+    open_ids = np.concatenate([inherited_id[inherited], position_id[opens]])
+    open_sides = np.concatenate([np.sign(before[inherited]), np.sign(after[opens])])
+    open_rows = open_rows[np.argsort(open_ids, kind='stable')]
+    open_sides = open_sides[np.argsort(open_ids, kind='stable')]
+    ids = np.arange(1, size)
+
+    close_time = np.full(size, -1, dtype=np.int64)
+    close_time[owner[closes]] = times[closes]
+    close_time[previous_id[lost]] = times[lost]
+    added_total = np.bincount(position_id, weights=added, minlength=size)
+    entry_notional = np.bincount(position_id, weights=added * prices, minlength=size)
+    max_size = np.zeros(size)
+    np.maximum.at(max_size, position_id, np.abs(after) / SIZE_SCALE)
+    np.maximum.at(max_size, inherited_id[inherited], np.abs(before[inherited]) / SIZE_SCALE)
+    fill_counts = np.bincount(position_id, minlength=size) + np.bincount(owner[flip], minlength=size)
+    pnl = np.bincount(owner, weights=fills['closed_pnl'].to_numpy(dtype=float), minlength=size)
+    gap_counts = np.bincount(np.where(lost, previous_id, position_id)[gap], minlength=size)
+    incomplete = np.zeros(size, dtype=bool)
+    incomplete[inherited_id[inherited]] = True
+    incomplete[previous_id[lost]] = True
+
+    open_time = times[open_rows]
+    closed = close_time[1:] >= 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_entry = entry_notional[1:] / added_total[1:]
+    positions = pd.DataFrame({
+        'position_id': ids,
+        'coin': fills['coin'].iloc[open_rows].astype(str).to_numpy(),
+        'side': np.where(open_sides > 0, 'LONG', 'SHORT'),
+        'open_time_ms': open_time,
+        'close_time_ms': pd.array(np.where(closed, close_time[1:], 0), dtype='Int64'),
+        'holding_hours': np.where(closed, (close_time[1:] - open_time) / HOUR_MS, np.nan),
+        'max_size': max_size[1:],
+        'avg_entry_px': avg_entry,
+        'fills': fill_counts[1:],
+        'realized_pnl': pnl[1:],
+        'status': np.where(closed, 'closed', 'open'),
+        'complete': ~incomplete[1:] & (gap_counts[1:] == 0),
+        'gaps': gap_counts[1:]
+    })
+    positions.loc[~closed, 'close_time_ms'] = pd.NA
+
+    gaps = pd.DataFrame({
+        'coin': fills['coin'][gap].astype(str).to_numpy(),
+        'time_ms': times[gap],
+        'expected_start': expected[gap] / SIZE_SCALE,
+        'reported_start': reported[gap] / SIZE_SCALE,
+        'missing_size': (reported[gap] - expected[gap]) / SIZE_SCALE
+    })
+
+    fills = fills.assign(position_before=before / SIZE_SCALE, position_after=after / SIZE_SCALE,
+                         position_id=position_id, gap=gap)
+    return PositionTimeline(fills, positions, gaps)
+
+def print_position_timeline(timeline: PositionTimeline, max_gaps: int = 10):
+    """Console summary of the replayed positions and any gaps in the fill history"""
+    positions = timeline.positions
+    if positions.empty:
+        return
+    closed = positions[positions['status'] == 'closed']
+    print("\n" + "═" * 80)
+    print(f"📐 POSITIONEN: {len(positions)} ({len(closed)} geschlossen, {len(positions) - len(closed)} offen)")
+    print("═" * 80)
+    if not closed.empty:
+        print(f"⏱️  Haltedauer: Median {closed['holding_hours'].median():,.1f}h | "
+              f"Maximum {closed['holding_hours'].max():,.1f}h")
+    for _, pos in positions[positions['status'] == 'open'].iterrows():
+        print(f"   {pos['coin']} {pos['side']}: max {pos['max_size']:,.4f} @ Ø ${pos['avg_entry_px']:,.4f}")
+    if timeline.complete:
+        print("✅ Fill-Historie lückenlos (startPosition stimmt bei allen Fills)")
+        return
+    print(f"⚠️  {len(timeline.gaps)} Lücke(n) in der Fill-Historie - vermutlich fehlende Fills:")
+    for _, gap in timeline.gaps.head(max_gaps).iterrows():
+        print(f"   {gap['coin']} @ {gap['time_ms']}: erwartet {gap['expected_start']:,.4f}, "
+              f"gemeldet {gap['reported_start']:,.4f} (Δ {gap['missing_size']:,.4f})")
+
+CARRY_COLUMNS = ['position_id', 'coin', 'side', 'open_time_ms', 'close_time_ms', 'status',
+                 'realized_pnl_usd', 'fee_usd', 'funding_usd', 'funding_payments', 'net_usd',
+                 'realized_pnl_eur', 'fee_eur', 'funding_eur', 'net_eur']
+
+@dataclass
+class PositionCarry:
+    """
+    positions: per position realized PnL, fees and funding in USD and EUR (net = PnL - fees + funding)
+    funding: the funding rows with the position_id they were charged on (0 = no replayed position)
+             and side_mismatch where the position size the API reports has a different sign
+             than the attributed position
+    """
+    positions: pd.DataFrame
+    funding: pd.DataFrame
+
+    @property
+    def unattributed(self) -> pd.DataFrame:
+        return self.funding[self.funding['position_id'] == 0]
+
+
+def attribute_funding(timeline: PositionTimeline, funding_df: pd.DataFrame) -> PositionCarry:
+    """
+    Charge every funding payment to the position of its coin that was open at the payment time
+    Sorted as-of joins against the replayed fills: the position after the last fill before the
+    payment, or for payments before a coin's first fill the position that fill started in.
+    EUR totals need the _eur columns of CurrencyConverter.add_eur_conversions on both frames.
+    """
+    positions = timeline.positions
+    fills = timeline.fills
+    size = len(positions) + 1
+    funding = funding_df.copy() if not funding_df.empty else pd.DataFrame(columns=['time_ms', 'coin', 'funding_payment'])
+
+    # Position held after and before each fill (0 = flat); the closing part of a flip is the old position
+    position_ids = pd.DataFrame(columns=['time_ms', 'coin_code', 'after_id', 'before_id'])
+    if not fills.empty:
+        before = fills['position_before'].to_numpy(dtype=float)
+        after = fills['position_after'].to_numpy(dtype=float)
+        ids = fills['position_id'].to_numpy(dtype=np.int64)
+        flip = np.sign(before) * np.sign(after) < 0
+        position_ids = pd.DataFrame({
+            'time_ms': fills['time_ms'].to_numpy(dtype=np.int64),
+            'after_id': np.where(after != 0, ids, 0),
+            'before_id': np.where(before != 0, ids - flip, 0)
+        })
+
+    funding['position_id'] = np.zeros(len(funding), dtype=np.int64)
+    if not funding.empty and not position_ids.empty:
+        # Both sides keyed by codes of one shared coin index
+        fill_coins, funding_coins = pd.Categorical(fills['coin']), pd.Categorical(funding['coin'])
+        coins = fill_coins.categories.union(funding_coins.categories)
+        position_ids['coin_code'] = fill_coins.set_categories(coins).codes
+        payments = pd.DataFrame({'time_ms': funding['time_ms'].to_numpy(dtype=np.int64),
+                                 'coin_code': funding_coins.set_categories(coins).codes,
+                                 'row': np.arange(len(funding))}).sort_values('time_ms', kind='stable')
+        position_ids = position_ids.sort_values('time_ms', kind='stable')
+        # Funding is charged on the position held up to the payment time
+        held = pd.merge_asof(payments, position_ids[['time_ms', 'coin_code', 'after_id']], on='time_ms',
+                             by='coin_code', allow_exact_matches=False)
+        first = pd.merge_asof(payments, position_ids[['time_ms', 'coin_code', 'before_id']], on='time_ms',
+                              by='coin_code', direction='forward')
+        attributed = np.empty(len(funding), dtype=np.int64)
+        attributed[held['row'].to_numpy()] = held['after_id'].fillna(first['before_id']).fillna(0)
+        funding['position_id'] = attributed
+
+    position_id = funding['position_id'].to_numpy(dtype=np.int64)
+    if 'position_size' in funding.columns:
+        sides = np.concatenate([[0], np.where(positions['side'].to_numpy() == 'LONG', 1, -1)])
+        # Unattributed rows have no replayed side to compare against
+        reported_sides = np.sign(funding['position_size'].to_numpy(dtype=float))
+        funding['side_mismatch'] = (position_id > 0) & (sides[position_id] != reported_sides)
+    payments = (funding['payments'].to_numpy(dtype=np.int64) if 'payments' in funding.columns
+                else np.ones(len(funding), dtype=np.int64))
+
+    def per_position(ids: np.ndarray, df: pd.DataFrame, column: str, share=1.0) -> np.ndarray:
+        """Column totals per position id; NaN if the frame lacks the column (e.g. not EUR-converted)"""
+        if column not in df.columns:
+            return np.full(size - 1, np.nan if len(df) else 0.0)
+        weights = np.nan_to_num(df[column].to_numpy(dtype=float)) * share
+        return np.bincount(ids, weights=weights, minlength=size)[1:]
+
+    funding_usd = per_position(position_id, funding, 'funding_payment')
+    funding_eur = per_position(position_id, funding, 'funding_payment_eur')
+    pnl_usd = pnl_eur = fee_usd = fee_eur = np.zeros(size - 1)
+    if not fills.empty:
+        # PnL belongs to the position a fill closes; the fee of a flip is split by closed and opened size
+        owner = ids - flip
+        traded = np.abs(before) + np.abs(after)
+        closing_share = np.divide(np.abs(before), traded, out=np.zeros(len(fills)), where=flip)
+        pnl_usd = per_position(owner, fills, 'closed_pnl')
+        pnl_eur = per_position(owner, fills, 'closed_pnl_eur')
+        fee_usd = per_position(owner, fills, 'fee', closing_share) + per_position(ids, fills, 'fee', 1 - closing_share)
+        fee_eur = (per_position(owner, fills, 'fee_eur', closing_share)
+                   + per_position(ids, fills, 'fee_eur', 1 - closing_share))
+
+    carry = positions[['position_id', 'coin', 'side', 'open_time_ms', 'close_time_ms', 'status']].assign(
+        realized_pnl_usd=pnl_usd, fee_usd=fee_usd, funding_usd=funding_usd,
+        funding_payments=np.bincount(position_id, weights=payments, minlength=size)[1:].astype(np.int64),
+        net_usd=pnl_usd - fee_usd + funding_usd,
+        realized_pnl_eur=pnl_eur, fee_eur=fee_eur, funding_eur=funding_eur,
+        net_eur=pnl_eur - fee_eur + funding_eur)
+    return PositionCarry(carry.reindex(columns=CARRY_COLUMNS), funding)
+
+def print_position_carry(carry: PositionCarry, top: int = 5):
+    """Console summary of the funding carried by each position"""
+    positions = carry.positions
+    if positions.empty or carry.funding.empty:
+        return
+    print("\n" + "═" * 80)
+    print(f"🔗 FUNDING JE POSITION: ${positions['funding_usd'].sum():,.2f} | €{positions['funding_eur'].sum():,.2f} "
+          f"auf {int((positions['funding_payments'] > 0).sum())} Position(en)")
+    print("═" * 80)
+    for _, pos in positions.nsmallest(top, 'funding_usd').iterrows():
+        if pos['funding_usd'] >= 0:
+            break
+        print(f"   #{pos['position_id']} {pos['coin']} {pos['side']}: Funding ${pos['funding_usd']:,.2f} | "
+              f"PnL ${pos['realized_pnl_usd']:,.2f} | Gebühren ${pos['fee_usd']:,.2f} | netto ${pos['net_usd']:,.2f}")
+    unattributed = carry.unattributed
+    if not unattributed.empty:
+        print(f"⚠️  {len(unattributed)} Funding-Zahlung(en) ohne offene Position "
+              f"(${unattributed['funding_payment'].sum():,.2f}) - vermutlich fehlende Fills")
+    if 'side_mismatch' in carry.funding.columns and carry.funding['side_mismatch'].any():
+        print(f"⚠️  {int(carry.funding['side_mismatch'].sum())} Funding-Zahlung(en) mit abweichender Positionsrichtung")
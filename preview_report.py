@@ -0,0 +1,106 @@
+"""
+Preview Mode for Hyperliquid Tax Calculator
+Answers "what do I owe so far" in seconds: fills are requested aggregated by time,
+only the data the tax calculation needs is fetched and no report package is written.
+The exact figures are computed afterwards through the same path with individual fills;
+they are printed as a second block, the preview lines are not updated in place.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Tuple
+
+import pandas as pd
+
+from austrian_tax_report import AustrianTaxReportGenerator
+from currency_converter import CurrencyConverter
+from env_flags import env_enabled
+from hyperliquid_fetcher import (HyperliquidFetcher, HyperliquidDataProcessor, create_price_history,
+                                 filter_frame_time_range, filter_time_range, tax_year_bounds)
+from manual_input_handler import ManualInputHandler
+
+# Environment variable that switches main() into preview mode
+PREVIEW_ENV = "HL_PREVIEW"
+
+def fetch_tax_inputs(tax_year: int, fetcher: HyperliquidFetcher,
+                     converter: CurrencyConverter,
+                     manual_handler: ManualInputHandler) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    EUR-converted trades and funding of the tax year, the only inputs of the tax summary
+    Transfers, account state and open orders are skipped; the fetcher decides whether
+    fills come aggregated (preview) or as individual partial fills (exact)
+    """
+    processor = HyperliquidDataProcessor()
+    year_start, year_end = tax_year_bounds(tax_year)
+    fetcher.set_time_range(year_start, year_end)
+    start_time, end_time = fetcher.get_history_range()
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        fills_future = executor.submit(fetcher.get_user_fills)
+        funding_future = executor.submit(fetcher.get_user_funding)
+        ecb_future = executor.submit(
+            converter.rates_fetcher.ensure_range_available,
+            datetime.fromtimestamp(start_time / 1000, tz=timezone.utc).strftime('%Y-%m-%d'),
+            datetime.fromtimestamp(end_time / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+        )
+        trades_df = processor.process_trades(filter_time_range(fills_future.result(), year_start, year_end))
+        funding_df, _ = processor.ingest_funding(filter_time_range(funding_future.result(), year_start, year_end))
+        ecb_future.result()
+    trades_df = create_price_history(fetcher).value_fees(trades_df)
+
+    manual_trades_df = manual_handler.read_manual_trades() if os.path.exists(manual_handler.manual_input_folder) else pd.DataFrame()
+    manual_trades_df = filter_frame_time_range(manual_trades_df, year_start, year_end)
+    if not manual_trades_df.empty:
+        trades_df = pd.concat([trades_df, manual_trades_df], ignore_index=True)
+
+    converter.prepare_rates([trades_df, funding_df])
+    if not trades_df.empty:
+        trades_df = converter.add_eur_conversions(trades_df, ['fee', 'closed_pnl'])
+    if not funding_df.empty:
+        funding_df = converter.add_eur_conversions(funding_df, ['funding_payment'])
+    return trades_df, funding_df
+
+def print_preview(tax_summary: Dict[str, Any], trade_count: int, tax_year: int, approximate: bool):
+    """Compact tax estimate; figures derived from aggregated fills are marked with ≈"""
+    mark = "≈" if approximate else ""
+    print("\n" + "═" * 80)
+    if approximate:
+        print(f"⚡ VORSCHAU STEUERJAHR {tax_year} (≈ = Näherungswert aus zeitlich aggregierten Fills)")
+    else:
+        print(f"✅ EXAKTE WERTE STEUERJAHR {tax_year}")
+    print("═" * 80)
+    print(f"📈 Trades: {mark}{trade_count}{' (aggregiert)' if approximate else ''}")
+    print(f"📊 Realisierter PnL: {mark}€{tax_summary['total_realized_pnl_eur']:,.2f}")
+    print(f"💸 Trading-Gebühren: {mark}€{tax_summary['total_fees_eur']:,.2f}")
+    print(f"🔄 Funding erhalten: €{tax_summary['funding_received_eur']:,.2f} | "
+          f"bezahlt: €{tax_summary['funding_paid_eur']:,.2f}")
+    print("─" * 80)
+    print(f"💰 Trading-Gewinn (steuerlich): {mark}€{tax_summary['taxable_trading_profit_eur']:,.2f}")
+    print(f"💸 Zusatzsteuer durch Trading: {mark}€{tax_summary['trading_tax']:,.2f}")
+    print("─" * 80)
+    if approximate:
+        print("ℹ️  Vorschau ohne PDF/ZIP; für die Steuererklärung den vollständigen Report erzeugen.")
+
+def run_wallet_preview(wallet_address: str, tax_year: int, yearly_income: float,
+                       fetcher: HyperliquidFetcher, converter: CurrencyConverter,
+                       manual_handler: ManualInputHandler) -> Dict[str, Any]:
+    """
+    Tax estimate for one wallet and tax year without writing a report package
+    Figures are approximate if the fetcher requests aggregated fills (aggregate_fills=True)
+    """
+    trades_df, funding_df = fetch_tax_inputs(tax_year, fetcher, converter, manual_handler)
+    reporter = AustrianTaxReportGenerator(wallet_address=wallet_address,
+                                          yearly_income=yearly_income, tax_year=tax_year)
+    tax_summary = reporter.calculate_austrian_tax_summary(trades_df, funding_df)
+
+    # Always report failed windows, even if the figures are approximate anyway
+    windows_failed = fetcher.print_failed_windows()
+    approximate = fetcher.aggregate_fills or windows_failed
+    tax_summary['approximate'] = approximate
+    print_preview(tax_summary, len(trades_df), tax_year, approximate)
+    return tax_summary
+
+def preview_enabled() -> bool:
+    """True if HL_PREVIEW is set to a truthy value"""
+    return env_enabled(PREVIEW_ENV)
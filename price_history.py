@@ -0,0 +1,330 @@
+"""
+Price History for Hyperliquid Tax Calculator
+Candle closes from the candleSnapshot endpoint, cached in SQLite per coin and
+interval, to value fees paid in non-USDC tokens and open positions at year end
+"""
+
+import sqlite3
+import threading
+from contextlib import closing
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Fees are valued at the daily close, year-end marks at the last hourly close of the year
+# (or the daily close once the year end has left the window of hourly candles)
+FEE_INTERVAL = "1d"
+MARK_INTERVAL = "1h"
+MARK_FALLBACK_INTERVAL = "1d"
+INTERVAL_MS = {
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+# Maximum candles the info API returns per candleSnapshot response; older candles than the
+# most recent CANDLES_PAGE_LIMIT of an interval are not available at all
+CANDLES_PAGE_LIMIT = 5000
+
+# Fee tokens that already are USD amounts
+USD_TOKENS = {'USDC', 'USD'}
+
+class CandleCache:
+    """SQLite-backed store of candle closes with the covered time range per coin and interval"""
+
+    def __init__(self, db_path: str = "hyperliquid_candles.db"):
+        self.db_path = db_path
+        self._create_tables()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection; one per call keeps the cache safe to share between threads"""
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _create_tables(self):
+        """Create tables if they don't exist yet"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS candles (
+                    coin TEXT NOT NULL,
+                    interval TEXT NOT NULL,
+                    open_time INTEGER NOT NULL,
+                    close REAL NOT NULL,
+                    PRIMARY KEY (coin, interval, open_time)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS candle_ranges (
+                    coin TEXT NOT NULL,
+                    interval TEXT NOT NULL,
+                    covered_from INTEGER NOT NULL,
+                    covered_until INTEGER NOT NULL,
+                    PRIMARY KEY (coin, interval)
+                )
+            """)
+
+    def get_covered_range(self, coin: str, interval: str) -> Optional[Tuple[int, int]]:
+        """Return the (from, until) open-time range (ms) stored completely, or None"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT covered_from, covered_until FROM candle_ranges WHERE coin = ? AND interval = ?",
+                (coin, interval)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save_candles(self, coin: str, interval: str, open_times: np.ndarray, closes: np.ndarray,
+                     covered_range: Tuple[int, int]):
+        """Upsert candle closes and extend the covered range (a disjoint range replaces it)"""
+        covered_from, covered_until = covered_range
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO candles (coin, interval, open_time, close) VALUES (?, ?, ?, ?)",
+                [(coin, interval, int(t), float(c)) for t, c in zip(open_times, closes)]
+            )
+            row = conn.execute(
+                "SELECT covered_from, covered_until FROM candle_ranges WHERE coin = ? AND interval = ?",
+                (coin, interval)
+            ).fetchone()
+            if row and covered_from <= row[1] + INTERVAL_MS[interval] and covered_until >= row[0] - INTERVAL_MS[interval]:
+                covered_from, covered_until = min(covered_from, row[0]), max(covered_until, row[1])
+            conn.execute(
+                "INSERT OR REPLACE INTO candle_ranges (coin, interval, covered_from, covered_until) VALUES (?, ?, ?, ?)",
+                (coin, interval, covered_from, covered_until)
+            )
+
+    def load_closes(self, coin: str, interval: str, start_time: int,
+                    end_time: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Open times and closes of the stored candles in [start_time, end_time], oldest first
+        The last candle before start_time is included, so gaps fall back to the previous close
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT open_time, close FROM candles WHERE coin = ? AND interval = ? AND open_time < ? "
+                "ORDER BY open_time DESC LIMIT 1",
+                (coin, interval, start_time)
+            ).fetchall()
+            rows += conn.execute(
+                "SELECT open_time, close FROM candles WHERE coin = ? AND interval = ? "
+                "AND open_time >= ? AND open_time <= ? ORDER BY open_time",
+                (coin, interval, start_time, end_time)
+            ).fetchall()
+        if not rows:
+            return np.empty(0, dtype='int64'), np.empty(0)
+        open_times, closes = zip(*rows)
+        return np.array(open_times, dtype='int64'), np.array(closes, dtype=float)
+
+class PriceHistory:
+    """
+    USD prices per coin and point in time from candle closes
+    Lookups are answered in bulk per coin: missing candles are fetched once per
+    coin and range, stored in the cache, and every timestamp is matched with
+    a single searchsorted
+    """
+
+    def __init__(self, fetcher, cache: Optional[CandleCache] = None):
+        """
+        fetcher: HyperliquidFetcher whose session, rate limit and archive are used
+        cache: optional candle cache; without one candles are only kept for this run
+        """
+        self.fetcher = fetcher
+        self.cache = cache
+        # (coin, interval) -> (start, end, open_times, closes) loaded or fetched during this run
+        self._series: Dict[Tuple[str, str], Tuple[int, int, np.ndarray, np.ndarray]] = {}
+        self._spot_pairs: Optional[Dict[str, str]] = None
+        self._lock = threading.Lock()
+
+    def spot_pairs(self) -> Dict[str, str]:
+        """Spot token name -> candle coin of its USDC pair (e.g. 'HYPE' -> '@107') from spotMeta"""
+        with self._lock:
+            if self._spot_pairs is None:
+                meta = self.fetcher._make_request({"type": "spotMeta"})
+                pairs = {}
+                if isinstance(meta, dict):
+                    tokens = {token['index']: token['name'] for token in meta.get('tokens', [])}
+                    for pair in meta.get('universe', []):
+                        base, quote = (pair.get('tokens') or [None, None])[:2]
+                        if tokens.get(quote) in USD_TOKENS and base in tokens:
+                            pairs.setdefault(tokens[base], pair['name'])
+                self._spot_pairs = pairs
+            return self._spot_pairs
+
+    def _fetch_candles(self, coin: str, interval: str, start_time: int, end_time: int) -> List[Dict[str, Any]]:
+        """Fetch all candles of a range, paging forward around the API cap"""
+        candles = []
+        cursor = start_time
+        while cursor <= end_time:
+            payload = {
+                "type": "candleSnapshot",
+                "req": {"coin": coin, "interval": interval, "startTime": cursor, "endTime": end_time}
+            }
+            page = self.fetcher._make_request(payload)
+            if not isinstance(page, list) or not page:
+                break
+            candles.extend(page)
+            if len(page) < CANDLES_PAGE_LIMIT:
+                break
+            cursor = int(page[-1]['t']) + INTERVAL_MS[interval]
+        return candles
+
+    def _missing_ranges(self, coin: str, interval: str, start_time: int, end_time: int) -> List[Tuple[int, int]]:
+        """Parts of [start_time, end_time] the cache doesn't cover yet"""
+        covered = self.cache.get_covered_range(coin, interval) if self.cache else None
+        if covered is None or covered[0] > end_time or covered[1] < start_time:
+            return [(start_time, end_time)]
+        ranges = []
+        if start_time < covered[0]:
+            ranges.append((start_time, covered[0] - 1))
+        if end_time > covered[1]:
+            ranges.append((covered[1] + 1, end_time))
+        return ranges
+
+    def _load(self, coin: str, interval: str, start_time: int, end_time: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Candle closes covering [start_time, end_time], fetching only what isn't cached"""
+        step = INTERVAL_MS[interval]
+        start_time -= start_time % step
+        # The candle that is still open would change, so it is never cached
+        now_ms = self.fetcher._now_ms()
+        last_closed = now_ms - now_ms % step - step
+
+        fetched_times, fetched_closes = [], []
+        for range_start, range_end in self._missing_ranges(coin, interval, start_time, end_time):
+            candles = self._fetch_candles(coin, interval, range_start, range_end)
+            open_times = np.array([int(c['t']) for c in candles], dtype='int64')
+            closes = np.array([c['c'] for c in candles], dtype=float)
+            fetched_times.append(open_times)
+            fetched_closes.append(closes)
+            if self.cache and range_start <= last_closed and not self.fetcher.get_failed_windows('candleSnapshot'):
+                final = open_times <= last_closed
+                self.cache.save_candles(coin, interval, open_times[final], closes[final],
+                                        (range_start, min(range_end, last_closed)))
+
+        if self.cache:
+            cached_times, cached_closes = self.cache.load_closes(coin, interval, start_time, end_time)
+            fetched_times.append(cached_times)
+            fetched_closes.append(cached_closes)
+
+        open_times = np.concatenate(fetched_times) if fetched_times else np.empty(0, dtype='int64')
+        closes = np.concatenate(fetched_closes) if fetched_closes else np.empty(0)
+        open_times, first = np.unique(open_times, return_index=True)
+        return open_times, closes[first]
+
+    def _series_for(self, coin: str, interval: str, start_time: int, end_time: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Closes of a coin covering [start_time, end_time], memoized for the run"""
+        with self._lock:
+            key = (coin, interval)
+            loaded = self._series.get(key)
+            if loaded is not None:
+                loaded_start, loaded_end, open_times, closes = loaded
+                if loaded_start <= start_time and end_time <= loaded_end:
+                    return open_times, closes
+                start_time, end_time = min(start_time, loaded_start), max(end_time, loaded_end)
+            open_times, closes = self._load(coin, interval, start_time, end_time)
+            self._series[key] = (start_time, end_time, open_times, closes)
+            return open_times, closes
+
+    def prices_at(self, coins: np.ndarray, times_ms: np.ndarray, interval: str = FEE_INTERVAL) -> np.ndarray:
+        """
+        USD close of the candle containing each timestamp (or the latest one before it)
+        NaN where the coin has no candle at or before that time
+        """
+        coins = np.asarray(coins, dtype=object)
+        times_ms = np.asarray(times_ms, dtype='int64')
+        prices = np.full(len(times_ms), np.nan)
+
+        for coin in pd.unique(coins):
+            rows = np.flatnonzero(coins == coin)
+            coin_times = times_ms[rows]
+            open_times, closes = self._series_for(coin, interval, int(coin_times.min()), int(coin_times.max()))
+            if not len(open_times):
+                continue
+            idx = np.searchsorted(open_times, coin_times, side='right') - 1
+            known = idx >= 0
+            prices[rows[known]] = closes[idx[known]]
+        return prices
+
+    def value_fees(self, trades_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Convert fees paid in other tokens to USD at the daily close of the token's spot pair
+        The original amount stays in fee_native; fees that can't be priced become NaN and
+        are flagged in fee_unpriced instead of being counted as USD
+        """
+        if trades_df.empty or 'fee_token' not in trades_df.columns:
+            return trades_df
+
+        tokens = trades_df['fee_token']
+        foreign = (tokens.notna() & ~tokens.isin(USD_TOKENS)).to_numpy()
+        if not foreign.any():
+            return trades_df
+
+        # Spot tokens trade as pairs ('@107', 'PURR/USDC'); other tokens are looked up by name
+        spot_pairs = self.spot_pairs()
+        foreign_tokens = tokens[foreign].astype(str)
+        candle_coins = foreign_tokens.map(lambda token: spot_pairs.get(token, token)).to_numpy()
+        prices = self.prices_at(candle_coins, trades_df['time_ms'].to_numpy()[foreign])
+
+        trades_df = trades_df.copy()
+        trades_df['fee_native'] = trades_df['fee']
+        fees = trades_df['fee'].to_numpy(dtype=float, copy=True)
+        priced = ~np.isnan(prices)
+        foreign_rows = np.flatnonzero(foreign)
+        fees[foreign_rows] *= prices
+        unpriced = np.zeros(len(fees), dtype=bool)
+        unpriced[foreign_rows[~priced]] = True
+        trades_df['fee'] = fees
+        trades_df['fee_unpriced'] = unpriced
+
+        print(f"🪙 {int(priced.sum())} Gebühr(en) in anderen Token zu USD bewertet")
+        if not priced.all():
+            missing = sorted(set(foreign_tokens[~priced]))
+            print(f"⚠️  Kein Preis für Gebühren-Token {', '.join(missing)}; "
+                  f"{int((~priced).sum())} Gebühr(en) ohne USD-Wert, nicht in den Summen enthalten")
+        return trades_df
+
+    def _mark_interval_available(self, interval: str, mark_time: int) -> bool:
+        """True if candles of interval at mark_time are still within the API's candle window"""
+        return self.fetcher._now_ms() - mark_time < CANDLES_PAGE_LIMIT * INTERVAL_MS[interval]
+
+    def year_end_marks(self, positions: Dict[str, float], year_end_ms: int) -> pd.DataFrame:
+        """
+        Mark price and USD notional of open positions at the last hourly close before year_end_ms
+        Falls back to the daily candle of the year end once hourly candles are out of reach;
+        mark_price stays NaN (mark_interval None) for coins without any candle
+        """
+        positions = {coin: size for coin, size in positions.items() if size}
+        if not positions:
+            return pd.DataFrame()
+
+        coins = np.array(list(positions.keys()), dtype=object)
+        sizes = np.array(list(positions.values()), dtype=float)
+        marks = np.full(len(coins), np.nan)
+        intervals = np.full(len(coins), None, dtype=object)
+        # The hourly candle that closes exactly at year end opens one interval before it;
+        # the daily fallback is the candle of the year-end day
+        for interval, mark_time in ((MARK_INTERVAL, year_end_ms + 1 - INTERVAL_MS[MARK_INTERVAL]),
+                                    (MARK_FALLBACK_INTERVAL, year_end_ms)):
+            missing = np.isnan(marks)
+            if not missing.any() or not self._mark_interval_available(interval, mark_time):
+                continue
+            marks[missing] = self.prices_at(coins[missing], np.full(int(missing.sum()), mark_time), interval)
+            intervals[missing & ~np.isnan(marks)] = interval
+        return pd.DataFrame({
+            'coin': coins,
+            'size': sizes,
+            'mark_price': marks,
+            'mark_interval': intervals,
+            'notional_usd': sizes * marks,
+            'mark_time': datetime.fromtimestamp((year_end_ms + 1) / 1000, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+        })
+
+def end_positions(trades_df: pd.DataFrame) -> Dict[str, float]:
+    """Position size per coin after the last fill in trades_df (from startPosition and the fill size)"""
+    if trades_df.empty or 'start_position' not in trades_df.columns:
+        return {}
+    fills = trades_df[trades_df['start_position'].notna() & trades_df['coin'].notna()]
+    if fills.empty:
+        return {}
+    last = fills.sort_values('time_ms', kind='stable').groupby('coin', observed=True).tail(1)
+    signed = np.where(last['side'] == 'Buy', last['size'], -last['size'])
+    sizes = np.round(last['start_position'].to_numpy(dtype=float) + signed, 10)
+    return dict(zip(last['coin'], sizes))
@@ -0,0 +1,137 @@
+"""
+Weight-aware Rate Limiter for the Hyperliquid Info API
+Models the per-IP weight budget as a token bucket shared by every fetcher in the process
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Dict, Any, Optional
+
+# Hyperliquid allows an aggregated REST weight of 1200 per minute per IP
+INFO_WEIGHT_LIMIT_PER_MINUTE = 1200
+
+# Base weight per info request type; everything not listed costs DEFAULT_REQUEST_WEIGHT
+REQUEST_WEIGHTS = {
+    'l2Book': 2,
+    'allMids': 2,
+    'clearinghouseState': 2,
+    'orderStatus': 2,
+    'spotClearinghouseState': 2,
+    'exchangeStatus': 2,
+    'userRole': 60,
+}
+DEFAULT_REQUEST_WEIGHT = 20
+
+# Endpoints that cost one additional weight per N items in the response
+ITEMS_PER_EXTRA_WEIGHT = {
+    'userFills': 20,
+    'userFillsByTime': 20,
+    'userFunding': 20,
+    'userNonFundingLedgerUpdates': 20,
+    'historicalOrders': 20,
+    'fundingHistory': 20,
+    'recentTrades': 20,
+    'candleSnapshot': 60,
+}
+
+class WeightedRateLimiter:
+    """
+    Token bucket over the info API weight budget
+    acquire() blocks until the base weight of a request is available; the
+    response-size surcharge is charged afterwards and may push the bucket into
+    debt, which delays the following requests
+    """
+
+    def __init__(self, weight_per_minute: int = INFO_WEIGHT_LIMIT_PER_MINUTE):
+        self.capacity = float(weight_per_minute)
+        self.refill_per_second = weight_per_minute / 60.0
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.total_wait_seconds = 0.0
+        self.throttled_responses = 0
+        self.requests_by_type: Dict[str, int] = defaultdict(int)
+        self.weight_by_type: Dict[str, int] = defaultdict(int)
+        self._recent_charges: deque = deque()  # (monotonic time, weight) for the sliding minute
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def request_weight(request_type: str) -> int:
+        """Base weight of an info request type"""
+        return REQUEST_WEIGHTS.get(request_type, DEFAULT_REQUEST_WEIGHT)
+
+    @staticmethod
+    def response_weight(request_type: str, item_count: int) -> int:
+        """Additional weight charged for the number of items returned"""
+        items_per_weight = ITEMS_PER_EXTRA_WEIGHT.get(request_type)
+        if not items_per_weight:
+            return 0
+        return item_count // items_per_weight
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.refill_per_second)
+        self.last_refill = now
+
+    def _charge(self, request_type: str, weight: int, now: float):
+        self.tokens -= weight
+        self.weight_by_type[request_type] += weight
+        self._recent_charges.append((now, weight))
+
+    def acquire(self, request_type: str):
+        """Block until the base weight of request_type fits in the budget, then consume it"""
+        weight = self.request_weight(request_type)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= weight:
+                    self._charge(request_type, weight, now)
+                    self.requests_by_type[request_type] += 1
+                    return
+                wait_seconds = (weight - self.tokens) / self.refill_per_second
+                self.total_wait_seconds += wait_seconds
+            time.sleep(wait_seconds)
+
+    def record_response(self, request_type: str, item_count: int):
+        """Charge the response-size surcharge of a completed request"""
+        weight = self.response_weight(request_type, item_count)
+        if weight:
+            with self._lock:
+                self._charge(request_type, weight, time.monotonic())
+
+    def record_throttled(self):
+        """The server returned 429: our model was too optimistic, so drain the bucket"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0)
+            self.throttled_responses += 1
+
+    def get_usage(self) -> Dict[str, Any]:
+        """Snapshot of the current budget usage for monitoring"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            while self._recent_charges and now - self._recent_charges[0][0] > 60:
+                self._recent_charges.popleft()
+            used_last_minute = sum(weight for _, weight in self._recent_charges)
+            return {
+                'capacity_per_minute': int(self.capacity),
+                'available_weight': round(self.tokens, 1),
+                'used_last_minute': used_last_minute,
+                'utilization_percent': round(used_last_minute / self.capacity * 100, 1),
+                'total_wait_seconds': round(self.total_wait_seconds, 2),
+                'throttled_responses': self.throttled_responses,
+                'requests_by_type': dict(self.requests_by_type),
+                'weight_by_type': dict(self.weight_by_type),
+            }
+
+_shared_rate_limiter: Optional[WeightedRateLimiter] = None
+_shared_lock = threading.Lock()
+
+def get_shared_rate_limiter() -> WeightedRateLimiter:
+    """Process-wide limiter that all HyperliquidFetcher instances draw from by default"""
+    global _shared_rate_limiter
+    with _shared_lock:
+        if _shared_rate_limiter is None:
+            _shared_rate_limiter = WeightedRateLimiter()
+        return _shared_rate_limiter
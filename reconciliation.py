@@ -0,0 +1,245 @@
+"""
+Ledger Reconciliation for Hyperliquid Tax Calculator
+Builds the cash balance timeline of a wallet from fills, funding and ledger updates in
+one vectorized pass, anchors it on the clearinghouseState account value and narrows
+down the time ranges where fetched data is missing
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from position_engine import MANUAL_DIRECTION_PREFIX, PositionTimeline, build_position_timeline
+
+# Differences below this are rounding, not missing data
+BALANCE_TOLERANCE_USD = 1.0
+SIZE_TOLERANCE = 1e-6
+
+# Fees in other tokens do not touch the USDC balance
+CASH_FEE_TOKEN = 'USDC'
+
+# Spot markets are '@<index>' or named pairs like 'PURR/USDC'; they settle in the spot
+# wallet, outside the perp account value and positions of the clearinghouseState
+SPOT_COIN_PREFIX = '@'
+SPOT_PAIR_SEPARATOR = '/'
+
+BALANCE_SOURCES = ['fill', 'funding', 'ledger']
+RANGE_COLUMNS = ['kind', 'coin', 'start_ms', 'end_ms', 'events', 'difference']
+
+@dataclass
+class LedgerReconciliation:
+    """
+    timeline: cash delta and running balance per event (balance starts at 0 before the first event)
+    snapshot_ms / expected_balance: time and cash balance (account value minus unrealized PnL)
+                 of the clearinghouseState; NaN if it does not fall into the fetched range
+    opening_balance: balance before the first event implied by the snapshot
+    ranges: time ranges where the data contradicts itself - 'position' where the funding szi
+            differs from the replayed position, 'balance' where the implied balance is negative,
+            'snapshot' where an open position differs from the replay at the snapshot
+    """
+    timeline: pd.DataFrame
+    snapshot_ms: int
+    expected_balance: float
+    opening_balance: float
+    ranges: pd.DataFrame
+    full_history: bool = False
+
+    @property
+    def anchored(self) -> bool:
+        return not np.isnan(self.expected_balance)
+
+    @property
+    def computed_balance(self) -> float:
+        return float(self.timeline['balance_usd'].iloc[-1]) if not self.timeline.empty else 0.0
+
+    @property
+    def gap(self) -> float:
+        """Cash the events do not explain; only an error if the data covers the full history"""
+        return self.opening_balance if self.full_history and self.anchored else 0.0
+
+    @property
+    def consistent(self) -> bool:
+        return self.ranges.empty and abs(self.gap) < BALANCE_TOLERANCE_USD
+
+    def checks(self) -> Dict[str, Any]:
+        """Entries for the plausibility checks of the report"""
+        note = f"Abgleich Kontostand: {'konsistent' if self.consistent else f'{len(self.ranges)} Auffälligkeit(en)'}"
+        if self.anchored:
+            note += (f" (Kontostand ${self.expected_balance:,.2f}, berechnet ${self.computed_balance:,.2f}, "
+                     f"Anfangsbestand ${self.opening_balance:,.2f})")
+        return {
+            'reconciliation_consistent': self.consistent,
+            'reconciliation_gap': self.gap,
+            'reconciliation_ranges': self.ranges.to_dict('records'),
+            'reconciliation_note': note
+        }
+
+def _runs(mask: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Run number of each flagged row; a run ends where the flag or the key changes"""
+    boundary = np.ones(len(mask), dtype=bool)
+    boundary[1:] = (mask[1:] != mask[:-1]) | (keys[1:] != keys[:-1])
+    return np.cumsum(boundary)[mask]
+
+def _flagged_ranges(kind: str, coins: np.ndarray, times: np.ndarray, difference: np.ndarray,
+                    mask: np.ndarray) -> pd.DataFrame:
+    """Collapse consecutive flagged rows (sorted by coin and time) into time ranges"""
+    if not mask.any():
+        return pd.DataFrame(columns=RANGE_COLUMNS)
+    runs = pd.DataFrame({'run': _runs(mask, coins), 'coin': coins[mask], 'time_ms': times[mask],
+                         'difference': difference[mask], 'size': np.abs(difference[mask])})
+    grouped = runs.groupby('run', sort=True)
+    ranges = grouped.agg(coin=('coin', 'first'), start_ms=('time_ms', 'min'), end_ms=('time_ms', 'max'),
+                         events=('time_ms', 'size'))
+    # The largest difference within each range
+    ranges['difference'] = runs['difference'].to_numpy()[grouped['size'].idxmax().to_numpy()]
+    return ranges.assign(kind=kind).reindex(columns=RANGE_COLUMNS).reset_index(drop=True)
+
+def _spot_mask(coins: pd.Series) -> np.ndarray:
+    """True for the rows of spot markets"""
+    coins = coins.astype(str)
+    return (coins.str.startswith(SPOT_COIN_PREFIX) | coins.str.contains(SPOT_PAIR_SEPARATOR, regex=False)).to_numpy()
+
+def build_balance_timeline(trades_df: pd.DataFrame, funding_df: pd.DataFrame,
+                           transfers_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Cash deltas of all events in time order with the running balance
+    Fills add closedPnl minus USDC fees; manual trades happened elsewhere and spot fills
+    settle in the spot wallet, so both are skipped
+    """
+    times, deltas, sources = [], [], []
+    if not trades_df.empty:
+        manual = trades_df['direction'].str.startswith(MANUAL_DIRECTION_PREFIX, na=False).to_numpy()
+        fills = trades_df[~manual & ~_spot_mask(trades_df['coin'])]
+        fees = fills['fee'].to_numpy(dtype=float)
+        if 'fee_token' in fills.columns:
+            fees = np.where((fills['fee_token'] == CASH_FEE_TOKEN).to_numpy(), fees, 0.0)
+        times.append(fills['time_ms'].to_numpy(dtype=np.int64))
+        deltas.append(fills['closed_pnl'].to_numpy(dtype=float) - fees)
+        sources.append(np.zeros(len(fills), dtype=np.int8))
+    if not funding_df.empty:
+        times.append(funding_df['time_ms'].to_numpy(dtype=np.int64))
+        deltas.append(funding_df['funding_payment'].to_numpy(dtype=float))
+        sources.append(np.ones(len(funding_df), dtype=np.int8))
+    if not transfers_df.empty:
+        times.append(transfers_df['time_ms'].to_numpy(dtype=np.int64))
+        deltas.append(transfers_df['amount'].to_numpy(dtype=float))
+        sources.append(np.full(len(transfers_df), 2, dtype=np.int8))
+    if not times:
+        return pd.DataFrame(columns=['time_ms', 'source', 'delta_usd', 'balance_usd'])
+
+    times, deltas, sources = np.concatenate(times), np.nan_to_num(np.concatenate(deltas)), np.concatenate(sources)
+    order = np.argsort(times, kind='stable')
+    return pd.DataFrame({
+        'time_ms': times[order],
+        'source': pd.Categorical.from_codes(sources[order], BALANCE_SOURCES),
+        'delta_usd': deltas[order],
+        'balance_usd': np.cumsum(deltas[order])
+    })
+
+def _position_ranges(timeline: PositionTimeline, funding_df: pd.DataFrame) -> pd.DataFrame:
+    """Funding rows whose szi differs from the replayed position of their coin, as time ranges"""
+    fills = timeline.fills
+    if fills.empty or funding_df.empty or 'position_size' not in funding_df.columns:
+        return pd.DataFrame(columns=RANGE_COLUMNS)
+
+    fill_coins, funding_coins = pd.Categorical(fills['coin']), pd.Categorical(funding_df['coin'])
+    coins = fill_coins.categories.union(funding_coins.categories)
+    replay = pd.DataFrame({'time_ms': fills['time_ms'].to_numpy(dtype=np.int64),
+                           'coin_code': fill_coins.set_categories(coins).codes,
+                           'after': fills['position_after'].to_numpy(dtype=float),
+                           'before': fills['position_before'].to_numpy(dtype=float)}).sort_values('time_ms', kind='stable')
+    payments = pd.DataFrame({'time_ms': funding_df['time_ms'].to_numpy(dtype=np.int64),
+                             'coin_code': funding_coins.set_categories(coins).codes,
+                             'reported': funding_df['position_size'].to_numpy(dtype=float)})
+    payments = payments.sort_values(['coin_code', 'time_ms'], kind='stable').reset_index(drop=True)
+    by_time = payments.sort_values('time_ms', kind='stable')
+    # Position held up to the payment; before a coin's first fill, the position that fill started from
+    held = pd.merge_asof(by_time, replay[['time_ms', 'coin_code', 'after']], on='time_ms', by='coin_code',
+                         allow_exact_matches=False)
+    first = pd.merge_asof(by_time, replay[['time_ms', 'coin_code', 'before']], on='time_ms', by='coin_code',
+                          direction='forward')
+    replayed = np.empty(len(payments))
+    replayed[by_time.index.to_numpy()] = held['after'].fillna(first['before']).to_numpy()
+
+    # Coins without fills have no replay to compare against
+    difference = payments['reported'].to_numpy() - replayed
+    mismatch = np.abs(np.nan_to_num(difference)) > SIZE_TOLERANCE
+    return _flagged_ranges('position', coins[payments['coin_code']].to_numpy(), payments['time_ms'].to_numpy(),
+                           difference, mismatch)
+
+def _snapshot_ranges(timeline: PositionTimeline, account_state: Dict, snapshot_ms: int) -> pd.DataFrame:
+    """Open perp positions of the clearinghouseState that the replayed fills do not end with"""
+    fills = timeline.fills
+    if not fills.empty:
+        fills = fills[~_spot_mask(fills['coin'])]
+    reported = pd.Series({p['coin']: p['size'] for p in account_state.get('positions', [])}, dtype=float)
+    if fills.empty and reported.empty:
+        return pd.DataFrame(columns=RANGE_COLUMNS)
+    last = fills.groupby(fills['coin'].astype(str), sort=False).agg(
+        time_ms=('time_ms', 'max'), after=('position_after', 'last')) if not fills.empty else \
+        pd.DataFrame(columns=['time_ms', 'after'], dtype=float)
+    coins = last.index.union(reported.index)
+    difference = (reported.reindex(coins, fill_value=0.0) - last['after'].reindex(coins, fill_value=0.0)).to_numpy()
+    mismatch = np.abs(difference) > SIZE_TOLERANCE
+    ranges = pd.DataFrame({'kind': 'snapshot', 'coin': coins.to_numpy(),
+                           'start_ms': last['time_ms'].reindex(coins).fillna(-1).to_numpy(dtype=np.int64),
+                           'end_ms': snapshot_ms, 'events': 1, 'difference': difference})
+    return ranges[mismatch].reset_index(drop=True)
+
+def reconcile_ledger(trades_df: pd.DataFrame, funding_df: pd.DataFrame, transfers_df: pd.DataFrame,
+                     account_state: Dict, timeline: Optional[PositionTimeline] = None,
+                     range_end_ms: Optional[int] = None, full_history: bool = False) -> LedgerReconciliation:
+    """
+    Reconcile fetched fills, funding (per payment, with szi) and ledger updates
+    The account value anchors the balance only if the snapshot lies in the fetched range
+    (up to range_end_ms); with full_history the balance before the first event must be 0.
+    """
+    balance = build_balance_timeline(trades_df, funding_df, transfers_df)
+    timeline = timeline if timeline is not None else build_position_timeline(trades_df)
+    snapshot_ms = int((account_state or {}).get('time_ms', 0))
+    covered = bool(snapshot_ms) and (range_end_ms is None or snapshot_ms <= range_end_ms)
+    if not balance.empty and snapshot_ms < balance['time_ms'].iloc[-1]:
+        covered = False
+
+    range_frames = [_position_ranges(timeline, funding_df)]
+    expected = opening = np.nan
+    if covered and 'account_value' in account_state:
+        unrealized = sum(p.get('unrealized_pnl', 0.0) for p in account_state.get('positions', []))
+        expected = account_state['account_value'] - unrealized
+        computed = float(balance['balance_usd'].iloc[-1]) if not balance.empty else 0.0
+        opening = expected - computed
+        if not balance.empty:
+            # The balance cannot have been negative: missing inflows or fills before these events
+            implied = opening + balance['balance_usd'].to_numpy()
+            range_frames.append(_flagged_ranges('balance', np.zeros(len(balance), dtype=np.int8),
+                                                balance['time_ms'].to_numpy(), implied,
+                                                implied < -BALANCE_TOLERANCE_USD).assign(coin='USDC'))
+        range_frames.append(_snapshot_ranges(timeline, account_state, snapshot_ms))
+    ranges = pd.concat([r for r in range_frames if not r.empty] or [range_frames[0]], ignore_index=True)
+    return LedgerReconciliation(balance, snapshot_ms, float(expected), float(opening),
+                                ranges.sort_values('start_ms', kind='stable').reset_index(drop=True), full_history)
+
+def print_reconciliation(reconciliation: LedgerReconciliation, max_ranges: int = 10):
+    """Console summary of the ledger reconciliation"""
+    print("\n" + "═" * 80)
+    print("🧮 KONTOABGLEICH")
+    print("═" * 80)
+    if reconciliation.anchored:
+        print(f"💵 Kontostand (ohne unrealisierte PnL): ${reconciliation.expected_balance:,.2f} | "
+              f"aus Daten: ${reconciliation.computed_balance:,.2f} | "
+              f"Anfangsbestand: ${reconciliation.opening_balance:,.2f}")
+    else:
+        print("ℹ️  Kontostand-Snapshot liegt außerhalb des abgefragten Zeitraums - nur Positionsabgleich")
+    if reconciliation.consistent:
+        print("✅ Fills, Funding und Ledger sind widerspruchsfrei")
+        return
+    if abs(reconciliation.gap) >= BALANCE_TOLERANCE_USD:
+        print(f"⚠️  Nicht erklärter Betrag: ${reconciliation.gap:,.2f}")
+    for _, row in reconciliation.ranges.head(max_ranges).iterrows():
+        start = pd.to_datetime(row['start_ms'], unit='ms', utc=True).strftime('%Y-%m-%d %H:%M') if row['start_ms'] >= 0 else '?'
+        end = pd.to_datetime(row['end_ms'], unit='ms', utc=True).strftime('%Y-%m-%d %H:%M')
+        print(f"⚠️  {row['kind']} {row['coin']}: {start} - {end} UTC ({row['events']} Ereignis(se), Δ {row['difference']:,.4f})")
+    if len(reconciliation.ranges) > max_ranges:
+        print(f"   ... und {len(reconciliation.ranges) - max_ranges} weitere Zeitraum/Zeiträume")
@@ -0,0 +1,163 @@
+"""
+Report Totals for Hyperliquid Tax Calculator
+One aggregation pass over the trade, funding and transfer frames; the CLI summary,
+the tax summary, the summary CSV and the plausibility check all read from its result
+"""
+
+from dataclasses import dataclass, field, fields
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from money import from_micros, sum_micros
+
+# Ledger types counted as external deposits/withdrawals in the console summaries
+EXTERNAL_FLOW_PATTERN = 'deposit|withdraw'
+
+# Per-coin columns of ReportTotals.by_coin
+COIN_COLUMNS = ['trades', 'volume_usd', 'fee_usd', 'closed_pnl_usd', 'funding_count', 'funding_usd']
+
+def _empty_by_coin() -> pd.DataFrame:
+    return pd.DataFrame(columns=COIN_COLUMNS, dtype=float).rename_axis('coin')
+
+def _by_coin(coins: pd.Series, aggregations: Dict[str, tuple], **columns: np.ndarray) -> pd.DataFrame:
+    """One group-by over the coin column; the index is plain strings so batches can be combined"""
+    grouped = pd.DataFrame(columns).groupby(coins.to_numpy(), observed=True).agg(**aggregations)
+    grouped.index = grouped.index.astype(str)
+    return grouped
+
+@dataclass
+class ReportTotals:
+    """
+    Totals of one wallet and tax year (or of one batch of it)
+    Money fields are floats; paid amounts and withdrawals are positive. If the frames
+    carry micro-unit columns, micros holds the exact sums and add() keeps them exact.
+    """
+    trade_count: int = 0
+    buy_trades: int = 0
+    volume_usd: float = 0.0
+    closed_pnl_usd: float = 0.0
+    closed_pnl_eur: float = 0.0
+    fee_usd: float = 0.0
+    fee_eur: float = 0.0
+
+    funding_count: int = 0
+    funding_usd: float = 0.0
+    funding_paid_usd: float = 0.0
+    funding_received_usd: float = 0.0
+    funding_paid_eur: float = 0.0
+    funding_received_eur: float = 0.0
+
+    transfer_count: int = 0
+    # Deposits and withdrawals in the narrow sense (ledger types matching EXTERNAL_FLOW_PATTERN)
+    deposits_usd: float = 0.0
+    withdrawals_usd: float = 0.0
+    deposits_eur: float = 0.0
+    withdrawals_eur: float = 0.0
+    # All positive / negative ledger amounts in EUR, as reported in the summary CSV
+    inflows_eur: float = 0.0
+    outflows_eur: float = 0.0
+    transfers_in_eur: bool = False
+
+    micros: Dict[str, int] = field(default_factory=dict)
+    by_coin: pd.DataFrame = field(default_factory=_empty_by_coin)
+
+    @property
+    def sell_trades(self) -> int:
+        return self.trade_count - self.buy_trades
+
+    @property
+    def trade_coins(self) -> int:
+        return int((self.by_coin['trades'] > 0).sum())
+
+    @property
+    def funding_coins(self) -> int:
+        return int((self.by_coin['funding_count'] > 0).sum())
+
+    def _set_money(self, name: str, df: pd.DataFrame, column: str, sign: int = 0):
+        """Sum of an amount column (only amounts of the given sign, as a positive value)"""
+        if df.empty or column not in df.columns:
+            return
+        micros = sum_micros(df, column, sign)
+        if micros is not None:
+            self.micros[name] = abs(micros) if sign else micros
+            setattr(self, name, from_micros(self.micros[name]))
+            return
+        amounts = df[column].to_numpy(dtype=float)
+        total = float(amounts[amounts * sign > 0].sum()) if sign else float(np.nansum(amounts))
+        setattr(self, name, abs(total) if sign else total)
+
+    def add(self, other: 'ReportTotals') -> 'ReportTotals':
+        """Add the totals of another batch in place; exact sums stay exact"""
+        for f in fields(self):
+            if f.name in ('micros', 'by_coin'):
+                continue
+            if f.name in self.micros or f.name in other.micros:
+                self.micros[f.name] = self.micros.get(f.name, 0) + other.micros.get(f.name, 0)
+                setattr(self, f.name, from_micros(self.micros[f.name]))
+            elif f.type is bool:
+                setattr(self, f.name, getattr(self, f.name) or getattr(other, f.name))
+            else:
+                setattr(self, f.name, getattr(self, f.name) + getattr(other, f.name))
+        if self.by_coin.empty:
+            self.by_coin = other.by_coin
+        elif not other.by_coin.empty:
+            self.by_coin = pd.concat([self.by_coin, other.by_coin]).groupby(level=0).sum()
+        return self
+
+def aggregate_report_totals(trades_df: Optional[pd.DataFrame] = None,
+                            funding_df: Optional[pd.DataFrame] = None,
+                            transfers_df: Optional[pd.DataFrame] = None) -> ReportTotals:
+    """Scan each (EUR-converted) frame once and collect every total the reports need"""
+    totals = ReportTotals()
+    coin_frames = []
+
+    if trades_df is not None and not trades_df.empty:
+        volume = trades_df['size'].to_numpy(dtype=float) * trades_df['price'].to_numpy(dtype=float)
+        totals.trade_count = len(trades_df)
+        totals.buy_trades = int((trades_df['side'] == 'Buy').sum())
+        totals.volume_usd = float(volume.sum())
+        totals._set_money('closed_pnl_usd', trades_df, 'closed_pnl')
+        totals._set_money('closed_pnl_eur', trades_df, 'closed_pnl_eur')
+        totals._set_money('fee_usd', trades_df, 'fee')
+        totals._set_money('fee_eur', trades_df, 'fee_eur')
+        coin_frames.append(_by_coin(trades_df['coin'], {
+            'trades': ('volume_usd', 'size'),
+            'volume_usd': ('volume_usd', 'sum'),
+            'fee_usd': ('fee', 'sum'),
+            'closed_pnl_usd': ('closed_pnl', 'sum'),
+        }, volume_usd=volume, fee=trades_df['fee'].to_numpy(dtype=float),
+           closed_pnl=trades_df['closed_pnl'].to_numpy(dtype=float)))
+
+    if funding_df is not None and not funding_df.empty:
+        # Bucketed funding (see HyperliquidDataProcessor.aggregate_funding) counts payments per row
+        payments = (funding_df['payments'].to_numpy(dtype='int64') if 'payments' in funding_df.columns
+                    else np.ones(len(funding_df), dtype='int64'))
+        totals.funding_count = int(payments.sum())
+        totals._set_money('funding_usd', funding_df, 'funding_payment')
+        totals._set_money('funding_paid_usd', funding_df, 'funding_payment', sign=-1)
+        totals._set_money('funding_received_usd', funding_df, 'funding_payment', sign=1)
+        totals._set_money('funding_paid_eur', funding_df, 'funding_payment_eur', sign=-1)
+        totals._set_money('funding_received_eur', funding_df, 'funding_payment_eur', sign=1)
+        coin_frames.append(_by_coin(funding_df['coin'], {
+            'funding_count': ('payments', 'sum'),
+            'funding_usd': ('funding_payment', 'sum'),
+        }, payments=payments, funding_payment=funding_df['funding_payment'].to_numpy(dtype=float)))
+
+    if transfers_df is not None and not transfers_df.empty:
+        totals.transfer_count = len(transfers_df)
+        totals.transfers_in_eur = 'amount_eur' in transfers_df.columns
+        totals._set_money('inflows_eur', transfers_df, 'amount_eur', sign=1)
+        totals._set_money('outflows_eur', transfers_df, 'amount_eur', sign=-1)
+        external = transfers_df[transfers_df['type'].str.contains(EXTERNAL_FLOW_PATTERN, case=False, na=False)]
+        totals._set_money('deposits_usd', external, 'amount', sign=1)
+        totals._set_money('withdrawals_usd', external, 'amount', sign=-1)
+        totals._set_money('deposits_eur', external, 'amount_eur', sign=1)
+        totals._set_money('withdrawals_eur', external, 'amount_eur', sign=-1)
+
+    if coin_frames:
+        totals.by_coin = (pd.concat(coin_frames).groupby(level=0).sum()
+                          .reindex(columns=COIN_COLUMNS, fill_value=0).rename_axis('coin')
+                          .astype({'trades': int, 'funding_count': int}))
+    return totals
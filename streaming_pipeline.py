@@ -0,0 +1,310 @@
+"""
+Streaming Report Pipeline for Hyperliquid Tax Calculator
+Runs fetch, processing, EUR conversion and CSV writing batch by batch, so peak
+memory depends on the batch size instead of the number of fills in a wallet
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from austrian_tax_report import AustrianTaxReportGenerator
+from currency_converter import CurrencyConverter
+from env_flags import env_enabled
+from hyperliquid_fetcher import (HyperliquidFetcher, HyperliquidDataProcessor, COST_BASIS_LOOKBACK_MS, DAY_MS,
+                                 STREAM_BATCH_SIZE, create_price_history, filter_frame_time_range,
+                                 filter_time_range, print_cli_tax_summary, print_year_end_positions,
+                                 tax_year_bounds, value_year_end_positions, year_slice)
+from manual_input_handler import ManualInputHandler
+from price_history import PriceHistory, end_positions
+from report_totals import ReportTotals, aggregate_report_totals
+
+# Environment variable that switches main() into streaming mode
+STREAMING_ENV = "HL_STREAMING"
+
+# Rows of each CSV kept in memory for the PDF excerpts
+PDF_SAMPLE_ROWS = 10
+
+class CsvSink:
+    """Appends DataFrame batches to one CSV file and keeps the first rows for the PDF"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self.sample = pd.DataFrame()
+
+    def append(self, df: pd.DataFrame):
+        if df.empty:
+            return
+        df.to_csv(self.path, mode='a', header=self.rows == 0, index=False, encoding='utf-8')
+        if len(self.sample) < PDF_SAMPLE_ROWS:
+            self.sample = pd.concat([self.sample, df.head(PDF_SAMPLE_ROWS - len(self.sample))], ignore_index=True)
+        self.rows += len(df)
+
+class RunningTotals:
+    """Tax-relevant sums that can be updated batch by batch"""
+
+    def __init__(self):
+        self.report = ReportTotals()
+        # Position size per coin after the latest fill seen so far
+        self.positions: Dict[str, float] = {}
+
+    def add_trades(self, trades_df: pd.DataFrame):
+        """Add a batch of EUR-converted trades"""
+        self.report.add(aggregate_report_totals(trades_df=trades_df))
+
+    def track_positions(self, trades_df: pd.DataFrame):
+        """Follow the position sizes through a batch of fills (batches in chronological order)"""
+        self.positions.update(end_positions(trades_df))
+
+    def add_funding(self, funding_df: pd.DataFrame):
+        """Add a batch of EUR-converted funding payments"""
+        self.report.add(aggregate_report_totals(funding_df=funding_df))
+
+    def add_transfers(self, transfers_df: pd.DataFrame):
+        """Add a batch of EUR-converted deposits, withdrawals and transfers"""
+        self.report.add(aggregate_report_totals(transfers_df=transfers_df))
+
+    def tax_summary(self, reporter: AustrianTaxReportGenerator) -> Dict[str, Any]:
+        return reporter.tax_summary_from_totals(self.report)
+
+    def summary_csv(self, reporter: AustrianTaxReportGenerator, tax_summary: Dict[str, Any]) -> pd.DataFrame:
+        return reporter.summary_csv_from_totals(tax_summary, self.report)
+
+    def plausibility(self, reporter: AustrianTaxReportGenerator) -> Dict[str, Any]:
+        return reporter.plausibility_from_totals(self.report)
+
+    def print_summary(self, title: str):
+        """Condensed console summary"""
+        totals = self.report
+        print("\n" + "═" * 80)
+        print(f"📊 {title}")
+        print("═" * 80)
+        print(f"📈 Trades: {totals.trade_count} ({totals.trade_coins} Assets, "
+              f"🟢 {totals.buy_trades} Buy | 🔴 {totals.sell_trades} Sell)")
+        print(f"💰 Total Volume: ${totals.volume_usd:,.2f}")
+        print(f"📊 Realized PnL: ${totals.closed_pnl_usd:,.4f} | €{totals.closed_pnl_eur:,.4f}")
+        print(f"💸 Trading Fees: ${abs(totals.fee_usd):,.4f} | €{abs(totals.fee_eur):,.4f}")
+        print(f"🔄 Funding: {totals.funding_count} Zahlungen ({totals.funding_coins} Assets), "
+              f"paid €{totals.funding_paid_eur:,.4f} | received €{totals.funding_received_eur:,.4f}")
+        print(f"📥 Deposits: €{totals.inflows_eur:,.4f} | 📤 Withdrawals: €{totals.outflows_eur:,.4f}")
+
+class StreamingReportPipeline:
+    """
+    Tax report for one wallet and tax year without materializing the full history
+    Fetch windows (or event store batches) flow through processing, EUR conversion
+    and CSV appends; only running totals and the PDF excerpts stay in memory
+    """
+
+    def __init__(self, wallet_address: str, tax_year: int, yearly_income: float,
+                 fetcher: HyperliquidFetcher, converter: CurrencyConverter,
+                 manual_handler: ManualInputHandler, output_dir: str = ".",
+                 batch_size: int = STREAM_BATCH_SIZE, lookback_ms: int = COST_BASIS_LOOKBACK_MS,
+                 price_history: Optional[PriceHistory] = None):
+        self.wallet_address = wallet_address
+        self.tax_year = tax_year
+        self.fetcher = fetcher
+        self.converter = converter
+        self.manual_handler = manual_handler
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.lookback_ms = lookback_ms
+        self.processor = HyperliquidDataProcessor()
+        self.price_history = price_history or create_price_history(fetcher)
+        self.reporter = AustrianTaxReportGenerator(wallet_address=wallet_address,
+                                                   yearly_income=yearly_income, tax_year=tax_year)
+        self.totals = RunningTotals()
+
+    def _convert(self, df: pd.DataFrame, amount_columns: List[str]) -> pd.DataFrame:
+        """EUR conversion of one batch, oldest rows first"""
+        if df.empty:
+            return df
+        self.converter.prepare_rates([df])
+        return self.converter.add_eur_conversions(df, amount_columns)
+
+    def _batches(self, batches: Iterator[List[Dict[str, Any]]], year_start: int,
+                 year_end: int) -> Iterator[List[Dict[str, Any]]]:
+        """Raw record batches limited to the tax year"""
+        for batch in batches:
+            records = filter_time_range(batch, year_start, year_end)
+            if records:
+                yield records
+
+    def _add_trades(self, trades_df: pd.DataFrame, sinks: Dict[str, CsvSink]):
+        self.totals.add_trades(trades_df)
+        csv_data = self.reporter.prepare_csv_data(trades_df, pd.DataFrame(), pd.DataFrame())
+        sinks['trades'].append(csv_data.get('trades', pd.DataFrame()))
+        sinks['fees'].append(csv_data.get('fees', pd.DataFrame()))
+
+    def _add_funding(self, funding_df: pd.DataFrame, funding_detail_df: pd.DataFrame, sinks: Dict[str, CsvSink]):
+        self.totals.add_funding(funding_df)
+        csv_data = self.reporter.prepare_csv_data(pd.DataFrame(), funding_df, pd.DataFrame(), funding_detail_df)
+        sinks['funding'].append(csv_data.get('funding', pd.DataFrame()))
+        sinks['funding_detail'].append(csv_data.get('funding_detail', pd.DataFrame()))
+
+    def _funding_batches(self, batches: Iterator[List[Dict[str, Any]]]) -> Iterator[Tuple[pd.DataFrame, pd.DataFrame]]:
+        """
+        (funding frame, detail frame) per batch, oldest rows first
+        With day buckets the payments of a batch's last day are held back for the next
+        batch, so no bucket is split across batches
+        """
+        held = pd.DataFrame()
+        for batch in batches:
+            funding_df = self.processor.process_funding(batch).iloc[::-1]
+            if not self.processor.funding_buckets:
+                yield funding_df, pd.DataFrame()
+                continue
+            if not held.empty:
+                funding_df = pd.concat([held, funding_df], ignore_index=True)
+            days = funding_df['time_ms'].to_numpy() // DAY_MS
+            complete = days < days[-1]
+            held = funding_df[~complete]
+            if complete.any():
+                yield self._funding_buckets(funding_df[complete])
+        if not held.empty:
+            yield self._funding_buckets(held)
+
+    def _funding_buckets(self, funding_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        detail_df = funding_df if self.processor.exports_funding_detail() else pd.DataFrame()
+        return self.processor.aggregate_funding(funding_df).iloc[::-1], detail_df
+
+    def _add_transfers(self, transfers_df: pd.DataFrame, sinks: Dict[str, CsvSink]):
+        self.totals.add_transfers(transfers_df)
+        csv_data = self.reporter.prepare_csv_data(pd.DataFrame(), pd.DataFrame(), transfers_df)
+        sinks['deposits_withdrawals'].append(csv_data.get('deposits_withdrawals', pd.DataFrame()))
+
+    def _manual_entries(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Manual CSV entries of the tax year"""
+        return filter_frame_time_range(df, *tax_year_bounds(self.tax_year))
+
+    @staticmethod
+    def _with_manual_entries(frames: Iterator[pd.DataFrame], manual_df: pd.DataFrame) -> Iterator[pd.DataFrame]:
+        """
+        Sort manual entries into chronological batches, in the order of the in-memory merge
+        Entries at a batch's last millisecond wait for the next batch, so they follow
+        every fetched row of that millisecond
+        """
+        pending = manual_df.sort_values('time_ms', kind='stable') if not manual_df.empty else manual_df
+        for df in frames:
+            if not pending.empty:
+                cut = int(np.searchsorted(pending['time_ms'].to_numpy(), df['time_ms'].iloc[-1], side='left'))
+                if cut:
+                    df = pd.concat([df, pending.iloc[:cut]], ignore_index=True).sort_values('time_ms', kind='stable')
+                    pending = pending.iloc[cut:]
+            yield df
+        if not pending.empty:
+            yield pending
+
+    def _year_trades(self, year_start: int, year_end: int) -> Iterator[pd.DataFrame]:
+        """Fee-valued fills of the tax year per batch; every fetched fill carries the positions"""
+        # Fills reach lookback_ms before the tax year; those only carry positions into it
+        for batch in self.fetcher.iter_user_fills(self.batch_size):
+            history_df = self.processor.process_trades(batch).iloc[::-1]
+            self.totals.track_positions(history_df)
+            trades_df = year_slice(history_df, year_start, year_end)
+            if not trades_df.empty:
+                yield self.price_history.value_fees(trades_df)
+
+    def run(self) -> str:
+        """Run the pipeline and return the path of the generated ZIP package"""
+        year_start, year_end = tax_year_bounds(self.tax_year)
+        self.fetcher.set_time_range(year_start, year_end, fills_lookback_ms=self.lookback_ms)
+        fetch_start, fetch_end = self.fetcher.get_history_range()
+
+        print("═" * 80)
+        print(f"🌊 STREAMING-MODUS: Steuerjahr {self.tax_year}, Batches à {self.batch_size} Einträge")
+        print("═" * 80)
+
+        main_folder, folders, vienna_time = self.reporter.create_package_folders(self.output_dir)
+        sinks = {name: CsvSink(self.reporter.csv_path(folders, name))
+                 for name in ('trades', 'fees', 'funding', 'funding_detail', 'deposits_withdrawals')}
+
+        if not os.path.exists(self.manual_handler.manual_input_folder):
+            self.manual_handler.generate_template_csvs()
+            self.manual_handler.print_instructions()
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            # Small, independent requests run while the histories stream in
+            ecb_future = executor.submit(
+                self.converter.rates_fetcher.ensure_range_available,
+                datetime.fromtimestamp(fetch_start / 1000, tz=timezone.utc).strftime('%Y-%m-%d'),
+                datetime.fromtimestamp(fetch_end / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+            )
+            account_future = executor.submit(self.fetcher.get_account_state)
+
+            # Manual entries are sorted into the batches, so the CSVs stay chronological
+            manual_trades_df = self._manual_entries(self.manual_handler.read_manual_trades())
+            for trades_df in self._with_manual_entries(self._year_trades(year_start, year_end), manual_trades_df):
+                self._add_trades(self._convert(trades_df, ['fee', 'closed_pnl']), sinks)
+            if not manual_trades_df.empty:
+                print(f"✅ {len(manual_trades_df)} manuelle Trade(s) hinzugefügt")
+
+            for funding_df, funding_detail_df in self._funding_batches(
+                    self._batches(self.fetcher.iter_user_funding(self.batch_size), year_start, year_end)):
+                self._add_funding(self._convert(funding_df, ['funding_payment']),
+                                  self._convert(funding_detail_df, ['funding_payment']), sinks)
+
+            manual_deposits_df = self._manual_entries(self.manual_handler.read_manual_deposits())
+            transfer_batches = (self.processor.process_transfers(batch).iloc[::-1] for batch in
+                                self._batches(self.fetcher.iter_user_transfers(self.batch_size), year_start, year_end))
+            for transfers_df in self._with_manual_entries(transfer_batches, manual_deposits_df):
+                self._add_transfers(self._convert(transfers_df, ['amount']), sinks)
+            if not manual_deposits_df.empty:
+                print(f"✅ {len(manual_deposits_df)} manuelle Einzahlung(en) hinzugefügt")
+
+            # The first EUR conversion already waited on the rate table lock held by the prefetch
+            ecb_future.result()
+            account_data = account_future.result()
+            account_state = self.processor.process_account_state(account_data) if account_data else {}
+
+        year_end_marks = value_year_end_positions(self.totals.positions, self.tax_year,
+                                                  self.price_history, self.converter)
+        if not year_end_marks.empty:
+            account_state['year_end_positions'] = year_end_marks.to_dict('records')
+
+        self.fetcher.print_failed_windows()
+        self.totals.print_summary(f"STREAMING-ERGEBNIS {self.tax_year}")
+
+        tax_summary = self.totals.tax_summary(self.reporter)
+        print_cli_tax_summary(tax_summary, self.tax_year)
+        print_year_end_positions(year_end_marks, self.tax_year)
+
+        summary_csv = self.totals.summary_csv(self.reporter, tax_summary)
+        summary_file = self.reporter.csv_path(folders, 'summary')
+        summary_csv.to_csv(summary_file, index=False, encoding='utf-8')
+
+        plausibility = self.totals.plausibility(self.reporter)
+
+        # PDF excerpts in the same order as the in-memory pipeline
+        csv_data = {name: sink.sample for name, sink in sinks.items() if sink.rows and name != 'funding_detail'}
+        csv_data['summary'] = summary_csv
+        csv_files = [summary_file] + [sink.path for sink in sinks.values() if sink.rows]
+        for sink in sinks.values():
+            if sink.rows:
+                print(f"💾 {sink.rows} Zeilen: {sink.path}")
+
+        zip_filename = self.reporter.finalize_package(main_folder, folders, vienna_time, csv_data, csv_files,
+                                                      tax_summary, plausibility, account_state)
+        print(f"\n✅ Austrian tax report generated successfully!")
+        print(f"📦 Complete report package: {zip_filename}")
+        return zip_filename
+
+def run_wallet_report_streaming(wallet_address: str, tax_year: int, yearly_income: float,
+                                fetcher: HyperliquidFetcher, converter: CurrencyConverter,
+                                manual_handler: ManualInputHandler, output_dir: str = ".",
+                                batch_size: int = STREAM_BATCH_SIZE,
+                                lookback_ms: int = COST_BASIS_LOOKBACK_MS,
+                                price_history: Optional[PriceHistory] = None) -> str:
+    """Streaming counterpart of run_wallet_report with the same arguments and result"""
+    pipeline = StreamingReportPipeline(wallet_address, tax_year, yearly_income, fetcher, converter,
+                                       manual_handler, output_dir=output_dir, batch_size=batch_size,
+                                       lookback_ms=lookback_ms, price_history=price_history)
+    return pipeline.run()
+
+def streaming_enabled() -> bool:
+    """True if HL_STREAMING is set to a truthy value"""
+    return env_enabled(STREAMING_ENV)
@@ -0,0 +1,71 @@
+"""
+Tests for the request scope of the report pipelines
+Only the fills crawl may reach back before the tax year (cost basis lookback); funding,
+ledger and the ECB prefetch must stay inside tax_year_bounds
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from currency_converter import CurrencyConverter, ECBRatesFetcher
+from hyperliquid_fetcher import (COST_BASIS_LOOKBACK_MS, HyperliquidFetcher, run_wallet_report,
+                                 tax_year_bounds)
+from manual_input_handler import ManualInputHandler
+from streaming_pipeline import run_wallet_report_streaming
+
+TAX_YEAR = 2024
+WALLET = "0x00000000000000000000000000000000000000bb"
+
+def recording_fetcher(requests_made: list) -> HyperliquidFetcher:
+    """Fetcher whose info API answers every request with no data"""
+    fetcher = HyperliquidFetcher(WALLET)
+
+    def make_request(payload):
+        requests_made.append(payload)
+        return [] if 'startTime' in payload else None
+
+    fetcher._make_request = make_request
+    return fetcher
+
+def recording_converter(ecb_ranges: list) -> CurrencyConverter:
+    """Converter with a prefilled rate table that records the prefetched date ranges"""
+    rates_fetcher = ECBRatesFetcher()
+    first_day = datetime(TAX_YEAR - 3, 1, 1)
+    rates_fetcher.rates_cache = {(first_day + timedelta(days=i)).strftime('%Y-%m-%d'): 0.9 for i in range(5 * 366)}
+    rates_fetcher._cache_loaded = True
+    ensure_range_available = rates_fetcher.ensure_range_available
+
+    def record(start_date, end_date):
+        ecb_ranges.append((start_date, end_date))
+        ensure_range_available(start_date, end_date)
+
+    rates_fetcher.ensure_range_available = record
+    return CurrencyConverter(rates_fetcher)
+
+@pytest.mark.parametrize('report_fn', [run_wallet_report, run_wallet_report_streaming])
+def test_only_fills_reach_before_the_tax_year(report_fn, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    requests_made, ecb_ranges = [], []
+    fetcher = recording_fetcher(requests_made)
+    converter = recording_converter(ecb_ranges)
+    manual_handler = ManualInputHandler(str(tmp_path / 'manual_input'), rates_fetcher=converter.rates_fetcher)
+
+    report_fn(WALLET, TAX_YEAR, 0.0, fetcher, converter, manual_handler, output_dir=str(tmp_path))
+
+    year_start, year_end = tax_year_bounds(TAX_YEAR)
+    windows = {}
+    for payload in requests_made:
+        if 'startTime' in payload:
+            windows.setdefault(payload['type'], []).append((payload['startTime'], payload['endTime']))
+
+    assert set(windows) == {'userFillsByTime', 'userFunding', 'userNonFundingLedgerUpdates'}
+    for request_type in ('userFunding', 'userNonFundingLedgerUpdates'):
+        assert min(start for start, _ in windows[request_type]) == year_start
+        assert max(end for _, end in windows[request_type]) == year_end
+    assert min(start for start, _ in windows['userFillsByTime']) == year_start - COST_BASIS_LOOKBACK_MS
+    assert max(end for _, end in windows['userFillsByTime']) == year_end
+
+    first_day = datetime.fromtimestamp(year_start / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    last_day = datetime.fromtimestamp(year_end / 1000, tz=timezone.utc).strftime('%Y-%m-%d')
+    assert ecb_ranges == [(first_day, last_day)]
@@ -0,0 +1,187 @@
+"""
+Tests for the Live Monitor
+A local websocket server stands in for the Hyperliquid feed and a local HTTP server
+for the info API, so subscribe, backfill-on-reconnect, message handling and ping
+run end to end without network access
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+ws_server = pytest.importorskip("websockets.sync.server")
+
+import live_monitor
+from currency_converter import CurrencyConverter, ECBRatesFetcher
+from event_store import EventStore
+from hyperliquid_fetcher import HyperliquidFetcher
+
+WALLET = "0x00000000000000000000000000000000000000aa"
+
+# Info API request type -> endpoint of the exchange state it serves
+INFO_ENDPOINTS = {
+    'userFillsByTime': 'fills',
+    'userFunding': 'funding',
+    'userNonFundingLedgerUpdates': 'ledger',
+}
+
+def make_fill(tid: int, time_ms: int) -> dict:
+    return {'time': time_ms, 'coin': 'BTC', 'side': 'B', 'sz': '0.1', 'px': '50000.0',
+            'dir': 'Open Long', 'closedPnl': '0.0', 'fee': '1.5', 'feeToken': 'USDC',
+            'startPosition': '0.0', 'hash': f'0x{tid:x}', 'oid': tid, 'crossed': True, 'tid': tid}
+
+def make_funding(time_ms: int) -> dict:
+    return {'time': time_ms, 'coin': 'BTC', 'usdc': '-0.25', 'szi': '0.1', 'fundingRate': '0.0000125'}
+
+class FakeExchange:
+    """Events the exchange knows about, served by the info API and the websocket feed"""
+
+    def __init__(self):
+        self.events = {'fills': [], 'funding': [], 'ledger': []}
+        self.info_requests = []
+        self.subscriptions = []
+        self.pings = 0
+        self.lock = threading.Lock()
+
+    def info(self, payload: dict):
+        with self.lock:
+            self.info_requests.append(payload)
+            endpoint = INFO_ENDPOINTS.get(payload.get('type'))
+            if endpoint is None:
+                return {'tokens': [], 'universe': []} if payload.get('type') == 'spotMeta' else []
+            return [event for event in self.events[endpoint]
+                    if payload['startTime'] <= event['time'] <= payload.get('endTime', event['time'])]
+
+    def execute_fill(self, fill: dict):
+        with self.lock:
+            self.events['fills'].append(fill)
+
+    def execute_funding(self, fund: dict):
+        with self.lock:
+            self.events['funding'].append(live_monitor.LiveMonitor.funding_record(fund))
+
+def start_info_server(exchange: FakeExchange) -> ThreadingHTTPServer:
+    class InfoHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            body = json.dumps(exchange.info(payload)).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), InfoHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+def feed_handler(exchange: FakeExchange, connections: list, done: threading.Event):
+    """
+    First connection: fill A and a funding payment after the backfill, wait for a ping, drop
+    Second connection: fill B was executed while disconnected; the snapshot repeats A and the funding
+    """
+    def handler(ws):
+        connections.append(ws)
+        subscribed = [json.loads(ws.recv(timeout=10)) for _ in live_monitor.SUBSCRIPTIONS]
+        with exchange.lock:
+            exchange.subscriptions.append(subscribed)
+
+        if len(connections) == 1:
+            fill_a, funding = make_fill(1, now_ms()), make_funding(now_ms())
+            exchange.execute_fill(fill_a)
+            exchange.execute_funding(funding)
+            ws.send(json.dumps({'channel': 'userFills',
+                                'data': {'isSnapshot': True, 'user': WALLET, 'fills': [fill_a]}}))
+            ws.send(json.dumps({'channel': 'userFundings',
+                                'data': {'isSnapshot': True, 'user': WALLET, 'fundings': [funding]}}))
+            # The monitor pings once the feed stays silent
+            message = json.loads(ws.recv(timeout=10))
+            assert message == {'method': 'ping'}
+            with exchange.lock:
+                exchange.pings += 1
+            ws.send(json.dumps({'channel': 'pong'}))
+            exchange.execute_fill(make_fill(2, now_ms()))
+            # The reconnect backfill must reach past fill B
+            time.sleep(0.01)
+            return
+
+        fill_a, fill_b = exchange.events['fills']
+        funding = {'time': exchange.events['funding'][0]['time'], **exchange.events['funding'][0]['delta']}
+
+        ws.send(json.dumps({'channel': 'userFills',
+                            'data': {'isSnapshot': True, 'user': WALLET, 'fills': [fill_a, fill_b]}}))
+        ws.send(json.dumps({'channel': 'userFundings',
+                            'data': {'isSnapshot': True, 'user': WALLET, 'fundings': [funding]}}))
+        # A snapshot of another wallet must be ignored
+        ws.send(json.dumps({'channel': 'userFills',
+                            'data': {'isSnapshot': True, 'user': '0xother', 'fills': [make_fill(99, fill_b['time'])]}}))
+        # Messages are handled in order, so the next ping means all of the above were processed
+        assert json.loads(ws.recv(timeout=10)) == {'method': 'ping'}
+        done.set()
+        try:
+            for _ in ws:
+                pass
+        except Exception:
+            pass
+
+    return handler
+
+def test_live_monitor_stores_feed_events_exactly_once(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(live_monitor, 'PING_INTERVAL_SECONDS', 0.2)
+    monkeypatch.setattr(HyperliquidFetcher, '_backoff_seconds', staticmethod(lambda attempt: 0.05))
+
+    now = datetime.now(timezone.utc)
+    exchange = FakeExchange()
+    info_server = start_info_server(exchange)
+    connections = []
+    done = threading.Event()
+    feed = ws_server.serve(feed_handler(exchange, connections, done), '127.0.0.1', 0)
+    threading.Thread(target=feed.serve_forever, daemon=True).start()
+
+    rates_fetcher = ECBRatesFetcher()
+    rates_fetcher.rates_cache = {(now - timedelta(days=i)).strftime('%Y-%m-%d'): 0.9 for i in range(-2, 400)}
+    rates_fetcher._cache_loaded = True
+
+    fetcher = HyperliquidFetcher(WALLET, event_store=EventStore(str(tmp_path / 'events.db')))
+    fetcher.api_url = f"http://127.0.0.1:{info_server.server_address[1]}/info"
+    monitor = live_monitor.LiveMonitor(WALLET, now.year, 0.0, fetcher, CurrencyConverter(rates_fetcher),
+                                       ws_url=f"ws://127.0.0.1:{feed.socket.getsockname()[1]}")
+
+    runner = threading.Thread(target=monitor.run, daemon=True)
+    runner.start()
+    try:
+        assert done.wait(30), "monitor did not reconnect"
+    finally:
+        monitor.stop()
+        runner.join(10)
+        feed.shutdown()
+        info_server.shutdown()
+
+    assert not runner.is_alive()
+    assert len(connections) == 2
+    expected_subscription = [{'method': 'subscribe', 'subscription': {'type': subscription_type, 'user': WALLET}}
+                             for subscription_type in live_monitor.SUBSCRIPTIONS]
+    assert exchange.subscriptions == [expected_subscription, expected_subscription]
+    assert exchange.pings == 1
+
+    # The reconnect backfill fetched fill A again through the info API, next to the missed fill B
+    fills_requests = [request for request in exchange.info_requests if request['type'] == 'userFillsByTime']
+    assert any(request['startTime'] <= exchange.events['fills'][0]['time'] for request in fills_requests[1:])
+
+    store = fetcher.event_store
+    assert [fill['tid'] for fill in store.load_events(WALLET, 'fills')] == [1, 2]
+    assert store.load_events(WALLET, 'funding') == exchange.events['funding']
+    assert monitor.totals.report.trade_count == 2
+    assert monitor.totals.report.funding_count == 1
+    assert monitor.totals.report.fee_usd == pytest.approx(3.0)
@@ -0,0 +1,68 @@
+"""
+Tests for the cost-basis lot engine
+Two lots are bought before the tax year and partly sold inside it, so FIFO and the
+moving average give different entry values; lots without a known acquisition count as unknown
+"""
+
+import pandas as pd
+import pytest
+
+from lot_engine import match_cost_basis
+
+YEAR_START_MS = 1_000_000
+
+def history() -> pd.DataFrame:
+    """Buy 1 @ 100 and 1 @ 200 before the year, sell 0.5 before and 0.75 inside it"""
+    return pd.DataFrame({
+        'time_ms': [100, 200, 300, YEAR_START_MS + 100],
+        'coin': ['BTC'] * 4,
+        'side': ['Buy', 'Buy', 'Sell', 'Sell'],
+        'size': [1.0, 1.0, 0.5, 0.75],
+        'start_position': [0.0, 1.0, 2.0, 1.5],
+        'price': [100.0, 200.0, 150.0, 300.0],
+        'usd_eur_rate': [0.9, 0.8, 0.5, 0.5],
+    })
+
+def test_fifo_takes_the_oldest_lot_bought_before_the_period():
+    result = match_cost_basis(history(), method='fifo', start_ms=YEAR_START_MS)
+
+    assert len(result.disposals) == 1
+    disposal = result.disposals.iloc[0]
+    # Half of the 100 lot was sold before the year; the rest and a quarter of the 200 lot now
+    assert disposal['quantity'] == pytest.approx(0.75)
+    assert disposal['entry_usd'] == pytest.approx(0.5 * 100 + 0.25 * 200)
+    assert disposal['exit_usd'] == pytest.approx(225.0)
+    assert disposal['gain_usd'] == pytest.approx(125.0)
+    assert disposal['entry_eur'] == pytest.approx(0.5 * 90 + 0.25 * 160)
+    assert disposal['gain_eur'] == pytest.approx(112.5 - 85.0)
+    assert disposal['unknown_qty'] == 0
+
+    holding = result.holdings.iloc[0]
+    assert (holding['side'], holding['quantity']) == ('LONG', pytest.approx(0.75))
+    assert holding['cost_usd'] == pytest.approx(150.0)
+    assert holding['cost_eur'] == pytest.approx(120.0)
+
+def test_average_uses_the_pool_price_of_lots_bought_before_the_period():
+    result = match_cost_basis(history(), method='average', start_ms=YEAR_START_MS)
+
+    assert len(result.disposals) == 1
+    disposal = result.disposals.iloc[0]
+    # Pool of 2 @ 150 USD / 125 EUR per unit, unchanged by the earlier partial sale
+    assert disposal['entry_usd'] == pytest.approx(0.75 * 150)
+    assert disposal['gain_usd'] == pytest.approx(225.0 - 112.5)
+    assert disposal['entry_eur'] == pytest.approx(0.75 * 125)
+    assert disposal['gain_eur'] == pytest.approx(112.5 - 93.75)
+    assert result.holdings.iloc[0]['cost_usd'] == pytest.approx(0.75 * 150)
+
+def test_position_held_before_the_first_fill_has_unknown_basis():
+    trades_df = history().iloc[2:].reset_index(drop=True)
+    result = match_cost_basis(trades_df, method='fifo')
+
+    assert result.disposals['quantity'].tolist() == pytest.approx([0.5, 0.75])
+    assert result.unknown_qty == pytest.approx(1.25)
+    assert result.disposals['entry_usd'].tolist() == [0.0, 0.0]
+    assert result.disposals['exit_usd'].tolist() == [0.0, 0.0]
+
+def test_unknown_method_is_rejected():
+    with pytest.raises(ValueError):
+        match_cost_basis(history(), method='lifo')
@@ -0,0 +1,39 @@
+"""
+Tests for the exact micro-unit money arithmetic
+"""
+
+import numpy as np
+import pandas as pd
+
+from money import MICROS, convert_micros, micros_column, money_sum, sum_micros, to_micros
+
+def test_amounts_round_to_the_nearest_micro_unit():
+    micros = to_micros([0.1 + 0.2, 0.0000004, 0.0000006, -1.2345678, np.nan])
+
+    assert micros.dtype == np.int64
+    assert micros.tolist() == [300_000, 0, 1, -1_234_568, 0]
+
+def test_conversion_rounds_once_per_row():
+    micros = convert_micros(np.array([1_000_000, 3, -3]), np.array([0.9, 0.5, 0.5]))
+
+    # Halves go to the even neighbour, so positive and negative rows round symmetrically
+    assert micros.tolist() == [900_000, 2, -2]
+
+def test_micro_unit_sums_are_exact_where_float_sums_drift():
+    amounts = [0.1] * 10
+    df = pd.DataFrame({'fee': amounts, micros_column('fee'): to_micros(amounts)})
+
+    assert sum(amounts) != 1.0
+    assert sum_micros(df, 'fee') == MICROS
+    assert money_sum(df, 'fee') == 1.0
+
+def test_signed_sums_and_float_fallback():
+    amounts = [2.5, -1.25, 0.75]
+    exact = pd.DataFrame({'funding': amounts, micros_column('funding'): to_micros(amounts)})
+    plain = pd.DataFrame({'funding': amounts})
+
+    assert sum_micros(exact, 'funding', sign=1) == 3_250_000
+    assert sum_micros(exact, 'funding', sign=-1) == -1_250_000
+    assert sum_micros(plain, 'funding') is None
+    assert money_sum(plain, 'funding', sign=-1) == -1.25
+    assert money_sum(pd.DataFrame(), 'funding') == 0.0
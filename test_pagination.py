@@ -0,0 +1,47 @@
+"""
+Tests for the page cap handling of the time-based info API requests
+The fake endpoint answers like Hyperliquid: the oldest page_limit records of the window
+"""
+
+from hyperliquid_fetcher import HyperliquidFetcher
+
+WALLET = "0x00000000000000000000000000000000000000cc"
+PAGE_LIMIT = 3
+
+def make_records(times: list) -> list:
+    return [{'time': time_ms, 'tid': tid} for tid, time_ms in enumerate(times)]
+
+def paged_endpoint(records: list, requests_made: list):
+    def fetch(start_time: int, end_time: int) -> list:
+        requests_made.append((start_time, end_time))
+        in_window = [record for record in records if start_time <= record['time'] <= end_time]
+        return sorted(in_window, key=lambda record: (record['time'], record['tid']))[:PAGE_LIMIT]
+    return fetch
+
+def fetch_window(records: list, start_time: int, end_time: int):
+    fetcher = HyperliquidFetcher(WALLET)
+    requests_made = []
+    fetched = fetcher._fetch_window_complete(paged_endpoint(records, requests_made), start_time, end_time,
+                                             PAGE_LIMIT, 'userFillsByTime')
+    return fetcher, {record['tid'] for record in fetched}, requests_made
+
+def test_full_pages_are_continued_from_the_last_record_time():
+    records = make_records([100, 100, 200, 200, 300, 300, 400, 500])
+    fetcher, tids, _ = fetch_window(records, 0, 10_000_000)
+
+    assert tids == {record['tid'] for record in records}
+    assert fetcher.get_failed_windows() == []
+
+def test_millisecond_with_more_than_a_page_is_reported_as_failed():
+    records = make_records([100, 100] + [200] * (PAGE_LIMIT + 2) + [300, 300])
+    fetcher, tids, requests_made = fetch_window(records, 0, 10_000_000)
+
+    # Everything around the crowded millisecond is fetched, its first page included
+    assert {record['tid'] for record in records if record['time'] != 200} <= tids
+    assert len([tid for tid in tids if records[tid]['time'] == 200]) == PAGE_LIMIT
+    assert (200, 10_000_000) in requests_made and (201, 10_000_000) in requests_made
+
+    # The rest of that millisecond can't be requested, so the gap must be visible
+    assert fetcher.get_failed_windows() == [{'endpoint': 'userFillsByTime', 'start_time': 200, 'end_time': 200,
+                                             'reason': f"{PAGE_LIMIT} or more records in one millisecond"}]
+    assert fetcher.get_failed_windows('userFillsByTime')
@@ -0,0 +1,69 @@
+"""
+Tests for the position replay and the funding attribution
+"""
+
+import pandas as pd
+import pytest
+
+from hyperliquid_fetcher import HyperliquidDataProcessor
+from position_engine import attribute_funding, build_position_timeline
+
+def make_fill(tid: int, time_ms: int, side: str, size: float, start: float, px: float = 100.0,
+              closed_pnl: float = 0.0, coin: str = 'BTC') -> dict:
+    return {'time': time_ms, 'coin': coin, 'side': side, 'sz': str(size), 'px': str(px), 'dir': 'Trade',
+            'closedPnl': str(closed_pnl), 'fee': '0.1', 'feeToken': 'USDC', 'startPosition': str(start),
+            'hash': f'0x{tid:x}', 'oid': tid, 'crossed': True, 'tid': tid}
+
+def make_funding(time_ms: int, usdc: float, szi: float, coin: str = 'BTC') -> dict:
+    return {'time': time_ms, 'hash': '0x0',
+            'delta': {'type': 'funding', 'coin': coin, 'usdc': str(usdc), 'szi': str(szi), 'fundingRate': '0.0001'}}
+
+def trades(fills: list) -> pd.DataFrame:
+    return HyperliquidDataProcessor.process_trades(fills)
+
+def test_replay_splits_a_flip_into_two_positions():
+    timeline = build_position_timeline(trades([
+        make_fill(1, 1000, 'B', 1.0, 0.0, px=100.0),
+        make_fill(2, 2000, 'B', 0.5, 1.0, px=130.0),
+        make_fill(3, 3000, 'A', 2.5, 1.5, px=150.0, closed_pnl=40.0),
+    ]))
+
+    assert timeline.complete
+    assert timeline.fills['position_after'].tolist() == pytest.approx([1.0, 1.5, -1.0])
+    positions = timeline.positions
+    assert positions['side'].tolist() == ['LONG', 'SHORT']
+    assert positions['status'].tolist() == ['closed', 'open']
+    assert positions['close_time_ms'].iloc[0] == 3000
+    assert positions['max_size'].tolist() == pytest.approx([1.5, 1.0])
+    assert positions['avg_entry_px'].tolist() == pytest.approx([110.0, 150.0])
+    # The flip fill realizes the PnL of the long it closes
+    assert positions['realized_pnl'].tolist() == pytest.approx([40.0, 0.0])
+
+def test_start_position_mismatch_is_reported_as_gap():
+    timeline = build_position_timeline(trades([
+        make_fill(1, 1000, 'B', 1.0, 0.0),
+        make_fill(2, 3000, 'A', 2.0, 2.0),
+    ]))
+
+    assert not timeline.complete
+    gap = timeline.gaps.iloc[0]
+    assert (gap['time_ms'], gap['expected_start'], gap['reported_start']) == (3000, 1.0, 2.0)
+    assert gap['missing_size'] == pytest.approx(1.0)
+
+def test_funding_is_charged_to_the_position_open_at_payment_time():
+    timeline = build_position_timeline(trades([
+        make_fill(1, 1000, 'B', 1.0, 0.0),
+        make_fill(2, 5000, 'A', 1.0, 1.0),
+        make_fill(3, 7000, 'A', 1.0, 0.0),
+    ]))
+    funding_df = HyperliquidDataProcessor.process_funding([
+        make_funding(2000, -0.5, 1.0), make_funding(4000, -0.25, 1.0),
+        make_funding(6000, 0.1, 0.0), make_funding(8000, 0.3, -1.0),
+    ])
+
+    carry = attribute_funding(timeline, funding_df)
+
+    assert carry.positions['funding_usd'].tolist() == pytest.approx([-0.75, 0.3])
+    # Paid while flat, so no position carries it
+    assert carry.unattributed['funding_payment'].tolist() == pytest.approx([0.1])
+    assert not carry.funding['side_mismatch'].any()
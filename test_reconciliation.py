@@ -0,0 +1,48 @@
+"""
+Tests for the ledger reconciliation
+A consistent wallet passes; a funding payment on the wrong side and an account value
+the events can't explain are narrowed down to time ranges
+"""
+
+import pytest
+
+from hyperliquid_fetcher import HyperliquidDataProcessor
+from reconciliation import reconcile_ledger
+
+def make_fill(tid: int, time_ms: int, side: str, size: float, start: float, closed_pnl: float = 0.0) -> dict:
+    return {'time': time_ms, 'coin': 'BTC', 'side': side, 'sz': str(size), 'px': '100.0', 'dir': 'Trade',
+            'closedPnl': str(closed_pnl), 'fee': '1.0', 'feeToken': 'USDC', 'startPosition': str(start),
+            'hash': f'0x{tid:x}', 'oid': tid, 'crossed': True, 'tid': tid}
+
+def make_funding(time_ms: int, usdc: float, szi: float) -> dict:
+    return {'time': time_ms, 'hash': '0x0',
+            'delta': {'type': 'funding', 'coin': 'BTC', 'usdc': str(usdc), 'szi': str(szi), 'fundingRate': '0.0001'}}
+
+def reconcile(funding_szi: float, account_value: float):
+    p = HyperliquidDataProcessor
+    trades_df = p.process_trades([make_fill(1, 2000, 'B', 1.0, 0.0), make_fill(2, 4000, 'A', 1.0, 1.0, 10.0)])
+    funding_df = p.process_funding([make_funding(3000, -2.0, funding_szi)])
+    transfers_df = p.process_transfers([{'time': 1000, 'hash': '0xd', 'delta': {'type': 'deposit', 'usdc': '100'}}])
+    account_state = {'time_ms': 5000, 'account_value': account_value, 'positions': []}
+    return reconcile_ledger(trades_df, funding_df, transfers_df, account_state, range_end_ms=10_000,
+                            full_history=True)
+
+def test_consistent_wallet_has_no_ranges():
+    # 100 deposit - 2 fees - 2 funding + 10 realized
+    reconciliation = reconcile(funding_szi=1.0, account_value=106.0)
+
+    assert reconciliation.timeline['balance_usd'].tolist() == pytest.approx([100.0, 99.0, 97.0, 106.0])
+    assert reconciliation.opening_balance == pytest.approx(0.0)
+    assert reconciliation.consistent
+    assert reconciliation.checks()['reconciliation_consistent']
+
+def test_mismatches_are_reported_as_ranges():
+    # Funding reports a short while the fills hold a long; 150 more cash than the events explain
+    reconciliation = reconcile(funding_szi=-1.0, account_value=256.0)
+
+    assert not reconciliation.consistent
+    position = reconciliation.ranges[reconciliation.ranges['kind'] == 'position'].iloc[0]
+    assert (position['coin'], position['start_ms'], position['end_ms']) == ('BTC', 3000, 3000)
+    assert position['difference'] == pytest.approx(-2.0)
+    assert reconciliation.gap == pytest.approx(150.0)
+    assert reconciliation.checks()['reconciliation_gap'] == pytest.approx(150.0)
@@ -0,0 +1,104 @@
+"""
+Tests that the in-memory and the streaming pipeline write the same report CSVs
+Both are chronological, with manual entries sorted in after the fetched rows of the
+same millisecond, however the streamed batches happen to be cut
+"""
+
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+
+from currency_converter import CurrencyConverter, ECBRatesFetcher
+from hyperliquid_fetcher import DAY_MS, HyperliquidFetcher, run_wallet_report, tax_year_bounds
+from manual_input_handler import ManualInputHandler
+from streaming_pipeline import run_wallet_report_streaming
+
+TAX_YEAR = 2025
+WALLET = "0x00000000000000000000000000000000000000dd"
+HOUR_MS = DAY_MS // 24
+
+MANUAL_TRADES = """date,coin,side,size,price,currency,leverage,fee,pnl,description,enabled
+2025-03-01,BTC,buy,0.5,50000,USD,1,2.0,120.5,otc,1
+2025-07-15,ETH,sell,1.0,3000,EUR,1,1.0,-40.0,otc,1
+"""
+MANUAL_DEPOSITS = """date,amount,currency,type,description,enabled
+2025-02-01,1000.0,EUR,deposit,bank,1
+2025-12-31,500.0,USD,withdrawal,bank,1
+"""
+
+def exchange_events(year_start: int, year_end: int, manual_times: list) -> dict:
+    """Fills, hourly funding of two coins and deposits, partly sharing a millisecond with manual entries"""
+    fill_times = sorted([year_start - 30 * DAY_MS + i * 29 * HOUR_MS for i in range(360)] + manual_times * 2)
+    fills, position = [], {'BTC': 0.0, 'ETH': 0.0}
+    for tid, time_ms in enumerate(fill_times):
+        coin, side = ('BTC', 'B') if tid % 3 else ('ETH', 'A')
+        size = 0.1 + (tid % 4) / 10
+        fills.append({'time': time_ms, 'coin': coin, 'side': side, 'sz': str(size), 'px': str(1000 + tid),
+                      'dir': 'Open Long', 'closedPnl': str((tid % 7) - 3), 'fee': '0.5', 'feeToken': 'USDC',
+                      'startPosition': str(round(position[coin], 10)), 'hash': f'0x{tid:x}', 'oid': tid,
+                      'crossed': True, 'tid': tid})
+        position[coin] += size if side == 'B' else -size
+
+    funding = [{'time': year_start + hour * HOUR_MS, 'hash': '0x0',
+                'delta': {'type': 'funding', 'coin': coin, 'usdc': str((hour % 5) - 2.5),
+                          'szi': '1.0', 'fundingRate': '0.0000125'}}
+               for hour in range(0, 24 * 12) for coin in ('BTC', 'ETH')]
+    ledger = [{'time': time_ms, 'hash': f'0xd{i}', 'delta': {'type': 'deposit', 'usdc': str(100 + i)}}
+              for i, time_ms in enumerate(sorted([year_start + day * DAY_MS for day in range(0, 360, 9)]
+                                                 + manual_times))]
+    return {'userFillsByTime': fills, 'userFunding': funding, 'userNonFundingLedgerUpdates': ledger}
+
+def fake_fetcher(events: dict) -> HyperliquidFetcher:
+    """Fetcher whose info API serves the given events and nothing else"""
+    fetcher = HyperliquidFetcher(WALLET)
+
+    def make_request(payload):
+        if 'startTime' not in payload:
+            return None
+        return [event for event in events[payload['type']]
+                if payload['startTime'] <= event['time'] <= payload['endTime']]
+
+    fetcher._make_request = make_request
+    return fetcher
+
+def converter() -> CurrencyConverter:
+    rates_fetcher = ECBRatesFetcher()
+    first_day = datetime(TAX_YEAR - 2, 1, 1)
+    rates_fetcher.rates_cache = {(first_day + timedelta(days=i)).strftime('%Y-%m-%d'): 0.9 + (i % 10) / 100
+                                 for i in range(4 * 366)}
+    rates_fetcher._cache_loaded = True
+    return CurrencyConverter(rates_fetcher)
+
+def report_csvs(zip_path: str) -> dict:
+    with zipfile.ZipFile(zip_path) as package:
+        return {name.split('/')[-1]: package.read(name) for name in package.namelist() if name.endswith('.csv')}
+
+@pytest.mark.parametrize('funding_buckets', [False, True])
+def test_streaming_csvs_match_in_memory_csvs(funding_buckets, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('HL_FUNDING_BUCKETS', '1' if funding_buckets else '0')
+    monkeypatch.setenv('HL_FUNDING_DETAIL', '1' if funding_buckets else '0')
+    manual_folder = tmp_path / 'manual_input'
+    manual_folder.mkdir()
+    (manual_folder / 'manual_trades.csv').write_text(MANUAL_TRADES)
+    (manual_folder / 'manual_deposits.csv').write_text(MANUAL_DEPOSITS)
+
+    manual_handler = ManualInputHandler(str(manual_folder), rates_fetcher=converter().rates_fetcher)
+    manual_times = sorted(set(manual_handler.read_manual_trades()['time_ms'].tolist()
+                              + manual_handler.read_manual_deposits()['time_ms'].tolist()))
+    events = exchange_events(*tax_year_bounds(TAX_YEAR), manual_times)
+
+    outputs = {}
+    for name, report_fn, kwargs in (('memory', run_wallet_report, {}),
+                                    ('streaming', run_wallet_report_streaming, {'batch_size': 7})):
+        output_dir = tmp_path / name
+        output_dir.mkdir()
+        currency_converter = converter()
+        handler = ManualInputHandler(str(manual_folder), rates_fetcher=currency_converter.rates_fetcher)
+        outputs[name] = report_csvs(report_fn(WALLET, TAX_YEAR, 0.0, fake_fetcher(events), currency_converter,
+                                              handler, output_dir=str(output_dir), **kwargs))
+
+    assert {'trades.csv', 'fees.csv', 'funding.csv', 'deposits_withdrawals.csv'} <= set(outputs['memory'])
+    assert ('funding_detail.csv' in outputs['memory']) == funding_buckets
+    assert outputs['streaming'] == outputs['memory']